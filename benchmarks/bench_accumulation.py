@@ -0,0 +1,103 @@
+"""
+Benchmark: chuva acumulada (1h/3h/24h) do Mendanha, um frame a cada 5 min.
+
+Antes: não havia acumulado; calcular exigiria decodificar todos os frames
+da janela a cada sync (288 PNGs para 24 h).
+Depois: update_accumulation soma só os frames novos do histórico e subtrai
+os que saíram de cada janela (somas inteiras, sem erro acumulado).
+
+Compara 24 syncs com 1 frame novo cada contra o recálculo completo a
+partir do histórico. A igualdade das somas incrementais com o recálculo é
+coberta em tests/test_accumulation.py.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image
+
+from common import load_server
+from synthetic import write_mendanha_sequence
+
+DISTINCT = 24
+STEP = 300
+
+
+def brute_force(server, state):
+    """Recalcula cada janela do zero a partir do histórico"""
+    frames = server.read_history('mendanha', state['times'][0], state['times'][-1], payloads=True)
+    times = [float(record['time']) for record, _ in frames]
+    sums = {}
+    for window, seconds in server.ACCUM_WINDOWS.items():
+        total = np.zeros(state['sums'][window].shape, dtype=np.int64)
+        for (record, payload), timestamp, step in zip(frames, times, state['steps']):
+            if timestamp > times[-1] - seconds:
+                total += server.frame_rainfall(server.history_raster(record, payload), step)
+        sums[window] = total
+    return sums
+
+
+def main():
+    server = load_server()
+    source_dir = os.path.join(server.CACHE_DIR, 'fonte')
+    names = write_mendanha_sequence(source_dir, count=DISTINCT)
+    paths = [os.path.join(source_dir, name) for name in names]
+    classes = [server.classify_frame(Image.open(path), filtered=False)[0] for path in paths]
+
+    # 24 h de histórico já existente + 24 frames que chegam um por sync
+    now = datetime.now().replace(second=0, microsecond=0)
+    times = [(now - timedelta(seconds=STEP * i)).timestamp() for i in range(24 * 12 + DISTINCT)][::-1]
+    history, incoming = times[:-DISTINCT], times[-DISTINCT:]
+    for i, timestamp in enumerate(history):
+        server.append_history('mendanha', timestamp, classes[i % DISTINCT])
+
+    t0 = time.perf_counter()
+    added = server.update_accumulation('mendanha')
+    rebuild = time.perf_counter() - t0
+    print(f'reconstrução inicial (24 h, {added} frames): {rebuild:6.2f} s')
+
+    per_sync = []
+    for i, timestamp in enumerate(incoming):
+        server.append_history('mendanha', timestamp, classes[i % DISTINCT])
+        t0 = time.perf_counter()
+        server.update_accumulation('mendanha')
+        per_sync.append(time.perf_counter() - t0)
+    print(f'sync com 1 frame novo:  média {sum(per_sync) / len(per_sync) * 1000:6.1f} ms  '
+          f'máx {max(per_sync) * 1000:6.1f} ms  (soma + 3 janelas deslizantes + gravação)')
+
+    t0 = time.perf_counter()
+    server.update_accumulation('mendanha')
+    print(f'sync sem frames novos:  {(time.perf_counter() - t0) * 1000:6.1f} ms')
+
+    state = server.load_accumulation('mendanha')
+    t0 = time.perf_counter()
+    brute_force(server, state)
+    print(f'recálculo completo das janelas a partir do histórico: {time.perf_counter() - t0:6.2f} s '
+          f'(sem decodificar PNG; com PNG, ~30 ms por frame a mais)')
+
+    client = server.app.test_client()
+
+    def timed(url, runs=5):
+        best = float('inf')
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            response = client.get(url)
+            best = min(best, time.perf_counter() - t0)
+            assert response.status_code == 200, response.get_data()
+        return best * 1000, response
+
+    server.accum_cache.clear()
+    for query in ('window=1h', 'window=24h', 'window=24h&format=png', 'window=3h&format=png&threshold=25'):
+        t0 = time.perf_counter()
+        response = client.get(f'/api/accumulation/mendanha?{query}')
+        cold = (time.perf_counter() - t0) * 1000
+        ms, response = timed(f'/api/accumulation/mendanha?{query}')
+        print(f'/api/accumulation?{query:<36} 1ª {cold:6.1f} ms, cache {ms:5.2f} ms  '
+              f'({len(response.get_data()) / 1024:.0f} KB)')
+    stats = client.get('/api/accumulation/mendanha?window=24h').get_json()
+    print(f"  24h: {stats['frames']} frames, máx {stats['max_mm']} mm, média {stats['mean_mm']} mm na área com chuva")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: regras de alerta avaliadas no sync (Mendanha).
+
+Antes: não havia alertas; um script externo teria de baixar os frames de
+/api/frame/* a cada publicação e classificar os pixels.
+Depois: cada regra tem a área pré-computada (índices dos pixels) e é
+avaliada no raster de classes de cada frame novo do histórico; histerese
+e estado no state.db evitam alertas repetidos.
+
+Mede o custo por regra e frame e o de um sync com as regras incluídas. A
+histerese e a entrega (webhook com nova tentativa, fila local) são cobertas
+em tests/test_alerts.py.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from common import load_server
+
+SHAPE = (1024, 1024)
+
+
+def best_of(fn, runs=200):
+    best = float('inf')
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e6
+
+
+def main():
+    server = load_server()
+    rng = np.random.default_rng(3)
+    classes = rng.integers(0, 7, size=SHAPE, dtype=np.uint8)
+
+    print('custo por regra e frame (área pré-computada vs. máscara montada a cada frame)')
+    labels = server.rasterize_regions('mendanha', *SHAPE)
+    for item in ({'id': 'r', 'region': 'Tijuca', 'min_class': 4, 'min_pixels': 10},
+                 {'id': 'c10', 'circle': {'lat': -22.905, 'lng': -43.18, 'radius_km': 10}, 'min_class': 5, 'min_pixels': 20},
+                 {'id': 'c50', 'circle': {'lat': -22.905, 'lng': -43.18, 'radius_km': 50}, 'min_class': 5, 'min_pixels': 20}):
+        path = os.path.join(server.CACHE_DIR, 'regra.json')
+        with open(path, 'w') as f:
+            json.dump([item], f)
+        rule = server.load_alert_rules(path)[0]
+        size = len(server.alert_rule_pixels(rule, 'mendanha', SHAPE))
+
+        if 'region' in rule:
+            def naive():
+                return int(((labels == rule['region']) & (classes >= rule['min_class'])).sum())
+        else:
+            def naive():
+                mask = np.zeros(SHAPE, dtype=bool)
+                mask.flat[server.circle_pixels('mendanha', SHAPE, rule['circle'])] = True
+                return int((mask & (classes >= rule['min_class'])).sum())
+
+        fast = best_of(lambda: server.evaluate_alert_rule(rule, 'mendanha', classes))
+        label = 'região Tijuca' if 'region' in rule else f"raio de {rule['circle']['radius_km']:.0f} km"
+        print(f'  {label:<16} {size:6d} pixels  máscara {best_of(naive, 20):8.1f} µs  '
+              f'pré-computada {fast:6.1f} µs')
+
+    # Custo no sync com as regras incluídas e 1 frame novo
+    server.ALERT_RULES = server.load_alert_rules(server.ALERT_RULES_FILE)
+    server.ALERT_SINKS = []
+    server.append_history('mendanha', time.time() - 60, classes)
+    t0 = time.perf_counter()
+    server.evaluate_alerts('mendanha')
+    print(f"sync com 1 frame novo ({len(server.ALERT_RULES)} regras incluídas): "
+          f'{(time.perf_counter() - t0) * 1000:.1f} ms (inclui ler o frame do histórico)')
+
+    client = server.app.test_client()
+    t0 = time.perf_counter()
+    response = client.get('/api/alerts?radar=mendanha')
+    assert response.status_code == 200
+    print(f"/api/alerts: {(time.perf_counter() - t0) * 1000:.1f} ms, "
+          f"{len(response.get_json()['active'])} ativos, {len(response.get_json()['events'])} eventos")
+
+
+if __name__ == '__main__':
+    main()
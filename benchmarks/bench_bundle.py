@@ -0,0 +1,80 @@
+"""
+Benchmark: carregamento dos 20 frames do Mendanha (filtro de chuva).
+
+Antes: uma requisição por frame (/api/frame/mendanha/<f>?filter=rain), a
+cada carga da página e a cada refresh do mosaico.
+Depois: /api/frames/mendanha/bundle em uma resposta multipart, variantes
+WebP/reduzidas para celular e mosaico, e ?since=<frame> no refresh (só o
+frame novo).
+
+As partes do bundle, o WebP sem perdas, o since e o 304 são cobertos em
+tests/test_bundle.py.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+from common import load_server
+from synthetic import write_mendanha_sequence
+
+
+def timed(fn, runs=5):
+    best = float('inf')
+    result = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    server = load_server()
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=100)
+    names = write_mendanha_sequence(server.MENDANHA_DIR, count=20, start=start)
+    for name in names:
+        server.build_rain_variant(os.path.join(server.MENDANHA_DIR, name))
+    client = server.app.test_client()
+
+    def individual():
+        total = 0
+        for name in names:
+            total += len(client.get(f'/api/frame/mendanha/{name}?filter=rain').get_data())
+        return total
+
+    def bundle(query):
+        return client.get(f'/api/frames/mendanha/bundle?filter=rain{query}')
+
+    seconds, total = timed(individual)
+    print('carga da página (20 frames, filtro de chuva)')
+    print(f'  antes: 20 requisições            {total / 1024:8.0f} KB  {seconds * 1000:7.1f} ms')
+
+    seconds, response = timed(lambda: bundle(''))
+    print(f'  bundle PNG: 1 requisição         {len(response.get_data()) / 1024:8.0f} KB  {seconds * 1000:7.1f} ms')
+
+    for query, label in (('&format=webp', 'bundle WebP sem perdas'),
+                         ('&format=webp&scale=0.5', 'bundle WebP, escala 0.5'),
+                         ('&format=png&scale=0.5', 'bundle PNG, escala 0.5')):
+        t0 = time.perf_counter()
+        bundle(query)
+        cold_seconds = time.perf_counter() - t0
+        seconds, response = timed(lambda: bundle(query))
+        print(f'  {label + ":":<32} {len(response.get_data()) / 1024:8.0f} KB  {seconds * 1000:7.1f} ms '
+              f'(1ª vez {cold_seconds * 1000:.0f} ms)')
+
+    # Refresh do mosaico após um frame novo
+    new_name = write_mendanha_sequence(server.MENDANHA_DIR, count=1, seed=99,
+                                       start=start + timedelta(minutes=100))[0]
+    server.build_rain_variant(os.path.join(server.MENDANHA_DIR, new_name))
+    names = names[1:] + [new_name]
+    seconds, total = timed(individual, runs=1)
+    print('refresh após 1 frame novo')
+    print(f'  antes: 20 requisições            {total / 1024:8.0f} KB  {seconds * 1000:7.1f} ms')
+    response = bundle(f'&since={names[-2]}')
+    print(f'  bundle ?since: 1 requisição      {len(response.get_data()) / 1024:8.0f} KB')
+    response = bundle(f'&since={names[-2]}&format=webp&scale=0.5')
+    print(f'  bundle ?since WebP 0.5:          {len(response.get_data()) / 1024:8.0f} KB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark: filtro de chuva e classificação de cores por frame.
+
+Antes: filter_rain_only convertia para RGBA (cópia mesmo com paleta) e
+criava várias máscaras do tamanho da imagem; a detecção de núcleos
+decodificava o frame de novo e classificava com np.select.
+Depois: classify_frame decodifica uma vez e gera a imagem filtrada e o
+raster de classes; PNG com paleta é classificado pela paleta (256 entradas).
+
+Confere que as saídas são idênticas às antigas (pixels RGBA e classes),
+com frames RGBA e com paleta.
+"""
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from common import load_server
+from synthetic import write_mendanha_sequence
+
+
+def legacy_filter_rain_only(image_path):
+    """Reprodução do filter_rain_only antigo"""
+    img = Image.open(image_path).convert('RGBA')
+    data = np.array(img)
+    r, g, b = data[:, :, 0], data[:, :, 1], data[:, :, 2]
+    blue_mask = (b > 100) & (b > r) & (b >= g)
+    cyan_mask = (b > 150) & (g > 150) & (r < 100)
+    remove_mask = blue_mask | cyan_mask
+    data[remove_mask, 3] = 0
+    filtered_img = Image.fromarray(data, 'RGBA')
+    buffer = BytesIO()
+    filtered_img.save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+def legacy_classify_rain_pixels(data, filter_rain=True):
+    """Reprodução do classify_rain_pixels antigo (np.select)"""
+    r, g, b, a = data[:, :, 0], data[:, :, 1], data[:, :, 2], data[:, :, 3]
+    classes = np.select(
+        [
+            (g > 200) & (r < 100) & (b < 100),
+            (g > 100) & (g < 200) & (r < 100) & (b < 100),
+            (r > 200) & (g > 200) & (b < 100),
+            (r > 200) & (g > 100) & (g < 200) & (b < 100),
+            (r > 200) & (g < 100) & (b < 100),
+            (r > 200) & (b > 200) & (g < 100),
+        ],
+        [1, 2, 3, 4, 5, 6],
+        0
+    ).astype(np.uint8)
+    cyan_mask = (b > 150) & (g > 150) & (r < 100)
+    if filter_rain:
+        blue_mask = (b > 100) & (b > r) & (b >= g)
+        classes[blue_mask | cyan_mask] = 0
+    else:
+        classes[(classes == 0) & cyan_mask] = 1
+    classes[a < 100] = 0
+    return classes
+
+
+def best_of(fn, runs=10):
+    best = float('inf')
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def rgba(data):
+    return np.asarray(Image.open(BytesIO(data)).convert('RGBA'))
+
+
+def main():
+    server = load_server()
+
+    # Todas as combinações de canais nos limiares das regras, mais alpha variado
+    levels = np.array([0, 99, 100, 101, 149, 150, 151, 199, 200, 201, 255], dtype=np.uint8)
+    r, g, b, a = np.meshgrid(levels, levels, levels, np.array([0, 99, 100, 255], dtype=np.uint8))
+    grid = np.stack([r.ravel(), g.ravel(), b.ravel(), a.ravel()], axis=-1).reshape(-1, 121, 4)
+    for filter_rain in (True, False):
+        assert (server.classify_rain_pixels(grid, filter_rain) ==
+                legacy_classify_rain_pixels(grid, filter_rain)).all()
+
+    for palette in (False, True):
+        directory = os.path.join(server.CACHE_DIR, 'paleta' if palette else 'rgba')
+        names = write_mendanha_sequence(directory, count=5, palette=palette)
+        paths = [os.path.join(directory, name) for name in names]
+        label = 'PNG com paleta' if palette else 'PNG RGBA'
+
+        for path in paths:
+            legacy = legacy_filter_rain_only(path).getvalue()
+            current = server.filter_rain_only(path).getvalue()
+            assert (rgba(current) == rgba(legacy)).all()
+            source = np.asarray(Image.open(path).convert('RGBA'))
+            classes, _ = server.classify_frame(Image.open(path), filtered=False)
+            assert (classes == legacy_classify_rain_pixels(source)).all()
+
+        path = paths[-1]
+        legacy_size = len(legacy_filter_rain_only(path).getvalue())
+        current_size = len(server.filter_rain_only(path).getvalue())
+        print(f'{label} 1024x1024 ({os.path.getsize(path) / 1024:.0f} KB)')
+        print(f'  filtro de chuva   antes {best_of(lambda: legacy_filter_rain_only(path)):7.1f} ms  '
+              f'depois {best_of(lambda: server.filter_rain_only(path)):7.1f} ms  '
+              f'(variante {legacy_size / 1024:.0f} KB -> {current_size / 1024:.0f} KB)')
+
+        def legacy_classify():
+            legacy_classify_rain_pixels(np.asarray(Image.open(path).convert('RGBA')))
+
+        def current_classify():
+            server.classify_frame(Image.open(path), filtered=False)
+
+        print(f'  classificação     antes {best_of(legacy_classify):7.1f} ms  '
+              f'depois {best_of(current_classify):7.1f} ms  (com decodificação)')
+
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        def legacy_sync():
+            # Antes: variante e núcleos decodificavam o frame separadamente
+            legacy_filter_rain_only(path)
+            server.detect_nuclei(legacy_classify_rain_pixels(np.asarray(Image.open(BytesIO(content)).convert('RGBA'))))
+
+        def current_sync():
+            classes, filtered = server.classify_frame(Image.open(BytesIO(content)))
+            server.encode_rain_filtered(filtered)
+            server.detect_nuclei(classes)
+
+        print(f'  frame novo no sync antes {best_of(legacy_sync, 5):6.1f} ms  '
+              f'depois {best_of(current_sync, 5):7.1f} ms  (variante + núcleos)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: mosaico composto Mendanha + Sumaré numa grade comum.
+
+Antes: cada radar é uma pilha separada com limites diferentes; para ver os
+dois juntos o cliente baixa as duas pilhas (40 PNGs) e mistura no mapa.
+Depois: update_composite reprojeta o histórico de classes dos dois radares
+com índices pré-computados (um gather por frame de origem), combina pela
+maior classe e grava só os intervalos cujos frames de origem mudaram.
+
+Mede o remapeamento por frame de origem, a montagem inicial, o sync sem
+mudança e com frames atrasados do Mendanha, e os bytes para o cliente. A
+reprojeção conferida ponto a ponto e os intervalos refeitos são cobertos em
+tests/test_composite.py.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image
+
+from common import load_server
+from synthetic import write_mendanha_sequence, write_sumare_sequence
+
+COUNT = 20
+STEP = 5    # minutos entre frames de cada radar
+LATE = 3    # frames do Mendanha que chegam depois do Sumaré
+
+
+def best_of(fn, runs=10):
+    best = float('inf')
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    server = load_server()
+    mendanha_dir = os.path.join(server.CACHE_DIR, 'fonte-mendanha')
+    sumare_dir = os.path.join(server.CACHE_DIR, 'fonte-sumare')
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=STEP * COUNT)
+    start -= timedelta(minutes=start.minute % STEP)
+    mendanha_names = write_mendanha_sequence(mendanha_dir, count=COUNT, start=start, step_minutes=STEP)
+    sumare_names = write_sumare_sequence(sumare_dir, count=COUNT)
+    mendanha = [server.classify_frame(Image.open(os.path.join(mendanha_dir, name)), filtered=False)[0]
+                for name in mendanha_names]
+    sumare = [server.classify_frame(Image.open(os.path.join(sumare_dir, name)), filtered=False)[0]
+              for name in sumare_names]
+    mendanha_times = [(start + timedelta(minutes=STEP * i)).timestamp() for i in range(COUNT)]
+    sumare_times = [t + 120 for t in mendanha_times]  # o Sumaré publica 2 min depois
+    stacks_kb = sum(os.path.getsize(os.path.join(directory, name))
+                    for directory, names in ((mendanha_dir, mendanha_names), (sumare_dir, sumare_names))
+                    for name in names) / 1024
+
+    for i in range(COUNT):
+        server.append_history('sumare', sumare_times[i], sumare[i])
+        if i < COUNT - LATE:
+            server.append_history('mendanha', mendanha_times[i], mendanha[i])
+
+    height, width = server.composite_shape()
+    print(f'grade comum: {width}x{height} sobre {server.RADAR_BOUNDS["composite"]}')
+
+    # Custo por frame de origem: remapeamento pré-computado vs. recalculado a cada frame
+    composite = np.zeros((height, width), dtype=np.uint8)
+    for radar, classes in (('mendanha', mendanha[0]), ('sumare', sumare[0])):
+        rebuild = best_of(lambda: server.build_composite_remap(radar, *classes.shape), 3)
+        gather = best_of(lambda: server.merge_into_composite(composite, radar, classes), 20)
+        row_slice, col_slice, index, _ = server.composite_remap(radar, classes.shape)
+        print(f'  {radar:<9} {index.size / 1e6:4.2f} Mpx na grade  recalcular remapeamento {rebuild:6.1f} ms  '
+              f'gather + máximo {gather:5.2f} ms')
+    encode = best_of(lambda: server.render_classes_png(composite), 5)
+    print(f'  PNG do mosaico: {encode:.1f} ms')
+
+    t0 = time.perf_counter()
+    written = server.update_composite()
+    print(f'primeira montagem ({COUNT} intervalos, Mendanha sem os {LATE} últimos): '
+          f'{(time.perf_counter() - t0) * 1000:6.0f} ms, {written} frames')
+
+    t0 = time.perf_counter()
+    server.update_composite()
+    print(f'sync sem mudança:                                        {(time.perf_counter() - t0) * 1000:6.1f} ms')
+
+    for i in range(COUNT - LATE, COUNT):
+        server.append_history('mendanha', mendanha_times[i], mendanha[i])
+    t0 = time.perf_counter()
+    written = server.update_composite()
+    print(f'{LATE} frames atrasados do Mendanha:                        {(time.perf_counter() - t0) * 1000:6.0f} ms, '
+          f'{written} frames refeitos')
+
+    client = server.app.test_client()
+    composite_kb = 0
+    for name in client.get('/api/frames/composite').get_json()['frames']:
+        composite_kb += len(client.get(f'/api/frame/composite/{name}').get_data()) / 1024
+    print(f'cliente: 2 pilhas = {2 * COUNT} PNGs, {stacks_kb:.0f} KB (e a mistura no navegador)  vs.  '
+          f'mosaico = {COUNT} PNGs, {composite_kb:.0f} KB')
+
+
+if __name__ == '__main__':
+    main()
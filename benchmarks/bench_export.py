@@ -0,0 +1,221 @@
+"""
+Benchmark: /api/export/<radar> (GIF, WebP e APNG animados)
+
+Antes: só GIF, com os 20 frames mais ANTIGOS das 24 h (entries[:20]), todos
+os frames abertos no worker e o GIF montado em memória.
+Depois: os mais recentes por padrão, janela ?from=&to=&step=, escala,
+horário sobreposto; frames codificados num pool de processos e a animação
+gravada bloco a bloco no arquivo.
+
+Mede a build fria, em cache, após um sync e coalescida (GIF do Sumaré);
+tamanho e tempo de cada formato; a janela de 6 h; o pool vs. codificar no
+worker; o pico de memória vs. montar tudo em memória; e, no gunicorn com
+gevent, a latência da API durante uma exportação fria. Frames e pixels de
+cada formato, a janela padrão e from/to/step são cobertos em
+tests/test_export.py.
+"""
+import os
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image, ImageSequence
+
+from common import clear_directory, free_port, load_server, percentile, start_gunicorn
+from synthetic import write_mendanha_sequence, write_sumare_sequence
+
+WINDOW_FRAMES = 72
+
+
+def count_exports(directory, radar='sumare', extension='gif'):
+    return len([f for f in os.listdir(directory) if f.startswith(f'radar_{radar}_') and f.endswith(f'.{extension}')])
+
+
+def flattened(path):
+    """Frame de origem sobre fundo preto (o que a animação deve mostrar)"""
+    img = Image.open(path).convert('RGBA')
+    background = Image.new('RGB', img.size, (0, 0, 0))
+    background.paste(img, mask=img.split()[3])
+    return np.asarray(background)
+
+
+def decoded_frames(body):
+    return [np.asarray(frame.convert('RGB')) for frame in ImageSequence.Iterator(Image.open(BytesIO(body)))]
+
+
+def peak_rss_child(fn):
+    """Executa fn num processo filho e retorna o acréscimo do pico de RSS (MB)"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        fn()
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(write_fd, str((after - before) / 1024).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        value = float(f.read())
+    os.waitpid(pid, 0)
+    return value
+
+
+def sumare_gif(server, client):
+    def export():
+        t0 = time.perf_counter()
+        client.get('/api/export/gif/sumare')
+        return time.perf_counter() - t0
+
+    cold = export()
+    cached = export()
+
+    # Sync do Sumaré: o conteúdo "anda" um frame e radar020 é novo
+    write_sumare_sequence(server.SUMARE_DIR, count=20, offset=1)
+    incremental = export()
+
+    write_sumare_sequence(server.SUMARE_DIR, count=20, offset=2)
+    builds_before = count_exports(server.EXPORT_DIR)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        t0 = time.perf_counter()
+        list(pool.map(lambda _: export(), range(8)))
+        concurrent = time.perf_counter() - t0
+    builds_after = count_exports(server.EXPORT_DIR)
+
+    print(f'GIF frio (20 frames):            {cold * 1000:8.1f} ms')
+    print(f'GIF em cache:                    {cached * 1000:8.1f} ms')
+    print(f'GIF após sync (frames novos):    {incremental * 1000:8.1f} ms')
+    print(f'8 requisições simultâneas:       {concurrent * 1000:8.1f} ms '
+          f'({builds_after - builds_before} build)')
+
+
+def formats(server, client, names):
+    """Cada formato: 20 frames mais recentes e pixels diferentes da origem (GIF: paleta de 256 cores)"""
+    newest = flattened(os.path.join(server.MENDANHA_DIR, names[-1]))
+    oldest = flattened(os.path.join(server.MENDANHA_DIR, names[-server.GIF_MAX_FRAMES]))
+    print('formatos (Mendanha, 20 frames 1024x1024, frio):')
+    for fmt in ('gif', 'webp', 'apng'):
+        t0 = time.perf_counter()
+        response = client.get(f'/api/export/mendanha?format={fmt}')
+        elapsed = time.perf_counter() - t0
+        frames = decoded_frames(response.get_data())
+        mismatched = max(int((frames[-1] != newest).any(axis=2).sum()), int((frames[0] != oldest).any(axis=2).sum()))
+        print(f"  {fmt:<5} {response.headers['Content-Type']:<11} {len(response.get_data()) / 1024:7.0f} KB  "
+              f'{elapsed * 1000:7.1f} ms  pixels diferentes da origem: {mismatched}')
+
+    labeled = decoded_frames(client.get('/api/export/mendanha?format=apng&timestamp=1').get_data())
+    changed = (labeled[-1] != newest).any(axis=2)
+    rows = np.nonzero(changed.any(axis=1))[0]
+    print(f'  ?timestamp=1: {int(changed.sum())} pixels alterados, linhas {rows.min()}-{rows.max()} (canto inferior)')
+
+    small = decoded_frames(client.get('/api/export/mendanha?format=webp&scale=0.25&step=2').get_data())
+    print(f'  ?scale=0.25&step=2: {len(small)} frames {small[0].shape[1]}x{small[0].shape[0]}')
+
+
+def window(server, client, names):
+    """Janela from/to: até WINDOW_FRAMES frames; acima disso, 400 pedindo step"""
+    start = datetime.strptime(names[-WINDOW_FRAMES], 'MDN-%Y%m%d-%H%M.png')
+    end = datetime.strptime(names[-1], 'MDN-%Y%m%d-%H%M.png')
+    url = f'/api/export/mendanha?format=webp&scale=0.25&from={start.isoformat()}&to={end.isoformat()}'
+    frames = decoded_frames(client.get(url).get_data())
+    too_long = client.get(url.replace(start.isoformat(), (start - timedelta(minutes=5)).isoformat()))
+    stepped = decoded_frames(client.get(url + '&step=3').get_data())
+    print(f'janela de 6 h: {len(frames)} frames; 6 h 05: {too_long.status_code}; '
+          f"6 h com step=3: {len(stepped)} frames ({too_long.get_json()['error']})")
+
+
+def pool_vs_inline(server, names):
+    """Build fria de 72 frames (WebP 1024x1024) codificando no worker vs. no pool"""
+    entries = server.get_frame_index('mendanha')['frames'][-WINDOW_FRAMES:]
+    results = {}
+    for processes in (0, 2, 4):
+        server.EXPORT_CONFIG['processes'] = processes
+        server.export_pool_state['pid'] = None
+        clear_directory(server.EXPORT_DIR)
+        t0 = time.perf_counter()
+        server.build_export('mendanha', entries, 'webp')
+        results[processes] = time.perf_counter() - t0
+    print(f'build fria de {WINDOW_FRAMES} frames WebP ({os.cpu_count()} CPUs): '
+          + '   '.join(f"{'no worker' if p == 0 else f'pool de {p}'} {t:5.1f} s" for p, t in results.items()))
+    server.EXPORT_CONFIG['processes'] = 2
+    server.export_pool_state['pid'] = None
+
+    def legacy():
+        """Como antes: todos os frames compostos em memória e o GIF montado pelo Pillow"""
+        frames = []
+        for entry in entries:
+            img = Image.open(os.path.join(server.MENDANHA_DIR, entry['name']))
+            background = Image.new('RGB', img.size, (0, 0, 0))
+            background.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
+            frames.append(background.quantize(colors=256))
+        buffer = BytesIO()
+        frames[0].save(buffer, format='GIF', save_all=True, append_images=frames[1:], duration=500, loop=0)
+
+    def streaming():
+        server.EXPORT_CONFIG['processes'] = 0
+        clear_directory(server.EXPORT_DIR)
+        server.build_export('mendanha', entries, 'gif')
+
+    print(f'pico de memória no worker, GIF de {WINDOW_FRAMES} frames: '
+          f'tudo em memória +{peak_rss_child(legacy):.0f} MB   bloco a bloco +{peak_rss_child(streaming):.0f} MB')
+
+
+def gunicorn_latency(cache_dir, names):
+    """Latência de /api/frames/sumare (gevent, 1 worker) durante uma exportação fria de 72 frames"""
+    print(f'gunicorn gevent, 1 worker: /api/frames/sumare durante exportação fria de {WINDOW_FRAMES} frames')
+    start = datetime.strptime(names[-WINDOW_FRAMES], 'MDN-%Y%m%d-%H%M.png').isoformat()
+    for processes in ('0', '2'):
+        os.environ['EXPORT_PROCESSES'] = processes
+        clear_directory(os.path.join(cache_dir, 'exports'))
+        port = free_port()
+        process = start_gunicorn(cache_dir, port, 'gevent', workers=1)
+        base = f'http://127.0.0.1:{port}'
+        try:
+            session = requests.Session()
+            session.get(f'{base}/api/frames/sumare')
+            done = threading.Event()
+            latencies = []
+
+            def export():
+                requests.get(f'{base}/api/export/mendanha?format=webp&from={start}', timeout=600)
+                done.set()
+
+            t0 = time.perf_counter()
+            exporter = threading.Thread(target=export)
+            exporter.start()
+            while not done.is_set():
+                t1 = time.perf_counter()
+                session.get(f'{base}/api/frames/sumare')
+                latencies.append(time.perf_counter() - t1)
+                time.sleep(0.05)
+            exporter.join()
+            label = 'no worker' if processes == '0' else f'pool de {processes}'
+            print(f'  {label:<10} exportação {time.perf_counter() - t0:5.1f} s   '
+                  f'p50={percentile(latencies, 50) * 1000:7.1f} ms   max={max(latencies) * 1000:7.1f} ms   '
+                  f'({len(latencies)} requisições)')
+        finally:
+            process.terminate()
+            process.wait()
+    os.environ.pop('EXPORT_PROCESSES')
+
+
+def main():
+    server = load_server()
+    write_sumare_sequence(server.SUMARE_DIR, count=20)
+    client = server.app.test_client()
+    sumare_gif(server, client)
+
+    # 80 frames de 5 em 5 min: a janela padrão deve pegar os 20 mais recentes
+    names = write_mendanha_sequence(server.MENDANHA_DIR, count=80)
+    formats(server, client, names)
+    window(server, client, names)
+    pool_vs_inline(server, names)
+    gunicorn_latency(os.environ['CACHE_DIR'], names)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: /api/frames/mendanha e /api/status
+
+Antes: os.listdir + sanitize_filename + sort + regex a cada requisição.
+Depois: índice em memória, corpo JSON pré-serializado e ETag (304).
+Usa 24 h de frames (288 arquivos, um a cada 5 min) mais as variantes
+geradas ao lado de cada frame.
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+from flask import jsonify
+
+from common import load_server, measure, report
+
+
+def main():
+    server = load_server()
+    with open(os.path.join(os.path.dirname(__file__), '..', 'logo-cor.png'), 'rb') as f:
+        content = f.read()
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(hours=24)
+    for i in range(288):
+        name = (start + timedelta(minutes=5 * i)).strftime('MDN-%Y%m%d-%H%M.png')
+        for suffix in ('', '.rain-v1', '.nuclei-v1.json'):
+            with open(os.path.join(server.MENDANHA_DIR, name + suffix), 'wb') as f:
+                f.write(content)
+
+    @server.app.route('/bench/legacy/frames')
+    def legacy_frames():
+        # Reprodução do handler antigo
+        files = os.listdir(server.MENDANHA_DIR)
+        files = [f for f in files if f.endswith('.png') and server.sanitize_filename(f)]
+        files.sort()
+        files = files[-20:]
+        latest_timestamp = None
+        delay_minutes = None
+        if files:
+            match = re.match(r'MDN-(\d{4})(\d{2})(\d{2})-(\d{2})(\d{2})', files[-1])
+            if match:
+                year, month, day, hour, minute = match.groups()
+                latest_timestamp = f"{year}-{month}-{day}T{hour}:{minute}:00"
+                frame_time = datetime(int(year), int(month), int(day), int(hour), int(minute))
+                delay_minutes = int((datetime.now() - frame_time).total_seconds() / 60)
+        return jsonify({'frames': files, 'count': len(files),
+                        'latest_timestamp': latest_timestamp, 'delay_minutes': delay_minutes})
+
+    client = server.app.test_client()
+    legacy = client.get('/bench/legacy/frames').get_json()
+    current = client.get('/api/frames/mendanha')
+    listing = current.get_json()
+    versions = listing.pop('versions')  # campo novo: versão do conteúdo para ?v=
+    assert listing.pop('rain_filter_version') == server.RAIN_FILTER_VERSION  # campo novo: rv= com filter=rain
+    assert listing == legacy, (listing, legacy)
+    assert sorted(versions) == listing['frames']
+    etag = current.headers['ETag']
+
+    def before():
+        assert client.get('/bench/legacy/frames').status_code == 200
+
+    def after():
+        assert client.get('/api/frames/mendanha').status_code == 200
+
+    def revalidate():
+        assert client.get('/api/frames/mendanha', headers={'If-None-Match': etag}).status_code == 304
+
+    print('288 frames Mendanha (+ variantes) no diretório')
+    report('antes (listdir por requisição)', *measure(before, duration=2))
+    report('depois (índice em memória)', *measure(after, duration=2))
+    report('depois (If-None-Match -> 304)', *measure(revalidate, duration=2))
+
+
+if __name__ == '__main__':
+    main()
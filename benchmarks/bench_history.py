@@ -0,0 +1,96 @@
+"""
+Benchmark: histórico compacto do Mendanha (3 dias, um frame a cada 5 min).
+
+Antes: só as últimas 24 h existiam (PNG RGBA em disco); consultar um
+período exigiria guardar e decodificar os PNGs.
+Depois: raster uint8 de classes por frame (zlib), um arquivo por dia com
+índice de registros fixos; dias fechados compactados. /api/history lê o
+resumo direto do índice e os rasters por mmap.
+
+Os 3 dias reaproveitam 24 frames sintéticos em ciclo (renderizar 864
+frames levaria minutos); a compressão não depende da ordem. A leitura
+idêntica após a compactação e o arquivamento antes da limpeza das 24 h
+são cobertos em tests/test_history.py.
+"""
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+from common import load_server
+from synthetic import write_mendanha_sequence
+
+DAYS = 3
+PER_DAY = 288
+DISTINCT = 24
+
+
+def main():
+    server = load_server()
+    source_dir = os.path.join(server.CACHE_DIR, 'fonte')
+    names = write_mendanha_sequence(source_dir, count=DISTINCT)
+    paths = [os.path.join(source_dir, name) for name in names]
+    classes = [server.classify_frame(Image.open(path), filtered=False)[0] for path in paths]
+    png_size = sum(os.path.getsize(path) for path in paths) / DISTINCT
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=DAYS - 1)
+    times = [(start + timedelta(minutes=5 * i)).timestamp() for i in range(DAYS * PER_DAY)]
+
+    t0 = time.perf_counter()
+    for i, timestamp in enumerate(times):
+        server.append_history('mendanha', timestamp, classes[i % DISTINCT])
+    append_ms = (time.perf_counter() - t0) / len(times) * 1000
+
+    directory = os.path.join(server.HISTORY_DIR, 'mendanha')
+    live_bytes = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)
+                     if f.endswith(('.live', '.idx')))
+    server.HISTORY_CONFIG['compact_after_hours'] = 0
+    # Fecha todos os dias menos o atual (que continua vivo)
+    t0 = time.perf_counter()
+    stats = server.compact_history()
+    compact_seconds = time.perf_counter() - t0
+    history_bytes = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)
+                        if re.match(r'^\d{8}\.(live|idx|hist)$', f))
+    compacted_day = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)
+                        if f.endswith('.hist')) / (DAYS - 1)
+
+    print(f'{DAYS} dias x {PER_DAY} frames 1024x1024 do Mendanha')
+    print(f'  PNG em disco (24 h, hoje):    {png_size * PER_DAY / 1e6:7.1f} MB/dia')
+    print(f'  histórico vivo (zlib 1):      {live_bytes / len(times) * PER_DAY / 1e6:7.1f} MB/dia  '
+          f'({append_ms:.1f} ms por frame no sync)')
+    print(f'  histórico compactado:         {compacted_day / 1e6:7.1f} MB/dia  '
+          f"(compactação de {stats['compacted']} dias em {compact_seconds:.1f} s)")
+    print(f'  total em disco:               {history_bytes / 1e6:7.1f} MB')
+
+    client = server.app.test_client()
+
+    def timed(url, runs=5):
+        best = float('inf')
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            response = client.get(url)
+            best = min(best, time.perf_counter() - t0)
+            assert response.status_code == 200, response.get_json()
+        return best * 1000, response
+
+    day_from = (start + timedelta(days=1)).isoformat()
+    day_to = (start + timedelta(days=2) - timedelta(minutes=1)).isoformat()
+    all_to = datetime.fromtimestamp(times[-1]).isoformat()
+    ms, response = timed(f'/api/history/mendanha?from={day_from}&to={day_to}')
+    print(f'/api/history (resumo, 1 dia):     {ms:7.1f} ms')
+    ms, response = timed(f'/api/history/mendanha?from={start.isoformat()}&to={all_to}')
+    print(f'/api/history (resumo, {DAYS} dias):    {ms:7.1f} ms')
+    ms, response = timed(f'/api/history/mendanha?from={day_from}&to={day_to}&format=raw')
+    print(f'/api/history (rasters, 1 dia):    {ms:7.1f} ms  ({len(response.get_data()) / 1e6:.1f} MB)')
+
+    t0 = time.perf_counter()
+    for i in range(PER_DAY):
+        server.classify_frame(Image.open(paths[i % DISTINCT]), filtered=False)
+    print(f'decodificar + classificar {PER_DAY} PNGs: {(time.perf_counter() - t0) * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,415 @@
+"""
+Teste de carga reproduzível da API, com resultados em JSON para comparar
+commits.
+
+Sobe o server.py no gunicorn (2 workers gevent, como no Supervisor) sobre
+frames sintéticos de 1024x1024 baixados de um FTP local (Mendanha) e de um
+AlertaRio local (Sumaré) (`standins.py`) pelo próprio sync. Cada cenário
+repete o tráfego de um tipo de cliente com CLIENTS usuários simultâneos
+(threads com sessão keep-alive, como um navegador):
+
+- index_bundle / index_bundle_rain: index.html abrindo (página, lista,
+  bundle WebP dos 20 frames, núcleos), sem e com filter=rain;
+- preload_frames / preload_frames_rain: pré-carga dos 20 frames um a um
+  (clientes antigos e o fallback quando o bundle falha);
+- mosaic_wall: mosaic.html com 3 painéis (Mendanha e Sumaré pela API em
+  bundle reduzido; o de Niterói é um iframe externo);
+- gif_export: exportação de GIF, alternando os radares;
+- refresh_poll: atualização a cada 2 min sem SSE (lista, bundle e núcleos
+  revalidados com If-None-Match, como o cache do navegador faz);
+- mixed: todos os anteriores misturados (MIX) enquanto as fontes publicam
+  frames novos e o sync roda a cada --publish-interval s.
+
+Por cenário: p50/p99 por requisição e por ação do cliente, req/s, MB/s,
+erros, RSS máximo e CPU dos workers. O JSON vai para
+benchmarks/results/load-<commit>.json; --compare base.json aponta
+regressões (saída 1 se alguma passar de --tolerance).
+
+Requer gunicorn e gevent: pip install gunicorn gevent
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import requests
+
+from common import (ROOT_DIR, cpu_seconds, free_port, load_server, percentile, rss_mb, start_gunicorn,
+                    worker_pids)
+from standins import AlertaRioStandIn, FTPStandIn
+from synthetic import write_mendanha_sequence, write_sumare_sequence
+
+FRAMES = 20
+EXTRA = 10   # frames publicados durante o cenário mixed
+WARMUP_MAX = 120  # s de espera até todos os clientes completarem 2 ações
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Peso de cada tipo de cliente no cenário mixed
+MIX = {'refresh_poll': 50, 'index_bundle': 20, 'index_bundle_rain': 10, 'mosaic_wall': 10,
+       'preload_frames_rain': 5, 'gif_export': 5}
+
+
+class VirtualUser:
+    """Um navegador: sessão keep-alive, cache de ETags e latências por requisição"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.etags = {}
+        self.samples = defaultdict(list)
+        self.actions = []
+        self.bytes = 0
+        self.errors = 0
+        self.turn = 0
+        self.completed = 0
+        self.cold = 0.0
+
+    def get(self, label, path, conditional=False):
+        headers = {'If-None-Match': self.etags[path]} if conditional and path in self.etags else {}
+        t0 = time.perf_counter()
+        try:
+            response = self.session.get(self.base_url + path, headers=headers, timeout=60)
+        except requests.RequestException:
+            self.errors += 1
+            return None
+        self.samples[label].append(time.perf_counter() - t0)
+        self.bytes += len(response.content)
+        if response.status_code >= 400:
+            self.errors += 1
+            return None
+        if conditional and 'ETag' in response.headers:
+            self.etags[path] = response.headers['ETag']
+        return response
+
+
+def frame_names(vu, radar, label='frames'):
+    response = vu.get(label, f'/api/frames/{radar}')
+    return response.json()['frames'] if response is not None else []
+
+
+def index_bundle(vu, rain=False):
+    vu.get('page', '/')
+    frame_names(vu, 'mendanha')
+    vu.get('bundle_rain' if rain else 'bundle',
+           '/api/frames/mendanha/bundle?format=webp' + ('&filter=rain' if rain else ''))
+    vu.get('nuclei', '/api/nuclei/mendanha')
+
+
+def preload_frames(vu, rain=False):
+    vu.get('page', '/')
+    query = '?filter=rain' if rain else ''
+    for name in frame_names(vu, 'mendanha'):
+        vu.get('frame_rain' if rain else 'frame', f'/api/frame/mendanha/{name}{query}')
+
+
+def mosaic_wall(vu):
+    vu.get('page', '/mosaic.html')
+    for radar in ('mendanha', 'sumare'):
+        frame_names(vu, radar)
+        vu.get('bundle_mosaic', f'/api/frames/{radar}/bundle?format=webp&scale=1'
+               + ('&filter=rain' if radar == 'mendanha' else ''))
+
+
+def gif_export(vu):
+    vu.turn += 1
+    vu.get('gif', '/api/export/gif/' + ('mendanha', 'sumare')[vu.turn % 2])
+
+
+def refresh_poll(vu):
+    for label, path in (('poll_frames', '/api/frames/mendanha'),
+                        ('poll_bundle', '/api/frames/mendanha/bundle?format=webp'),
+                        ('poll_nuclei', '/api/nuclei/mendanha')):
+        vu.get(label, path, conditional=True)
+
+
+SCENARIOS = {
+    'index_bundle': index_bundle,
+    'index_bundle_rain': lambda vu: index_bundle(vu, rain=True),
+    'preload_frames': preload_frames,
+    'preload_frames_rain': lambda vu: preload_frames(vu, rain=True),
+    'mosaic_wall': mosaic_wall,
+    'gif_export': gif_export,
+    'refresh_poll': refresh_poll,
+}
+
+
+def mixed_action(rng):
+    names = list(MIX)
+    choice = rng.choices(names, weights=[MIX[name] for name in names])[0]
+    return SCENARIOS[choice]
+
+
+class Publisher:
+    """Fontes publicando frames novos e o sync do líder rodando em seguida (cenário mixed)"""
+
+    def __init__(self, server, ftp, alertario, mendanha, sumare, interval):
+        self.server, self.ftp, self.alertario = server, ftp, alertario
+        self.mendanha, self.sumare = mendanha, sumare
+        self.interval = interval
+        self.published = 0
+        self.syncs = []
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def publish(self):
+        self.published += 1
+        name, content = self.mendanha[FRAMES + self.published - 1]
+        with self.ftp.lock:
+            self.ftp.files[name] = content
+        for i in range(FRAMES):
+            self.alertario.set_frame(f'radar{str(i + 1).zfill(3)}.png', self.sumare[i + self.published])
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            if self.published < EXTRA:
+                self.publish()
+            t0 = time.perf_counter()
+            self.server.sync_mendanha()
+            self.server.sync_sumare()
+            self.syncs.append(time.perf_counter() - t0)
+
+
+def run_scenario(name, base_url, master_pid, clients, duration, warmup, seed):
+    """Roda o cenário com `clients` usuários; mede `duration` s após o aquecimento"""
+    users = [VirtualUser(base_url) for _ in range(clients)]
+    stop = threading.Event()
+    measuring = threading.Event()
+
+    def loop(index, vu):
+        rng = random.Random(seed * 1000 + index)
+        while not stop.is_set():
+            action = mixed_action(rng) if name == 'mixed' else SCENARIOS[name]
+            t0 = time.perf_counter()
+            action(vu)
+            if measuring.is_set():
+                vu.actions.append(time.perf_counter() - t0)
+            elif vu.completed == 0:
+                vu.cold = time.perf_counter() - t0
+            vu.completed += 1
+
+    threads = [threading.Thread(target=loop, args=(i, vu), daemon=True) for i, vu in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    # Aquecimento: caches frios de cada worker (bundle, GIF, variantes) ficam de fora da medição
+    deadline = time.perf_counter() + warmup + WARMUP_MAX
+    time.sleep(warmup)
+    while min(vu.completed for vu in users) < 2 and time.perf_counter() < deadline:
+        time.sleep(0.1)
+    for vu in users:
+        vu.samples.clear()
+        vu.bytes = vu.errors = 0
+    pids = worker_pids(master_pid)
+    cpu_before = cpu_seconds(pids)
+    peak_rss = rss_mb(pids)
+    measuring.set()
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < duration:
+        time.sleep(0.25)
+        peak_rss = max(peak_rss, rss_mb(pids))
+    stop.set()
+    elapsed = time.perf_counter() - t0
+    cpu = cpu_seconds(pids) - cpu_before
+    for thread in threads:
+        thread.join()
+
+    by_label = defaultdict(list)
+    for vu in users:
+        for label, samples in vu.samples.items():
+            by_label[label].extend(samples)
+    latencies = [sample for samples in by_label.values() for sample in samples]
+    actions = [sample for vu in users for sample in vu.actions]
+    return {
+        'requests': len(latencies),
+        'errors': sum(vu.errors for vu in users),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'actions': len(actions),
+        'action_p50_ms': ms(percentile(actions, 50)),
+        'action_p99_ms': ms(percentile(actions, 99)),
+        'cold_action_ms': ms(max(vu.cold for vu in users)),
+        'mb_per_s': round(sum(vu.bytes for vu in users) / elapsed / 1e6, 2),
+        'worker_rss_mb': round(peak_rss, 1),
+        'worker_cpu_s': round(cpu, 2),
+        'routes': {label: {'count': len(samples), 'p50_ms': ms(percentile(samples, 50)),
+                           'p99_ms': ms(percentile(samples, 99))}
+                   for label, samples in sorted(by_label.items())},
+    }
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(base, current, tolerance):
+    """Imprime as diferenças por cenário; retorna as regressões acima da tolerância"""
+    regressions = []
+    print(f"\ncomparação com {base['commit']} (tolerância {tolerance:.0%})")
+    print(f"{'cenário':<20} {'p50 ms':>18} {'p99 ms':>18} {'req/s':>18}")
+    for name, result in current['scenarios'].items():
+        old = base['scenarios'].get(name)
+        if not old:
+            continue
+        cells = []
+        for key, higher_is_worse in (('p50_ms', True), ('p99_ms', True), ('rps', False)):
+            if not old[key] or result[key] is None:
+                cells.append(f"{'-':>18}")
+                continue
+            change = result[key] / old[key] - 1
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            if worse:
+                regressions.append(f'{name}.{key}: {old[key]} -> {result[key]}')
+            cells.append(f"{old[key]:>7} -> {result[key]:<7}{'!' if worse else ' '}")
+        print(f'{name:<20} ' + ' '.join(cells))
+    return regressions
+
+
+def prepare_sources():
+    """
+    Frames sintéticos das duas fontes: FRAMES publicados + EXTRA para o
+    cenário mixed. São determinísticos, então ficam guardados entre execuções
+    (gerar leva ~1 min); os horários do Mendanha são atribuídos agora.
+    """
+    source_dir = os.path.join(tempfile.gettempdir(), f'radar-load-fontes-{FRAMES + EXTRA}')
+    if not os.path.exists(source_dir):
+        work_dir = tempfile.mkdtemp(prefix='radar-load-fontes-')
+        write_mendanha_sequence(os.path.join(work_dir, 'mendanha'), count=FRAMES + EXTRA)
+        write_sumare_sequence(os.path.join(work_dir, 'sumare'), count=FRAMES + EXTRA)
+        os.rename(work_dir, source_dir)
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=5 * (FRAMES + EXTRA))
+    sources = {}
+    for radar in ('mendanha', 'sumare'):
+        directory = os.path.join(source_dir, radar)
+        sources[radar] = []
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as f:
+                sources[radar].append(f.read())
+    mendanha = [((start + timedelta(minutes=5 * i)).strftime('MDN-%Y%m%d-%H%M.png'), content)
+                for i, content in enumerate(sources['mendanha'])]
+    return mendanha, sources['sumare']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', type=int, default=8, help='usuários simultâneos por cenário')
+    parser.add_argument('--duration', type=float, default=10, help='segundos medidos por cenário')
+    parser.add_argument('--warmup', type=float, default=2,
+                        help='segundos mínimos de aquecimento (descartados; dura até cada cliente completar 2 ações)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--worker-class', default='gevent')
+    parser.add_argument('--publish-interval', type=float, default=5, help='s entre publicações no mixed')
+    parser.add_argument('--scenarios', default=','.join(list(SCENARIOS) + ['mixed']))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='arquivo JSON (padrão: benchmarks/results/load-<commit>.json)')
+    parser.add_argument('--compare', help='JSON de uma execução anterior')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='piora relativa tolerada no --compare')
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(',')
+    for name in scenarios:
+        if name not in SCENARIOS and name != 'mixed':
+            parser.error(f'cenário desconhecido: {name}')
+
+    t0 = time.perf_counter()
+    mendanha, sumare = prepare_sources()
+    print(f'{FRAMES + EXTRA} frames sintéticos por radar em {time.perf_counter() - t0:.1f} s')
+
+    ftp = FTPStandIn(dict(mendanha[:FRAMES])).start()
+    alertario = AlertaRioStandIn({f'radar{str(i + 1).zfill(3)}.png': sumare[i] for i in range(FRAMES)}).start()
+    cache_dir = tempfile.mkdtemp(prefix='radar-bench-')
+    os.environ.update({'FTP_HOST': '127.0.0.1', 'FTP_PORT': str(ftp.port), 'FTP_USER': 'inea',
+                       'FTP_PASSWORD': 'secret', 'SUMARE_BASE_URL': alertario.base_url})
+    server = load_server(cache_dir)
+    setup = {}
+    for radar, sync in (('mendanha', server.sync_mendanha), ('sumare', server.sync_sumare)):
+        t0 = time.perf_counter()
+        assert sync() is not None, f'sync inicial de {radar} falhou'
+        setup[f'initial_sync_{radar}_s'] = round(time.perf_counter() - t0, 2)
+    print(f"sync inicial: Mendanha {setup['initial_sync_mendanha_s']} s, Sumaré {setup['initial_sync_sumare_s']} s")
+
+    port = free_port()
+    gunicorn = start_gunicorn(cache_dir, port, args.worker_class, args.workers)
+    base_url = f'http://127.0.0.1:{port}'
+    results = {}
+    publisher = None
+    try:
+        setup['idle_worker_rss_mb'] = round(rss_mb(worker_pids(gunicorn.pid)), 1)
+        print(f"gunicorn -k {args.worker_class} -w {args.workers}, {args.clients} clientes, "
+              f"{args.duration:g} s por cenário (RSS ocioso {setup['idle_worker_rss_mb']} MB)")
+        print(f"{'cenário':<20} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'ação p50':>9} "
+              f"{'ação p99':>9} {'fria ms':>8} {'MB/s':>7} {'RSS MB':>7} {'CPU s':>6} {'erros':>6}")
+        for name in scenarios:
+            if name == 'mixed':
+                publisher = Publisher(server, ftp, alertario, mendanha, sumare, args.publish_interval)
+                publisher.thread.start()
+            result = run_scenario(name, base_url, gunicorn.pid, args.clients, args.duration, args.warmup, args.seed)
+            if publisher:
+                publisher.stop.set()
+                publisher.thread.join()
+                result['published'] = publisher.published
+                result['sync_p50_ms'] = ms(percentile(publisher.syncs, 50))
+                publisher = None
+            results[name] = result
+            print(f"{name:<20} {result['rps']:>8} {result['p50_ms']:>8} {result['p99_ms']:>8} "
+                  f"{result['action_p50_ms']:>9} {result['action_p99_ms']:>9} {result['cold_action_ms']:>8} {result['mb_per_s']:>7} "
+                  f"{result['worker_rss_mb']:>7} {result['worker_cpu_s']:>6} {result['errors']:>6}")
+    finally:
+        if publisher:
+            publisher.stop.set()
+        gunicorn.terminate()
+        gunicorn.wait()
+        ftp.stop()
+        alertario.stop()
+
+    if 'mixed' in results:
+        print(f"mixed: {results['mixed']['published']} publicações, sync p50 {results['mixed']['sync_p50_ms']} ms")
+    polls = results.get('refresh_poll')
+    if polls and polls['actions']:
+        # Cada cliente faz uma ação a cada 2 min: quantos caberiam com essa vazão
+        print(f"refresh_poll: ~{int(polls['actions'] / args.duration * 120)} clientes com polling de 2 min")
+
+    report_data = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {'clients': args.clients, 'duration': args.duration, 'warmup': args.warmup,
+                   'workers': args.workers, 'worker_class': args.worker_class, 'frames': FRAMES,
+                   'publish_interval': args.publish_interval, 'seed': args.seed, 'mix': MIX},
+        'setup': setup,
+        'scenarios': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{report_data['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report_data, f, indent=2, ensure_ascii=False)
+    print(f'resultados em {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report_data, args.tolerance)
+        if regressions:
+            print('regressões: ' + '; '.join(regressions))
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
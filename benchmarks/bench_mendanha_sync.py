@@ -0,0 +1,99 @@
+"""
+Benchmark: sync do Mendanha contra um FTP local (FTPStandIn).
+
+Compara um ciclo do sync antigo (conectar + login + NLST + ordenar tudo)
+com a sessão persistente + listagem lembrada, e mede os bytes da retomada
+de um download interrompido e o backoff com o FTP fora do ar. O
+comportamento (20 mais recentes, reconexão, REST, backoff) é coberto em
+tests/test_mendanha_sync.py.
+"""
+import ftplib
+import os
+import re
+import tempfile
+import time
+
+from common import clear_directory, load_server
+from standins import FTPStandIn
+from synthetic import write_mendanha_sequence
+
+RTT = 0.03  # segundos por comando FTP
+
+
+def legacy_cycle(port):
+    """Parte fixa do sync_mendanha original (sem downloads)"""
+    ftp = ftplib.FTP()
+    ftp.connect('127.0.0.1', port, timeout=30)
+    ftp.login('inea', 'secret')
+    ftp.cwd('/')
+    files = ftp.nlst()
+    radar_files = [f for f in files if re.match(r'MDN-.*\.png$', f)]
+    radar_files.sort(reverse=True)
+    ftp.quit()
+    return radar_files[:20]
+
+
+def main():
+    source_dir = tempfile.mkdtemp(prefix='inea-')
+    names = write_mendanha_sequence(source_dir, count=30)
+    files = {}
+    for name in names:
+        with open(os.path.join(source_dir, name), 'rb') as f:
+            files[name] = f.read()
+    # Diretório do INEA também tem arquivos que não são frames
+    for i in range(500):
+        files[f'log-{i:04d}.txt'] = b'x'
+
+    standin = FTPStandIn(files).start()
+    os.environ.update({'FTP_HOST': '127.0.0.1', 'FTP_PORT': str(standin.port),
+                       'FTP_USER': 'inea', 'FTP_PASSWORD': 'secret',
+                       'SUMARE_BASE_URL': 'http://127.0.0.1:9/radar'})
+    server = load_server()
+    server.close_ftp_connection()
+    server.ftp_state.update({'known': set(), 'recent': [], 'sizes': {}})
+    clear_directory(server.MENDANHA_DIR)
+    standin.reset_stats()
+
+    # 1) Primeiro sync: 20 mais recentes
+    server.sync_mendanha()
+
+    # 2) Parte FTP de um ciclo sem mudanças, antigo vs. novo, com RTT simulado
+    standin.latency = RTT
+    runs = 10
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        legacy_cycle(standin.port)
+    legacy_ms = (time.perf_counter() - t0) / runs * 1000
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        ftp = server.get_ftp_connection()
+        server.update_ftp_listing(server.list_ftp_files(ftp))
+    persistent_ms = (time.perf_counter() - t0) / runs * 1000
+    standin.latency = 0.0
+
+    # 3) Download interrompido: fica só o .part; o próximo ciclo retoma com REST
+    partial_name = 'MDN-99991231-2360.png'
+    standin.files[partial_name] = files[names[1]]
+    standin.truncate_next[partial_name] = len(files[names[1]]) // 3
+    server.sync_mendanha()
+    standin.reset_stats()
+    server.sync_mendanha()
+    resumed_bytes = standin.stats['bytes']
+
+    # 4) FTP fora do ar: backoff
+    standin.down = True
+    standin.drop_sessions()
+    time.sleep(0.1)
+    server.sync_mendanha()
+    first_failure = server.ftp_state['next_attempt'] - time.time()
+
+    standin.stop()
+    print(f'ciclo sem mudanças, RTT {RTT * 1000:.0f} ms por comando:')
+    print(f'  antigo (conectar + login + NLST + ordenar): {legacy_ms:7.1f} ms')
+    print(f'  sessão persistente + MLSD + delta:          {persistent_ms:7.1f} ms')
+    print(f'retomada de download parcial: {resumed_bytes} de {len(files[names[1]])} bytes transferidos')
+    print(f'backoff após falha de conexão: {first_failure:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: /metrics (Prometheus) e profiler por amostragem.
+
+Antes: só print() e /api/admin/status; nenhuma latência por rota, tempo de
+download ou taxa de acerto de cache.
+Depois: cada worker agrega as observações em memória e grava o total no
+state.db a cada 10 s; /metrics soma todos os workers.
+
+Mede o custo das observações e o acréscimo por requisição, compara com
+gravar cada observação direto no SQLite (a forma ingênua de somar entre
+workers), confere a soma com 4 processos e captura um flame graph de uma
+thread ocupando a CPU.
+"""
+import multiprocessing
+import re
+import threading
+import time
+
+from common import load_server, measure, report
+
+WORKERS = 4
+REQUESTS = 500
+
+
+def best_of(fn, runs=5, loops=10000):
+    best = float('inf')
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / loops * 1e6
+
+
+def worker_requests(server):
+    """Processo filho: como um worker do gunicorn, com métricas próprias"""
+    client = server.app.test_client()
+    for _ in range(REQUESTS):
+        assert client.get('/api/frames/sumare').status_code == 200
+    server.flush_metrics(force=True)
+
+
+def busy_loop(stop):
+    """CPU ocupada (o que o profiler deve encontrar)"""
+    total = 0
+    while not stop.is_set():
+        total += sum(i * i for i in range(1000))
+    return total
+
+
+def main():
+    server = load_server()
+    client = server.app.test_client()
+
+    observe = best_of(lambda: server.observe_metric('radar_download_duration_seconds', 0.2, source='sumare'))
+    inc = best_of(lambda: server.inc_metric('radar_cache_requests_total', cache='rain', result='hit'))
+    server.state_query('CREATE TABLE IF NOT EXISTS naive_metrics (key TEXT PRIMARY KEY, value REAL NOT NULL)')
+    naive = best_of(lambda: server.state_query(
+        'INSERT INTO naive_metrics (key, value) VALUES (?, 1) '
+        'ON CONFLICT(key) DO UPDATE SET value = value + 1', ('radar_cache_requests_total{cache="rain"}',)),
+        runs=3, loops=500)
+    flush = best_of(lambda: server.flush_metrics(force=True), runs=3, loops=200)
+    print(f'observe_metric: {observe:5.2f} µs   inc_metric: {inc:5.2f} µs   '
+          f'(UPDATE no SQLite por observação: {naive:6.1f} µs)   flush do worker: {flush:6.1f} µs a cada 10 s')
+
+    # Acréscimo por requisição: hooks de latência ligados vs. desligados
+    hooks = (server.app.before_request_funcs[None][:], server.app.after_request_funcs[None][:])
+    server.app.before_request_funcs[None] = [f for f in hooks[0] if f is not server.start_request_timer]
+    server.app.after_request_funcs[None] = [f for f in hooks[1] if f is not server.record_request_metrics]
+    report('/api/frames/sumare sem métricas', *measure(lambda: client.get('/api/frames/sumare'), duration=2))
+    server.app.before_request_funcs[None], server.app.after_request_funcs[None] = hooks
+    report('/api/frames/sumare com métricas', *measure(lambda: client.get('/api/frames/sumare'), duration=2))
+
+    # Soma entre processos (workers do gunicorn são processos separados)
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=worker_requests, args=(server,)) for _ in range(WORKERS)]
+    before = client.get('/metrics').get_data(as_text=True)
+    t0 = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    print(f'{WORKERS} processos x {REQUESTS} requisições em {time.perf_counter() - t0:.1f} s')
+
+    pattern = re.compile(r'^radar_http_request_duration_seconds_count\{code="200",method="GET",route="/api/frames/sumare"\} (\d+)$', re.M)
+    previous = int(pattern.search(before).group(1))
+    t0 = time.perf_counter()
+    response = client.get('/metrics')
+    scrape = (time.perf_counter() - t0) * 1000
+    text = response.get_data(as_text=True)
+    total = int(pattern.search(text).group(1))
+    workers = int(re.search(r'^radar_metrics_workers\{\} (\d+)$', text, re.M).group(1))
+    print(f'/metrics: {scrape:.1f} ms, {len(text) / 1024:.1f} KB, {workers} workers somados; '
+          f'/api/frames/sumare: {previous} + {total - previous} requisições')
+    assert total - previous == WORKERS * REQUESTS
+    assert 'radar_frame_age_seconds' in text and 'radar_cache_hit_ratio' in text
+
+    # Profiler: a thread ocupada deve dominar as amostras
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(stop,), name='busy')
+    thread.start()
+    response = client.get('/api/admin/profile?seconds=1&interval=2', headers={'X-Admin-Token': server.ADMIN_TOKEN})
+    stop.set()
+    thread.join()
+    assert response.status_code == 200
+    folded = response.get_data(as_text=True).splitlines()
+    busy = sum(int(line.rsplit(' ', 1)[1]) for line in folded if 'busy_loop' in line)
+    print(f"profiler (1 s a cada 2 ms): {response.headers['X-Profile-Samples']} amostras, "
+          f'{busy} na thread ocupada; pilha mais frequente:')
+    print(f'  {folded[0]}')
+    assert busy > 100 and 'busy;' in folded[0]
+    assert client.get('/api/admin/profile?seconds=1').status_code == 401
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: nowcast (+10/+20/+30 min) do Mendanha por campo de movimento.
+
+Antes: só setas de tendência para os 5 maiores núcleos (calculateMovements);
+nenhuma imagem de previsão.
+Depois: update_nowcast estima um campo denso por block matching entre os
+últimos frames do histórico e desloca o último frame ao longo dele.
+
+Os frames sintéticos se movem 6 px para leste e 3 px para norte a cada
+5 min. As previsões são comparadas com os frames que de fato vieram depois
+(CSI: acertos / (acertos + falsos alarmes + perdas)) e com a persistência
+(repetir o último frame), a referência mínima de qualquer nowcast. Que a
+previsão supera a persistência, o PNG servido e o cache das URLs com ?v=
+são cobertos em tests/test_nowcast.py.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image
+
+from common import load_server
+from synthetic import write_mendanha_sequence
+
+STEP = 5        # minutos entre frames
+OBSERVED = 7    # frames no histórico quando a previsão é gerada
+
+
+def csi(forecast, truth, threshold):
+    hit = np.count_nonzero((forecast >= threshold) & (truth >= threshold))
+    false_alarm = np.count_nonzero((forecast >= threshold) & (truth < threshold))
+    miss = np.count_nonzero((forecast < threshold) & (truth >= threshold))
+    return hit / max(hit + false_alarm + miss, 1)
+
+
+def main():
+    server = load_server()
+    source_dir = os.path.join(server.CACHE_DIR, 'fonte')
+    lead_frames = [lead // STEP for lead in server.NOWCAST_LEADS]
+    count = OBSERVED + max(lead_frames)
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=STEP * (OBSERVED - 1))
+    names = write_mendanha_sequence(source_dir, count=count, start=start, step_minutes=STEP)
+    classes = [server.classify_frame(Image.open(os.path.join(source_dir, name)))[0] for name in names]
+    legend_x, legend_y = server.LEGEND_AREA
+    for raster in classes:
+        raster[:legend_y, :legend_x] = 0  # a legenda não entra na comparação
+    for i in range(OBSERVED):
+        server.append_history('mendanha', (start + timedelta(minutes=STEP * i)).timestamp(), classes[i])
+
+    t0 = time.perf_counter()
+    index = server.update_nowcast('mendanha')
+    total = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    server.update_nowcast('mendanha')
+    noop = time.perf_counter() - t0
+
+    # Etapas separadas, com os mesmos dados
+    fields = [server.coarse_field(raster) for raster in classes[OBSERVED - 4:OBSERVED]]
+    t0 = time.perf_counter()
+    vy, vx, weight = server.estimate_motion(fields)
+    motion_ms = (time.perf_counter() - t0) * 1000
+    smooth_y, smooth_x = server.smooth_motion(vy, vx, weight)
+    factor = server.NOWCAST_CONFIG['scale'] / (STEP * 60)
+    t0 = time.perf_counter()
+    forecasts = server.advect(classes[OBSERVED - 1], smooth_y * factor, smooth_x * factor,
+                              [lead * 60 for lead in server.NOWCAST_LEADS])
+    advect_ms = (time.perf_counter() - t0) * 1000
+
+    true_motion = server.motion_summary('mendanha', np.array([[-3.0 / 300]]), np.array([[6.0 / 300]]),
+                                        np.ones((1, 1)), classes[0].shape)
+    print(f'update_nowcast (3 pares, 1024x1024): {total * 1000:6.0f} ms  '
+          f'(block matching {motion_ms:.0f} ms, advecção {advect_ms:.0f} ms; sem frame novo {noop * 1000:.1f} ms)')
+    print(f"movimento estimado: {index['motion']['speed_kmh']} km/h para {index['motion']['direction_deg']}°  "
+          f"(real: {true_motion['speed_kmh']} km/h para {true_motion['direction_deg']}°; "
+          f'{int(weight.sum())}/{weight.size} blocos confiáveis)')
+
+    print('CSI           chuva (classe >= 1)        classe >= 3')
+    print('              persistência  nowcast      persistência  nowcast')
+    latest = classes[OBSERVED - 1]
+    for lead, frames_ahead, forecast in zip(server.NOWCAST_LEADS, lead_frames, forecasts):
+        truth = classes[OBSERVED - 1 + frames_ahead]
+        scores = [csi(candidate, truth, threshold) for threshold in (1, 3) for candidate in (latest, forecast)]
+        print(f'  +{lead} min     {scores[0]:10.3f}  {scores[1]:7.3f}      {scores[2]:10.3f}  {scores[3]:7.3f}')
+
+    client = server.app.test_client()
+    listing = client.get('/api/frames/mendanha/nowcast').get_json()
+    t0 = time.perf_counter()
+    name = listing['frames'][0]
+    frame = client.get(f"/api/nowcast/mendanha/{name}?v={listing['versions'][name]}")
+    print(f"/api/frames/mendanha/nowcast: {listing['count']} frames válidos para {', '.join(listing['valid_timestamps'])}; "
+          f'frame de {len(frame.get_data()) / 1024:.0f} KB em {(time.perf_counter() - t0) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark: detecção de núcleos
+
+Antes: port em Python do detectNuclei do index.html (flood fill com um
+set de chaves "x,y", como o cliente faz).
+Depois: classify_rain_pixels + label_components + detect_nuclei do server.py.
+Também verifica que os dois produzem os mesmos núcleos.
+"""
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from common import load_server
+from synthetic import write_mendanha_sequence
+
+
+def legacy_detect_nuclei(data, width, height, filter_rain_only=True):
+    """Port direto de detectNuclei (index.html)"""
+    visited = set()
+    nuclei = []
+
+    def is_rain_pixel(r, g, b, a):
+        if a < 100:
+            return False
+        if filter_rain_only:
+            if b > 100 and b > r and b >= g:
+                return False
+            if b > 150 and g > 150 and r < 100:
+                return False
+        if g > 200 and r < 100 and b < 100:
+            return 1
+        if 100 < g < 200 and r < 100 and b < 100:
+            return 2
+        if r > 200 and g > 200 and b < 100:
+            return 3
+        if r > 200 and 100 < g < 200 and b < 100:
+            return 4
+        if r > 200 and g < 100 and b < 100:
+            return 5
+        if r > 200 and b > 200 and g < 100:
+            return 6
+        if not filter_rain_only and b > 150 and g > 150 and r < 100:
+            return 1
+        return False
+
+    def flood_fill(start_x, start_y):
+        cluster = []
+        stack = [(start_x, start_y)]
+        total_intensity = 0
+        while stack:
+            x, y = stack.pop()
+            key = f'{x},{y}'
+            if key in visited or x < 0 or x >= width or y < 0 or y >= height:
+                continue
+            intensity = is_rain_pixel(*data[y][x])
+            if not intensity:
+                continue
+            visited.add(key)
+            cluster.append((x, y))
+            total_intensity += intensity
+            stack.extend([(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)])
+        return cluster, (total_intensity / len(cluster) if cluster else 0)
+
+    for y in range(0, height, 4):
+        for x in range(0, width, 4):
+            if x < 200 and y < 500:
+                continue
+            if f'{x},{y}' in visited:
+                continue
+            if is_rain_pixel(*data[y][x]):
+                cluster, avg_intensity = flood_fill(x, y)
+                if len(cluster) >= 80:
+                    center_x = sum(p[0] for p in cluster) / len(cluster)
+                    center_y = sum(p[1] for p in cluster) / len(cluster)
+                    if center_x >= 200 or center_y >= 500:
+                        nuclei.append({'x': center_x, 'y': center_y,
+                                       'size': len(cluster), 'intensity': avg_intensity})
+    return nuclei
+
+
+def same_nuclei(a, b):
+    if len(a) != len(b):
+        return False
+    for n1, n2 in zip(a, b):
+        if n1['size'] != n2['size']:
+            return False
+        if abs(n1['x'] - n2['x']) > 0.01 or abs(n1['y'] - n2['y']) > 0.01:
+            return False
+        if abs(n1['intensity'] - n2['intensity']) > 0.001:
+            return False
+    return True
+
+
+def main(legacy_frames=3):
+    server = load_server()
+    frames = write_mendanha_sequence(server.MENDANHA_DIR, count=20)
+    paths = [os.path.join(server.MENDANHA_DIR, f) for f in frames]
+
+    legacy_total = 0.0
+    for path in paths[:legacy_frames]:
+        img = Image.open(path).convert('RGBA')
+        rows = np.asarray(img).tolist()
+        t0 = time.perf_counter()
+        legacy = legacy_detect_nuclei(rows, img.width, img.height)
+        legacy_total += time.perf_counter() - t0
+
+        fast = server.detect_nuclei(server.classify_rain_pixels(np.asarray(img)))
+        assert same_nuclei(legacy, fast), f'divergência em {os.path.basename(path)}'
+    legacy_per_frame = legacy_total / legacy_frames
+
+    t0 = time.perf_counter()
+    for path in paths:
+        img = Image.open(path).convert('RGBA')
+        server.detect_nuclei(server.classify_rain_pixels(np.asarray(img)))
+    vector_per_frame = (time.perf_counter() - t0) / len(paths)
+
+    t0 = time.perf_counter()
+    server.update_nuclei('mendanha')
+    cold_sync = time.perf_counter() - t0
+
+    # Um frame novo chega: só ele é processado
+    write_mendanha_sequence(server.MENDANHA_DIR, count=21)
+    t0 = time.perf_counter()
+    server.update_nuclei('mendanha')
+    incremental_sync = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    server.update_nuclei('mendanha')
+    unchanged = time.perf_counter() - t0
+
+    print(f'flood fill (port do cliente):  {legacy_per_frame * 1000:9.1f} ms/frame  (resultados idênticos)')
+    print(f'vetorizado (NumPy):            {vector_per_frame * 1000:9.1f} ms/frame  '
+          f'({legacy_per_frame / vector_per_frame:.0f}x)')
+    print(f'update_nuclei 20 frames (frio): {cold_sync * 1000:8.1f} ms')
+    print(f'update_nuclei após sync:        {incremental_sync * 1000:8.1f} ms')
+    print(f'update_nuclei sem mudanças:     {unchanged * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark: /api/frame/mendanha/<frame>?filter=rain
+
+Antes: filter_rain_only a cada requisição (decode + máscara + re-encode).
+Depois: variante pré-computada no sync + LRU em memória + ETag/304.
+"""
+import os
+
+from flask import send_file
+
+from common import load_server, measure, report
+from synthetic import write_mendanha_sequence
+
+
+def main():
+    server = load_server()
+    frames = write_mendanha_sequence(server.MENDANHA_DIR, count=20)
+    client = server.app.test_client()
+
+    @server.app.route('/bench/legacy/<filename>')
+    def legacy_filtered(filename):
+        # Reprodução do handler antigo
+        filtered = server.filter_rain_only(os.path.join(server.MENDANHA_DIR, filename))
+        response = send_file(filtered, mimetype='image/png')
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        return response
+
+    counter = {'i': 0}
+
+    def next_frame():
+        counter['i'] += 1
+        return frames[counter['i'] % len(frames)]
+
+    def before():
+        assert client.get(f'/bench/legacy/{next_frame()}').status_code == 200
+
+    # Simula o sync: variantes geradas uma vez por frame baixado
+    for name in frames:
+        server.build_rain_variant(os.path.join(server.MENDANHA_DIR, name))
+
+    def after():
+        assert client.get(f'/api/frame/mendanha/{next_frame()}?filter=rain').status_code == 200
+
+    etags = {}
+    for name in frames:
+        etags[name] = client.get(f'/api/frame/mendanha/{name}?filter=rain').headers['ETag']
+
+    def revalidate():
+        name = next_frame()
+        response = client.get(f'/api/frame/mendanha/{name}?filter=rain',
+                              headers={'If-None-Match': etags[name]})
+        assert response.status_code == 304
+
+    print(f'{len(frames)} frames 1024x1024 em {server.MENDANHA_DIR}')
+    rate_before, lat_before = measure(before)
+    report('antes (filtro por requisição)', rate_before, lat_before)
+    rate_after, lat_after = measure(after)
+    report('depois (pré-computado + LRU)', rate_after, lat_after)
+    rate_304, lat_304 = measure(revalidate)
+    report('depois (If-None-Match -> 304)', rate_304, lat_304)
+    print(f'speedup: {rate_after / rate_before:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: custo do decorator @rate_limit por requisição.
+
+Antes: lista de timestamps por IP reconstruída a cada requisição (O(n) no
+número de requisições da janela) e chaves nunca removidas.
+Depois: token bucket O(1), LRU com descarte de buckets ociosos e backend
+compartilhado opcional (state.db) para o limite valer entre workers.
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from common import load_server
+
+LIMIT = 500
+CALLS = 20000
+
+
+def legacy_rate_limit(store, key, max_requests, window=60):
+    """Reprodução do corpo do decorator antigo"""
+    now = time.time()
+    if key in store:
+        store[key] = [t for t in store[key] if now - t < window]
+    else:
+        store[key] = []
+    if len(store[key]) >= max_requests:
+        return False
+    store[key].append(now)
+    return True
+
+
+def per_call(fn, calls=CALLS):
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - t0) / calls * 1e6
+
+
+def shared_worker(cache_dir, backend, calls):
+    """Um "worker" do gunicorn: conta quantas requisições passam no mesmo IP"""
+    os.environ['RATE_LIMIT_BACKEND'] = backend
+    server = load_server(cache_dir)
+    server.RATE_LIMIT_MAX_REQUESTS['gif'] = 100
+    view = server.rate_limit('gif')(lambda: 'ok')
+    allowed = 0
+    with server.app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        for _ in range(calls):
+            allowed += view() == 'ok'
+    return allowed
+
+
+def main():
+    server = load_server()
+    server.RATE_LIMIT_MAX_REQUESTS['default'] = LIMIT
+    view = server.rate_limit('default')(lambda: 'ok')
+    key = '10.0.0.1:default'
+
+    print(f'custo por requisição, IP com ~{LIMIT} requisições na janela')
+    legacy_store = {}
+    now = time.time()
+    legacy_store[key] = [now - 59 + i * 59 / (LIMIT - 1) for i in range(LIMIT - 1)]
+
+    def legacy():
+        legacy_rate_limit(legacy_store, key, LIMIT)
+        legacy_store[key].pop()  # mantém a janela com LIMIT - 1 entradas
+
+    print(f'  antes (lista por IP):     {per_call(legacy):7.2f} µs')
+    with server.app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        baseline = per_call(lambda: None)
+        server.RATE_LIMIT_MAX_REQUESTS['default'] = 10 ** 9
+        memory = per_call(view) - baseline
+        server.RATE_LIMIT_BACKEND = 'shared'
+        shared = per_call(view, calls=5000) - baseline
+        server.RATE_LIMIT_BACKEND = 'memory'
+        server.RATE_LIMIT_MAX_REQUESTS['default'] = LIMIT
+    print(f'  token bucket (memória):   {memory:7.2f} µs')
+    print(f'  token bucket (state.db):  {shared:7.2f} µs')
+
+    # Memória com muitos IPs distintos (varredura, NAT de operadora, etc.)
+    ips = 100000
+    tracemalloc.start()
+    legacy_store = {}
+    for i in range(ips):
+        legacy_rate_limit(legacy_store, f'10.{i >> 16}.{(i >> 8) & 255}.{i & 255}:default', LIMIT)
+    legacy_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    server.rate_limit_store.clear()
+    tracemalloc.start()
+    for i in range(ips):
+        ip = f'10.{i >> 16}.{(i >> 8) & 255}.{i & 255}'
+        with server.app.test_request_context(environ_base={'REMOTE_ADDR': ip}):
+            view()
+    new_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{ips} IPs distintos')
+    print(f'  antes: {len(legacy_store):6d} chaves  {legacy_bytes / 1e6:6.1f} MB')
+    print(f'  depois: {len(server.rate_limit_store):5d} chaves  {new_bytes / 1e6:6.1f} MB '
+          f'(limite {server.RATE_LIMIT_MAX_KEYS})')
+
+    # Threads concorrentes no mesmo IP: exatamente LIMIT passam
+    server.rate_limit_store.clear()
+    allowed = []
+
+    def hammer():
+        count = 0
+        with server.app.test_request_context(environ_base={'REMOTE_ADDR': '10.9.9.9'}):
+            for _ in range(200):
+                count += view() == 'ok'
+        allowed.append(count)
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f'8 threads x 200 requisições, limite {LIMIT}: {sum(allowed)} aceitas')
+    assert LIMIT <= sum(allowed) <= LIMIT + 2  # + reposição durante o teste
+
+    # 4 processos (workers) no mesmo IP, limite de 100 GIFs por minuto
+    context = multiprocessing.get_context('spawn')
+    for backend in ('memory', 'shared'):
+        cache_dir = tempfile.mkdtemp(prefix='radar-bench-')
+        with context.Pool(4) as pool:
+            counts = pool.starmap(shared_worker, [(cache_dir, backend, 300)] * 4)
+        print(f'4 workers x 300 requisições, limite 100/min, backend {backend:<6}: {sum(counts)} aceitas')
+
+
+if __name__ == '__main__':
+    main()
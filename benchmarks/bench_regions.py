@@ -0,0 +1,113 @@
+"""
+Benchmark: chuva por região (bairro) do Mendanha.
+
+Antes: não havia estatística por região; o cliente precisaria baixar o
+frame (~300 KB) e converter pixels com pixelToLatLng para saber se chove
+num bairro.
+Depois: as regiões são rasterizadas uma vez por tamanho de frame e cada
+sync conta pixels por classe em todas as regiões num único bincount.
+/api/regions devolve o valor atual e a série curta a partir do state.db.
+
+Compara com a forma direta (uma máscara por região), com as regiões
+incluídas e com uma grade de 160 regiões cobrindo o município (escala dos
+bairros oficiais). Que os valores são iguais, a contagem incremental no
+sync e as respostas de /api/regions são cobertos em tests/test_regions.py.
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from common import load_server
+
+STEP = 300
+FRAMES = 72  # 6 h
+
+
+def grid_regions(path, rows=10, cols=16):
+    """GeoJSON com rows x cols retângulos sobre o município do Rio"""
+    south, north, west, east = -23.08, -22.75, -43.80, -43.10
+    features = []
+    for i in range(rows):
+        for j in range(cols):
+            lat0 = south + (north - south) * i / rows
+            lat1 = south + (north - south) * (i + 1) / rows
+            lng0 = west + (east - west) * j / cols
+            lng1 = west + (east - west) * (j + 1) / cols
+            ring = [[lng0, lat0], [lng1, lat0], [lng1, lat1], [lng0, lat1], [lng0, lat0]]
+            features.append({'type': 'Feature', 'properties': {'nome': f'R{i}-{j}'},
+                             'geometry': {'type': 'Polygon', 'coordinates': [ring]}})
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+
+
+def per_region_masks(labels, classes, count):
+    """Forma direta: uma máscara do tamanho do frame por região"""
+    counts = np.zeros((count, 7), dtype=np.uint32)
+    for region_id in range(1, count + 1):
+        values = classes[labels == region_id]
+        counts[region_id - 1] = np.bincount(values, minlength=7)
+    return counts
+
+
+def best_of(fn, runs=10):
+    best = float('inf')
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    server = load_server()
+    rng = np.random.default_rng(5)
+    # Classes aleatórias: o custo não depende do conteúdo, e toda região tem chuva
+    rasters = [rng.integers(0, 7, size=(1024, 1024), dtype=np.uint8) for _ in range(8)]
+
+    grid_path = os.path.join(server.CACHE_DIR, 'grade.geojson')
+    grid_regions(grid_path)
+    for label, path in (('regiões incluídas', server.REGIONS_FILE), ('grade de 160 regiões', grid_path)):
+        server.REGIONS = server.load_regions(path)
+        server.region_rasters.clear()
+        count = len(server.REGIONS['regions'])
+        t0 = time.perf_counter()
+        pixels, _ = server.region_index('mendanha', (1024, 1024))
+        rasterize = (time.perf_counter() - t0) * 1000
+        labels = server.rasterize_regions('mendanha', 1024, 1024)
+        print(f'{label}: {count} regiões, {len(pixels)} pixels, rasterização {rasterize:.1f} ms (uma vez)')
+        print(f'  uma máscara por região: {best_of(lambda: per_region_masks(labels, rasters[0], count), 3):7.2f} ms por frame')
+        print(f'  bincount único:         {best_of(lambda: server.region_histogram("mendanha", rasters[0])):7.2f} ms por frame')
+
+    # Sync: 6 h de histórico, depois um frame novo por vez
+    now = datetime.now().replace(second=0, microsecond=0)
+    times = [(now - timedelta(seconds=STEP * i)).timestamp() for i in range(FRAMES)][::-1]
+    for i, timestamp in enumerate(times[:-1]):
+        server.append_history('mendanha', timestamp, rasters[i % len(rasters)])
+    t0 = time.perf_counter()
+    server.update_region_stats('mendanha')
+    print(f'preenchimento inicial ({FRAMES - 1} frames do histórico): {(time.perf_counter() - t0) * 1000:7.1f} ms')
+    server.append_history('mendanha', times[-1], rasters[0])
+    t0 = time.perf_counter()
+    server.update_region_stats('mendanha')
+    print(f'sync com 1 frame novo:                    {(time.perf_counter() - t0) * 1000:7.1f} ms')
+
+    client = server.app.test_client()
+
+    def timed(url, runs=5):
+        best = float('inf')
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            response = client.get(url)
+            best = min(best, time.perf_counter() - t0)
+        return best * 1000, response
+
+    for query in ('', '?hours=6', '?region=R5-8', '?region=R5-8&hours=6'):
+        ms, response = timed(f'/api/regions/mendanha{query}')
+        print(f'/api/regions/mendanha{query:<22} {ms:6.1f} ms  ({len(response.get_data()) / 1024:.0f} KB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: páginas pré-comprimidas e envio dos frames.
+
+Antes: index.html (93 KB) e mosaic.html (41 KB) passavam pelo send_file a
+cada carga, sem compressão; cada frame fazia exists + realpath antes do
+send_file; o Sumaré ia com no-store (cada troca de radar ou recarga da
+página baixava os 20 frames de novo).
+Depois: gzip/brotli e ETag calculados na inicialização; o frame é achado no
+índice em memória; URLs com ?v=<versão do conteúdo> são imutáveis; com
+FRAME_ACCEL_PREFIX o worker só responde o X-Accel-Redirect e o nginx envia
+o arquivo.
+
+Simula um navegador (cache por URL respeitando Cache-Control e ETag)
+abrindo o Sumaré 5 vezes entre duas publicações do AlertaRio.
+"""
+import os
+
+from flask import jsonify, send_file
+
+from common import load_server, measure, report
+from synthetic import write_sumare_sequence
+
+VISITS = 5
+
+
+class BrowserCache:
+    """Cache HTTP mínimo: imutável não pede; no-cache revalida; no-store baixa"""
+
+    def __init__(self, client):
+        self.client = client
+        self.entries = {}
+        self.requests = 0
+        self.bytes = 0
+
+    def get(self, url):
+        entry = self.entries.get(url)
+        if entry and 'immutable' in entry['cache_control']:
+            return
+        headers = {'If-None-Match': entry['etag']} if entry else {}
+        response = self.client.get(url, headers=headers)
+        self.requests += 1
+        self.bytes += len(response.get_data())
+        if response.status_code == 200 and 'no-store' not in response.headers.get('Cache-Control', ''):
+            self.entries[url] = {'etag': response.headers.get('ETag'),
+                                 'cache_control': response.headers.get('Cache-Control', '')}
+
+
+def main():
+    server = load_server()
+    write_sumare_sequence(server.SUMARE_DIR, count=20)
+
+    def legacy_index():
+        return send_file(os.path.join(server.STATIC_DIR, 'index.html'))
+
+    def legacy_sumare_frame(filename):
+        safe_filename = server.sanitize_filename(filename)
+        if not safe_filename:
+            return jsonify({'error': 'Nome de arquivo inválido'}), 400
+        filepath = os.path.join(server.SUMARE_DIR, safe_filename)
+        real_path = os.path.realpath(filepath)
+        if not real_path.startswith(os.path.realpath(server.SUMARE_DIR)):
+            return jsonify({'error': 'Acesso negado'}), 403
+        if os.path.exists(filepath):
+            server.mark_frame_served('sumare', safe_filename, filepath)
+            response = send_file(filepath, mimetype='image/png')
+            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+            return response
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+
+    server.app.add_url_rule('/legacy/index.html', 'legacy_index', legacy_index)
+    server.app.add_url_rule('/legacy/frame/sumare/<filename>', 'legacy_sumare_frame', legacy_sumare_frame)
+    client = server.app.test_client()
+
+    print('index.html por carga:')
+    for label, path, encoding in (('antes (send_file)', '/legacy/index.html', 'gzip, deflate, br'),
+                                  ('gzip', '/', 'gzip'), ('brotli', '/', 'gzip, deflate, br')):
+        response = client.get(path, headers={'Accept-Encoding': encoding})
+        assert response.status_code == 200
+        rate, latencies = measure(lambda: client.get(path, headers={'Accept-Encoding': encoding}), duration=1.5)
+        report(f'  {label} {len(response.get_data()) / 1024:5.1f} KB', rate, latencies)
+    etag = client.get('/', headers={'Accept-Encoding': 'br'}).headers['ETag']
+    report('  revalidação (304)', *measure(
+        lambda: client.get('/', headers={'Accept-Encoding': 'br', 'If-None-Match': etag}), duration=1.5))
+    print(f"  brotli disponível: {server.brotli is not None}; "
+          f"variantes: {sorted(server.static_assets['index.html']['bodies'])}")
+
+    listing = client.get('/api/frames/sumare').get_json()
+    name = listing['frames'][0]
+    versioned = f"/api/frame/sumare/{name}?v={listing['versions'][name]}"
+    print('frame do Sumaré por requisição:')
+    report('  antes (exists + realpath + send_file)', *measure(lambda: client.get(f'/legacy/frame/sumare/{name}'),
+                                                               duration=1.5))
+    report('  índice em memória + send_file', *measure(lambda: client.get(versioned), duration=1.5))
+    server.FRAME_ACCEL_PREFIX = '/_cache'
+    response = client.get(versioned)
+    assert response.headers['X-Accel-Redirect'] == f'/_cache/sumare/{name}' and not response.get_data()
+    report('  X-Accel-Redirect (nginx envia)', *measure(lambda: client.get(versioned), duration=1.5))
+    server.FRAME_ACCEL_PREFIX = ''
+
+    print(f'navegador abrindo o Sumaré {VISITS} vezes entre duas publicações (lista + 20 frames):')
+    for label, url_for in (('antes (no-store)', lambda n, v: f'/legacy/frame/sumare/{n}'),
+                           ('sem ?v= (no-cache + ETag)', lambda n, v: f'/api/frame/sumare/{n}'),
+                           ('?v= (imutável)', lambda n, v: f'/api/frame/sumare/{n}?v={v}')):
+        browser = BrowserCache(client)
+        for _ in range(VISITS):
+            browser.get('/api/frames/sumare')
+            versions = client.get('/api/frames/sumare').get_json()['versions']
+            for frame in listing['frames']:
+                browser.get(url_for(frame, versions[frame]))
+        print(f'  {label:<28} {browser.requests:4d} requisições  {browser.bytes / 1024:8.0f} KB')
+
+    # Publicação nova: versões mudam, URLs novas (o cache antigo não é reaproveitado por engano)
+    write_sumare_sequence(server.SUMARE_DIR, count=20, offset=1)
+    updated = client.get('/api/frames/sumare').get_json()['versions']
+    assert all(updated[frame] != listing['versions'][frame] for frame in listing['frames'])
+    stale = client.get(versioned)
+    assert stale.headers['Cache-Control'] == 'no-cache'
+
+
+if __name__ == '__main__':
+    main()
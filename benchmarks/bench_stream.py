@@ -0,0 +1,167 @@
+"""
+Teste de carga: /api/stream/frames (SSE) com centenas de clientes ociosos.
+
+Sobe o server.py no gunicorn (2 workers, como em produção) e abre CLIENTS
+conexões SSE simultâneas (asyncio, sem dependências). Com os clientes
+conectados, mede:
+- memória (RSS) e CPU dos workers com todas as conexões ociosas;
+- latência de /api/frames/mendanha enquanto isso (workers continuam livres);
+- tempo até todos os clientes receberem o evento de um frame novo gravado
+  em disco (como o sync faria, mas por "outro processo").
+
+Com workers síncronos (-k sync) cada conexão SSE prende um worker: a
+mesma carga é repetida com poucos clientes para mostrar o bloqueio.
+
+Requer gunicorn e gevent: pip install gunicorn gevent
+"""
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import cpu_seconds, free_port, load_server, percentile, rss_mb, start_gunicorn, worker_pids
+from synthetic import write_mendanha_sequence
+
+CLIENTS = 500
+IDLE_SECONDS = 10
+
+
+class StreamClient:
+    """Conexão SSE mínima: guarda o instante de chegada de cada evento"""
+
+    def __init__(self):
+        self.events = []
+        self.connected = asyncio.Event()
+
+    async def run(self, port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /api/stream/frames HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n')
+        await writer.drain()
+        status = await reader.readline()
+        if b' 200 ' not in status:
+            raise RuntimeError(status)
+        buffer = b''
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+                while b'\n\n' in buffer:
+                    block, buffer = buffer.split(b'\n\n', 1)
+                    for line in block.split(b'\n'):
+                        if line.startswith(b'event: '):
+                            name = line[7:].decode()
+                            self.events.append((name, time.perf_counter(), block))
+                            if name == 'snapshot':
+                                self.connected.set()
+        finally:
+            writer.close()
+
+
+async def http_get_latency(port, path, count=50, timeout=5.0):
+    """Latências de GETs simples (nova conexão por requisição, como o polling antigo)"""
+    latencies = []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+            await writer.drain()
+            await asyncio.wait_for(reader.read(), timeout)
+            writer.close()
+            latencies.append(time.perf_counter() - t0)
+        except asyncio.TimeoutError:
+            latencies.append(None)
+    return latencies
+
+
+async def load_test(port, master_pid, mendanha_dir, clients):
+    stream_clients = [StreamClient() for _ in range(clients)]
+    tasks = [asyncio.create_task(client.run(port)) for client in stream_clients]
+    t0 = time.perf_counter()
+    await asyncio.wait_for(asyncio.gather(*(c.connected.wait() for c in stream_clients)), 60)
+    connect_seconds = time.perf_counter() - t0
+
+    pids = worker_pids(master_pid)
+    cpu_before = cpu_seconds(pids)
+    await asyncio.sleep(IDLE_SECONDS)
+    idle_cpu = cpu_seconds(pids) - cpu_before
+    memory = rss_mb(pids)
+    latencies = await http_get_latency(port, '/api/frames/mendanha')
+
+    # Frame novo gravado por "outro processo" (o watcher de cada worker detecta)
+    latest = sorted(f for f in os.listdir(mendanha_dir) if f.endswith('.png'))[-1]
+    start = datetime.strptime(latest[4:17], '%Y%m%d-%H%M') + timedelta(minutes=5)
+    new_name = write_mendanha_sequence(mendanha_dir, count=1, seed=99, start=start)[0]
+    t_write = time.perf_counter()
+    deadline = time.time() + 10
+    while time.time() < deadline and not all(any(e[0] == 'frames' for e in c.events) for c in stream_clients):
+        await asyncio.sleep(0.05)
+    delivery = []
+    for client in stream_clients:
+        frames_events = [e for e in client.events if e[0] == 'frames']
+        if frames_events:
+            assert new_name.encode() in frames_events[0][2]
+            delivery.append(frames_events[0][1] - t_write)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return connect_seconds, idle_cpu, memory, latencies, delivery
+
+
+async def blocking_test(port, clients):
+    """Workers síncronos: quantas conexões SSE são atendidas e se a API responde"""
+    stream_clients = [StreamClient() for _ in range(clients)]
+    tasks = [asyncio.create_task(client.run(port)) for client in stream_clients]
+    await asyncio.sleep(3)
+    connected = sum(client.connected.is_set() for client in stream_clients)
+    latencies = await http_get_latency(port, '/api/frames/mendanha', count=3, timeout=3)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return connected, latencies
+
+
+def main():
+    cache_dir = tempfile.mkdtemp(prefix='radar-bench-')
+    server = load_server(cache_dir)
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=100)
+    write_mendanha_sequence(server.MENDANHA_DIR, count=20, start=start)
+
+    port = free_port()
+    gunicorn = start_gunicorn(cache_dir, port, 'gevent')
+    try:
+        connect_seconds, idle_cpu, memory, latencies, delivery = asyncio.run(
+            load_test(port, gunicorn.pid, server.MENDANHA_DIR, CLIENTS))
+    finally:
+        gunicorn.terminate()
+        gunicorn.wait()
+
+    ok = [lat for lat in latencies if lat is not None]
+    print(f'gunicorn -k gevent -w 2, {CLIENTS} conexões SSE')
+    print(f'  conexão de todos os clientes:     {connect_seconds:6.2f} s')
+    print(f'  CPU dos workers ociosos:          {idle_cpu / IDLE_SECONDS * 100:6.1f} % ({IDLE_SECONDS} s)')
+    print(f'  RSS dos 2 workers:                {memory:6.1f} MB')
+    print(f'  /api/frames/mendanha enquanto isso: p50={percentile(ok, 50) * 1000:.1f} ms  '
+          f'p99={percentile(ok, 99) * 1000:.1f} ms  ({len(ok)}/{len(latencies)} ok)')
+    print(f'  evento de frame novo:             {len(delivery)}/{CLIENTS} clientes, '
+          f'p50={percentile(delivery, 50):.2f} s  p99={percentile(delivery, 99):.2f} s  '
+          f'máx={max(delivery):.2f} s')
+
+    port = free_port()
+    gunicorn = start_gunicorn(cache_dir, port, 'sync')
+    try:
+        connected, latencies = asyncio.run(blocking_test(port, 10))
+    finally:
+        gunicorn.terminate()
+        gunicorn.wait()
+    answered = sum(lat is not None for lat in latencies)
+    print(f'gunicorn -k sync -w 2, 10 conexões SSE: {connected} conectadas, '
+          f'/api/frames/mendanha respondeu {answered}/{len(latencies)}')
+
+
+if __name__ == '__main__':
+    main()
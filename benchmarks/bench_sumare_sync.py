@@ -0,0 +1,80 @@
+"""
+Benchmark: sync do Sumaré contra um AlertaRio local lento (AlertaRioStandIn).
+
+Compara o loop sequencial antigo (requests.get por frame) com o downloader
+paralelo com sessão keep-alive e GET condicional: primeiro sync, sync sem
+mudanças (só 304) e sync com um frame novo. O comportamento (304 sem
+regravar, só o frame alterado baixado, gravação atômica) é coberto em
+tests/test_sumare_sync.py.
+"""
+import os
+import tempfile
+import time
+
+import requests
+
+from common import clear_directory, load_server
+from standins import AlertaRioStandIn
+from synthetic import write_sumare_sequence
+
+DELAY = 0.25  # segundos por requisição no servidor lento
+
+
+def legacy_sync(base_url, directory):
+    """Loop do sync_sumare original"""
+    for i in range(1, 21):
+        filename = f'radar{str(i).zfill(3)}.png'
+        response = requests.get(f'{base_url}{str(i).zfill(3)}.png', timeout=10)
+        if response.status_code == 200:
+            with open(os.path.join(directory, filename), 'wb') as f:
+                f.write(response.content)
+
+
+def main():
+    source_dir = tempfile.mkdtemp(prefix='alertario-')
+    names = write_sumare_sequence(source_dir, count=20)
+    frames = {}
+    for name in names:
+        with open(os.path.join(source_dir, name), 'rb') as f:
+            frames[name] = f.read()
+
+    standin = AlertaRioStandIn(frames, delay=DELAY).start()
+    os.environ['SUMARE_BASE_URL'] = standin.base_url
+    server = load_server()
+    clear_directory(server.SUMARE_DIR)
+
+    legacy_dir = tempfile.mkdtemp(prefix='legacy-')
+    standin.reset_stats()
+    t0 = time.perf_counter()
+    legacy_sync(standin.base_url, legacy_dir)
+    legacy_seconds = time.perf_counter() - t0
+    legacy_conns = standin.stats['connections']
+    standin.reset_stats()
+
+    server.sync_sumare()
+    first = dict(server.get_sync_state('sumare')['stats'])
+    first_conns = standin.stats['connections']
+
+    standin.reset_stats()
+    server.sync_sumare()
+    second = dict(server.get_sync_state('sumare')['stats'])
+    second_conns = standin.stats['connections']
+
+    standin.set_frame('radar020.png', frames['radar001.png'])
+    server.sync_sumare()
+    third = dict(server.get_sync_state('sumare')['stats'])
+
+    standin.stop()
+    print(f'servidor lento: {DELAY * 1000:.0f} ms por requisição, 20 frames')
+    print(f'sequencial (antigo):        {legacy_seconds:6.2f} s  '
+          f'{len(frames) * len(frames["radar001.png"]) / 1024:7.0f} KB  {legacy_conns} conexões novas')
+    print(f'paralelo, 1º sync:          {first["seconds"]:6.2f} s  '
+          f'{first["bytes"] / 1024:7.0f} KB  {first_conns} conexões novas')
+    print(f'paralelo, sem mudanças:     {second["seconds"]:6.2f} s  '
+          f'{second["bytes"] / 1024:7.0f} KB  ({second["not_modified"]} x 304, {second_conns} conexões novas)')
+    print(f'paralelo, 1 frame novo:     {third["seconds"]:6.2f} s  '
+          f'{third["bytes"] / 1024:7.0f} KB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: cadência do sync do Sumaré, fixa vs. adaptativa.
+
+Um AlertaRio local (AlertaRioStandIn) publica um frame novo a cada
+PUBLISH_EVERY segundos (a sequência de 20 frames "anda" uma posição) e
+depois fica fora do ar por OUTAGE segundos. O agendador roda como em
+produção (sync_job_loop), com os tempos em escala reduzida: polling fixo no
+mesmo intervalo da publicação vs. cadência aprendida pelo Last-Modified.
+
+Mede, após WARMUP publicações, o atraso entre a publicação e o frame novo
+estar em disco e quantas requisições o sync fez à fonte, com ela no ar e
+fora do ar. Last-Modified tem resolução de 1 s, o que soma até ~1 s ao
+atraso do modo adaptativo nesta escala (em produção é desprezível).
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from common import load_server
+from standins import AlertaRioStandIn
+from synthetic import write_sumare_sequence
+
+PUBLISH_EVERY = 8.0
+PUBLISHES = 9
+WARMUP = 3     # publicações para aprender a cadência (fora das medidas)
+OUTAGE = 40.0
+
+
+def run(adaptive, frames):
+    standin = AlertaRioStandIn({f'radar{i:03d}.png': frames[i - 1] for i in range(1, 21)}).start()
+    os.environ['SUMARE_BASE_URL'] = standin.base_url
+    server = load_server()
+
+    # Mesma lógica de produção com os tempos divididos por 15 (120 s -> 8 s)
+    server.SYNC_SCHEDULE['sumare'].update(interval=PUBLISH_EVERY, jitter=0.1, adaptive=adaptive)
+    server.CADENCE_CONFIG.update(min_interval=4, max_interval=60, margin=0.7, retry=1.3, backoff_max=40)
+
+    server.run_sync_job('sumare')
+    threading.Thread(target=server.sync_job_loop, args=('sumare',), daemon=True).start()
+
+    published = []
+    standin.reset_stats()
+    # Fase da publicação desencontrada do primeiro sync
+    time.sleep(PUBLISH_EVERY / 2)
+    for k in range(1, PUBLISHES + 1):
+        time.sleep(PUBLISH_EVERY)
+        for i in range(1, 21):
+            standin.set_frame(f'radar{i:03d}.png', frames[i - 1 + k])
+        published.append(time.time())
+        if k == WARMUP:
+            standin.reset_stats()
+    time.sleep(PUBLISH_EVERY / 2)
+    requests_up = standin.stats['requests']
+
+    standin.reset_stats()
+    standin.down = True
+    time.sleep(OUTAGE)
+    requests_down = standin.stats['requests']
+
+    rows = server.state_query("SELECT available FROM freshness WHERE radar = 'sumare' ORDER BY available")
+    lags = []
+    for (available,) in rows:
+        previous = [t for t in published if t <= available]
+        if len(previous) > WARMUP:
+            lags.append(available - previous[-1])
+    standin.stop()
+    return lags, requests_up, requests_down, server.get_cadence('sumare')['interval']
+
+
+def main():
+    source_dir = tempfile.mkdtemp(prefix='alertario-')
+    names = write_sumare_sequence(source_dir, count=20 + PUBLISHES)
+    frames = []
+    for name in names:
+        with open(os.path.join(source_dir, name), 'rb') as f:
+            frames.append(f.read())
+
+    print(f'publicação a cada {PUBLISH_EVERY:.0f} s ({PUBLISHES}x, {WARMUP} de aquecimento), '
+          f'depois {OUTAGE:.0f} s fora do ar')
+    # Um processo novo por modo: cada um com seu CACHE_DIR e seu agendador
+    context = multiprocessing.get_context('spawn')
+    for adaptive in (False, True):
+        with context.Pool(1) as pool:
+            lags, requests_up, requests_down, interval = pool.apply(run, (adaptive, frames))
+        label = 'adaptativa' if adaptive else 'fixa'
+        mean = sum(lags) / len(lags) if lags else float('nan')
+        worst = max(lags) if lags else float('nan')
+        print(f'{label:<11} frames novos: {len(lags)}  atraso médio {mean:5.2f} s  máx {worst:5.2f} s  '
+              f'requisições: {requests_up:4d} no ar, {requests_down:3d} fora do ar'
+              + (f'  (intervalo aprendido: {interval:.0f} s)' if adaptive and interval else ''))
+
+
+if __name__ == '__main__':
+    main()
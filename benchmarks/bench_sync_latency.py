@@ -0,0 +1,133 @@
+"""
+Benchmark: latência da API no gunicorn (gevent, 1 worker) com o sync ligado.
+
+Antes: o sync rodava dentro do worker líder (thread = greenlet com o monkey
+patch do gevent), com NumPy/PIL e flocks bloqueantes no hub do worker.
+Reproduzido com SYNC_ENABLED=0 e o sync manual, que nesse modo roda no
+próprio worker.
+Depois: SYNC_ENABLED=1; o worker líder sobe o processo de sync
+(server.py --sync) e /api/sync só antecipa o job (202).
+
+Em cada modo, ROUNDS publicações: o AlertaRio local (standins.py) troca os
+20 frames do Sumaré, o sync é disparado por /api/sync/sumare e um cliente
+mede /api/frames/sumare a cada 50 ms até o sync terminar.
+
+Requer gunicorn e gevent: pip install gunicorn gevent
+"""
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+from common import free_port, load_server, percentile, start_gunicorn
+from standins import AlertaRioStandIn
+from synthetic import write_sumare_sequence
+
+FRAMES = 20
+ROUNDS = 4
+SYNC_TIMEOUT = 120
+
+
+def read_frames(directory, names):
+    frames = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as f:
+            frames.append(f.read())
+    return frames
+
+
+def publish(alertario, frames, offset):
+    """A sequência do AlertaRio anda `offset` frames: os 20 slots mudam de conteúdo"""
+    for i in range(FRAMES):
+        alertario.set_frame(f'radar{str(i + 1).zfill(3)}.png', frames[offset + i])
+
+
+def wait_sync(server, previous):
+    """Espera o sync do Sumaré registrar um last_sync diferente de `previous`"""
+    deadline = time.time() + SYNC_TIMEOUT
+    while time.time() < deadline:
+        last_sync = server.get_sync_state('sumare')['last_sync']
+        if last_sync != previous and not server.sync_in_progress('sumare'):
+            return last_sync
+        time.sleep(0.1)
+    raise RuntimeError('sync do Sumaré não terminou')
+
+
+def trigger_sync(session, base, server):
+    """Dispara /api/sync/sumare e espera o fim (200 no worker, 202 no processo de sync)"""
+    previous = server.get_sync_state('sumare')['last_sync']
+    while True:
+        response = session.get(f'{base}/api/sync/sumare', timeout=SYNC_TIMEOUT)
+        if response.status_code != 409:
+            break
+        # O processo de sync já estava rodando o job por conta própria
+        previous = wait_sync(server, previous)
+    assert response.status_code in (200, 202), response.status_code
+    wait_sync(server, previous)
+    return response.status_code
+
+
+def run_mode(label, server, cache_dir, alertario, frames, offset, sync_enabled):
+    port = free_port()
+    env = {'SYNC_ENABLED': '1' if sync_enabled else '0', 'SUMARE_BASE_URL': alertario.base_url}
+    process = start_gunicorn(cache_dir, port, 'gevent', workers=1, env=env)
+    base = f'http://127.0.0.1:{port}'
+    admin = requests.Session()
+    admin.headers['X-Admin-Token'] = server.ADMIN_TOKEN
+    try:
+        if sync_enabled:
+            # Primeira execução do processo de sync (após o jitter inicial)
+            wait_sync(server, server.get_sync_state('sumare')['last_sync'])
+        else:
+            trigger_sync(admin, base, server)
+
+        session = requests.Session()
+        latencies, durations, codes = [], [], set()
+        for round_offset in range(offset, offset + ROUNDS):
+            publish(alertario, frames, round_offset)
+            done = threading.Event()
+
+            def sync():
+                t0 = time.perf_counter()
+                codes.add(trigger_sync(admin, base, server))
+                durations.append(time.perf_counter() - t0)
+                done.set()
+
+            syncer = threading.Thread(target=sync)
+            syncer.start()
+            while not done.is_set():
+                t1 = time.perf_counter()
+                session.get(f'{base}/api/frames/sumare', timeout=SYNC_TIMEOUT)
+                latencies.append(time.perf_counter() - t1)
+                time.sleep(0.05)
+            syncer.join()
+        print(f'  {label:<28} sync p50={percentile(durations, 50):5.1f} s   '
+              f'/api/frames/sumare p50={percentile(latencies, 50) * 1000:7.1f} ms   '
+              f'p99={percentile(latencies, 99) * 1000:7.1f} ms   max={max(latencies) * 1000:7.1f} ms   '
+              f'({len(latencies)} requisições, /api/sync {"/".join(map(str, sorted(codes)))})')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    source_dir = tempfile.mkdtemp(prefix='alertario-')
+    t0 = time.perf_counter()
+    frames = read_frames(source_dir, write_sumare_sequence(source_dir, count=FRAMES + 2 * ROUNDS))
+    print(f'{len(frames)} frames sintéticos em {time.perf_counter() - t0:.1f} s')
+
+    alertario = AlertaRioStandIn().start()
+    publish(alertario, frames, 0)
+    cache_dir = tempfile.mkdtemp(prefix='radar-bench-')
+    server = load_server(cache_dir)
+
+    print(f'gunicorn gevent, 1 worker: /api/frames/sumare durante {ROUNDS} syncs do Sumaré (20 frames novos cada)')
+    run_mode('sync no worker (antes)', server, cache_dir, alertario, frames, 1, sync_enabled=False)
+    run_mode('processo de sync (depois)', server, cache_dir, alertario, frames, 1 + ROUNDS, sync_enabled=True)
+    alertario.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark: pirâmide de tiles XYZ (/api/tiles/<radar>/<frame>/{z}/{x}/{y}.png)
+
+Antes: o Leaflet usa um L.imageOverlay por frame, então o celular baixa os
+20 PNGs de 1024x1024 inteiros em qualquer zoom.
+Depois: cada frame é cortado uma vez no sync (zooms 5 a 8, um pacote por
+frame, no pool de processos); o L.tileLayer do player pede só os tiles
+visíveis no zoom certo e tiles vazios voltam como 204.
+
+Mede o corte dos 20 frames no sync (update_tiles), confere pixels dos
+tiles contra a origem (posição calculada pela projeção inversa,
+independente do corte), bytes e requisições de um celular vendo os 20
+frames em zooms diferentes e req/s da rota.
+"""
+import math
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from common import load_server, measure, report
+from synthetic import write_mendanha_sequence
+
+VIEWPORT = (390, 844)     # px CSS de um celular
+CENTER = (-22.9, -43.2)   # Rio de Janeiro
+SAMPLES = 2000
+
+
+def tile_of(lat, lng, zoom, size=256):
+    """Pixel global (x, y) de uma coordenada no zoom"""
+    world = size * 2 ** zoom
+    x = (lng + 180) / 360 * world
+    y = (1 - math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) / math.pi) / 2 * world
+    return x, y
+
+
+def visible_tiles(server, zoom):
+    """Tiles que o L.tileLayer pede (minNativeZoom/maxNativeZoom e bounds) para o viewport no zoom do mapa"""
+    config = server.TILE_CONFIG
+    (south, west), (north, east) = server.RADAR_BOUNDS['mendanha']
+    tile_zoom = min(max(zoom, config['min_zoom']), config['max_zoom'])
+    scale = 2 ** (zoom - tile_zoom)
+    cx, cy = tile_of(*CENTER, tile_zoom)
+    half_w, half_h = VIEWPORT[0] / 2 / scale, VIEWPORT[1] / 2 / scale
+    size = config['size']
+    left, top = tile_of(north, west, tile_zoom)
+    right, bottom = tile_of(south, east, tile_zoom)
+    return [(tile_zoom, x, y)
+            for x in range(int(max(cx - half_w, left) // size), int(min(cx + half_w, right) // size) + 1)
+            for y in range(int(max(cy - half_h, top) // size), int(min(cy + half_h, bottom) // size) + 1)]
+
+
+def check_pixels(server, client, name, rng):
+    """Pixels de tiles sorteados vs. o pixel da origem sob o centro do pixel do tile"""
+    (south, west), (north, east) = server.RADAR_BOUNDS['mendanha']
+    source = np.asarray(Image.open(os.path.join(server.MENDANHA_DIR, name)).convert('RGBA'))
+    height, width = source.shape[:2]
+    top, bottom = server.mercator_y(north), server.mercator_y(south)
+    tiles = {}
+    checked = mismatched = 0
+    for _ in range(SAMPLES):
+        zoom = int(rng.integers(server.TILE_CONFIG['min_zoom'], server.TILE_CONFIG['max_zoom'] + 1))
+        lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+        gx, gy = tile_of(lat, lng, zoom)
+        key = (zoom, int(gx // 256), int(gy // 256))
+        if key not in tiles:
+            response = client.get(f'/api/tiles/mendanha/{name}/{key[0]}/{key[1]}/{key[2]}.png')
+            tiles[key] = None if response.status_code == 204 else np.asarray(Image.open(BytesIO(response.get_data())))
+        px, py = int(gx) % 256, int(gy) % 256
+        # Centro do pixel do tile -> longitude/latitude (projeção inversa) -> pixel da origem
+        world = 256 * 2 ** zoom
+        center_lng = (int(gx) + 0.5) / world * 360 - 180
+        center_y = math.pi * (1 - 2 * (int(gy) + 0.5) / world)
+        col = math.floor((center_lng - west) / (east - west) * width)
+        row = math.floor((top - center_y) / (top - bottom) * height)
+        if not (0 <= col < width and 0 <= row < height):
+            continue
+        expected = source[row, col]
+        actual = np.zeros(4, dtype=np.uint8) if tiles[key] is None else tiles[key][py, px]
+        checked += 1
+        mismatched += int(not np.array_equal(expected, actual) and (expected[3] or actual[3]))
+    return checked, mismatched, len(tiles)
+
+
+def main():
+    server = load_server()
+    names = write_mendanha_sequence(server.MENDANHA_DIR, count=20)
+    client = server.app.test_client()
+    index = server.get_frame_index('mendanha')
+
+    # Corte no sync: os frames listados, no pool de processos
+    t0 = time.perf_counter()
+    built = server.update_tiles('mendanha')
+    elapsed = time.perf_counter() - t0
+    entry = index['by_name'][names[-1]]
+    pack = server.tile_pack_path('mendanha', entry['sha1'])
+    tiles = server.read_tile_index(pack)
+    per_zoom = {}
+    for z, x, y in tiles:
+        per_zoom[z] = per_zoom.get(z, 0) + 1
+    png_size = os.path.getsize(os.path.join(server.MENDANHA_DIR, names[-1]))
+    print(f"corte no sync ({server.EXPORT_CONFIG['processes']} processos): {built} frames em {elapsed:.2f} s "
+          f'({elapsed / built * 1000:.0f} ms/frame)   pacote {os.path.getsize(pack) / 1024:.0f} KB '
+          f'(frame {png_size / 1024:.0f} KB)')
+    print('  tiles com conteúdo por zoom: ' + '   '.join(f'z{z}: {n}' for z, n in sorted(per_zoom.items())))
+
+    checked, mismatched, fetched = check_pixels(server, client, names[-1], np.random.default_rng(1))
+    print(f'pixels conferidos: {checked} em {fetched} tiles, {mismatched} diferentes da origem')
+
+    # Celular vendo a animação (20 frames) em cada zoom do mapa
+    print(f'celular {VIEWPORT[0]}x{VIEWPORT[1]} em {CENTER}, 20 frames:')
+    overlay = sum(os.path.getsize(os.path.join(server.MENDANHA_DIR, name)) for name in names)
+    print(f"  {'imageOverlay (qualquer zoom)':<30} {len(names):4d} requisições  {overlay / 1024:7.0f} KB")
+    for zoom in (6, 8, 10, 12):
+        keys = visible_tiles(server, zoom)
+        requests_count = empties = size = 0
+        for name in names:
+            for z, x, y in keys:
+                response = client.get(f'/api/tiles/mendanha/{name}/{z}/{x}/{y}.png')
+                requests_count += 1
+                empties += response.status_code == 204
+                size += len(response.get_data())
+        print(f'  {f"tiles, zoom {zoom} (z{keys[0][0]})":<30} {requests_count:4d} requisições  {size / 1024:7.0f} KB'
+              f'   ({empties} vazios: 204)')
+
+    z, x, y = sorted(tiles)[len(tiles) // 2]
+    full = f'/api/tiles/mendanha/{names[-1]}/{z}/{x}/{y}.png'
+    empty = f'/api/tiles/mendanha/{names[-1]}/8/0/0.png'
+    report('/api/frame/mendanha (PNG inteiro)', *measure(lambda: client.get(f'/api/frame/mendanha/{names[-1]}'),
+                                                          duration=1.5))
+    report('/api/tiles (tile com conteúdo)', *measure(lambda: client.get(full), duration=1.5))
+    report('/api/tiles (vazio, 204)', *measure(lambda: client.get(empty), duration=1.5))
+
+
+if __name__ == '__main__':
+    main()
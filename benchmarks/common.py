@@ -0,0 +1,121 @@
+"""Utilitários compartilhados pelos benchmarks"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_server(cache_dir=None, sync_enabled=False):
+    """
+    Importa server.py usando um CACHE_DIR temporário e, por padrão, com o
+    agendador de sync desligado (os benchmarks chamam o sync explicitamente).
+    Sem FTP_PASSWORD o sync do Mendanha não acessa o FTP real.
+    """
+    cache_dir = cache_dir or tempfile.mkdtemp(prefix='radar-bench-')
+    os.environ['CACHE_DIR'] = cache_dir
+    os.environ['SYNC_ENABLED'] = '1' if sync_enabled else '0'
+    os.environ.setdefault('FTP_PASSWORD', '')
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    import server
+    # Benchmarks não devem ser limitados pelo rate limit
+    for limit_type in server.RATE_LIMIT_MAX_REQUESTS:
+        server.RATE_LIMIT_MAX_REQUESTS[limit_type] = 10 ** 9
+    return server
+
+
+def create_app():
+    """Fábrica usada pelo gunicorn (common:create_app())"""
+    return load_server(os.environ['CACHE_DIR'], sync_enabled=os.environ.get('SYNC_ENABLED') == '1').app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(cache_dir, port, worker_class, workers=2, env=None):
+    """
+    Sobe o server.py no gunicorn sobre `cache_dir`. Por padrão com o sync
+    desligado nos workers; `env` sobrepõe variáveis (ex.: SYNC_ENABLED='1').
+    """
+    overrides = env or {}
+    env = dict(os.environ, CACHE_DIR=cache_dir, SYNC_ENABLED='0', FTP_PASSWORD='')
+    env.update(overrides)
+    args = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-k', worker_class, '-b', f'127.0.0.1:{port}',
+            '--worker-connections', '2000', '--timeout', '120', '--log-level', 'warning',
+            '--chdir', os.path.dirname(os.path.abspath(__file__)), 'common:create_app()']
+    process = subprocess.Popen(args, env=env, cwd=ROOT_DIR)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            time.sleep(1)  # workers terminando de importar
+            return process
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn não subiu')
+
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def rss_mb(pids):
+    total = 0
+    for pid in pids:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1])
+    return total / 1024
+
+
+def cpu_seconds(pids):
+    ticks = 0
+    for pid in pids:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks += int(fields[11]) + int(fields[12])
+    return ticks / os.sysconf('SC_CLK_TCK')
+
+
+def clear_directory(directory):
+    """Remove todos os arquivos de um diretório de cache"""
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def measure(fn, duration=3.0, min_runs=5):
+    """Executa fn repetidamente por `duration` segundos e retorna (execuções/s, latências)"""
+    latencies = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration or len(latencies) < min_runs:
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies
+
+
+def percentile(values, p):
+    """Percentil simples (p em 0..100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def report(name, rate, latencies):
+    print(f'{name:<40} {rate:>10.1f} req/s   '
+          f'p50={percentile(latencies, 50) * 1000:7.2f} ms   '
+          f'p99={percentile(latencies, 99) * 1000:7.2f} ms')
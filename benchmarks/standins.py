@@ -0,0 +1,339 @@
+"""
+Servidores locais que imitam as fontes de dados dos radares.
+
+AlertaRioStandIn: HTTP com /upload/Mapa/semfundo/radarNNN.png, ETag,
+Last-Modified, 304, atraso configurável por requisição (servidor lento) e
+servidor fora do ar (503).
+
+FTPStandIn: FTP mínimo (USER/PASS/CWD/PASV/NLST/MLSD/SIZE/REST/RETR) do
+INEA, com falhas simuladas: queda de todas as sessões, servidor fora do ar
+e transferências interrompidas no meio.
+
+WebhookStandIn: receptor HTTP dos alertas (ALERT_SINKS=webhook), que guarda
+os eventos recebidos e pode responder 500 às próximas N requisições.
+"""
+import hashlib
+import json
+import socket
+import socketserver
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUMARE_PATH = '/upload/Mapa/semfundo/radar'
+
+
+class AlertaRioStandIn:
+    """Imita o AlertaRio. `frames` mapeia 'radar001.png' -> bytes."""
+
+    def __init__(self, frames=None, delay=0.0):
+        self.frames = {}
+        self.delay = delay
+        self.down = False         # True: responde 503 a tudo
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'ok': 0, 'not_modified': 0, 'not_found': 0, 'connections': 0}
+        for name, content in (frames or {}).items():
+            self.set_frame(name, content)
+
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def setup(self):
+                super().setup()
+                with standin.lock:
+                    standin.stats['connections'] += 1
+
+            def do_GET(self):
+                with standin.lock:
+                    standin.stats['requests'] += 1
+                if standin.delay:
+                    time.sleep(standin.delay)
+                if standin.down:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                name = self.path.rsplit('/', 1)[-1]
+                name = name if name.startswith('radar') else f'radar{name}'
+                with standin.lock:
+                    entry = standin.frames.get(name) if self.path.startswith(SUMARE_PATH) else None
+                if entry is None:
+                    with standin.lock:
+                        standin.stats['not_found'] += 1
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                content, etag, last_modified = entry
+                if self.headers.get('If-None-Match') == etag:
+                    with standin.lock:
+                        standin.stats['not_modified'] += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+
+                with standin.lock:
+                    standin.stats['ok'] += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(content)))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        """Prefixo no formato de SUMARE_CONFIG['base_url']"""
+        host, port = self.server.server_address
+        return f'http://{host}:{port}{SUMARE_PATH}'
+
+    def set_frame(self, name, content):
+        etag = '"%s"' % hashlib.md5(content).hexdigest()
+        with self.lock:
+            self.frames[name] = (content, etag, formatdate(usegmt=True))
+
+    def reset_stats(self):
+        with self.lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WebhookStandIn:
+    """Recebe POSTs JSON em qualquer caminho; `events` guarda os recebidos em ordem."""
+
+    def __init__(self):
+        self.events = []
+        self.fail_next = 0        # próximas N requisições respondem 500
+        self.lock = threading.Lock()
+        self.received = threading.Condition(self.lock)
+        self.stats = {'requests': 0, 'failed': 0}
+
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with standin.received:
+                    standin.stats['requests'] += 1
+                    failed = standin.fail_next > 0
+                    if failed:
+                        standin.fail_next -= 1
+                        standin.stats['failed'] += 1
+                    else:
+                        standin.events.append(json.loads(body))
+                        standin.received.notify_all()
+                self.send_response(500 if failed else 204)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}/alertas'
+
+    def wait_for(self, count, timeout=10):
+        """Espera até ter recebido `count` eventos; retorna os recebidos"""
+        with self.received:
+            self.received.wait_for(lambda: len(self.events) >= count, timeout)
+            return list(self.events)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FTPStandIn:
+    """Imita o FTP do INEA. `files` mapeia nome -> bytes."""
+
+    def __init__(self, files=None, user='inea', password='secret', mlsd=True, latency=0.0):
+        self.files = dict(files or {})
+        self.latency = latency    # atraso por comando (simula o RTT até o INEA)
+        self.user = user
+        self.password = password
+        self.mlsd = mlsd
+        self.down = False
+        self.truncate_next = {}   # nome -> bytes enviados antes de derrubar a transferência
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.stats = {'connections': 0, 'logins': 0, 'retr': 0, 'rest': 0, 'list': 0, 'bytes': 0}
+
+        standin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f'{line}\r\n'.encode())
+
+            def handle(self):
+                if standin.down:
+                    return
+                # Respostas curtas em sequência (150 + 226) não devem esperar o ACK atrasado
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with standin.lock:
+                    standin.stats['connections'] += 1
+                    standin.sessions.add(self.connection)
+                try:
+                    self.session()
+                except OSError:
+                    pass
+                finally:
+                    with standin.lock:
+                        standin.sessions.discard(self.connection)
+
+            def open_data(self):
+                conn, _ = self.pasv.accept()
+                self.pasv.close()
+                self.pasv = None
+                return conn
+
+            def session(self):
+                self.pasv = None
+                rest = 0
+                logged = False
+                time.sleep(standin.latency)
+                self.reply('220 FTPStandIn')
+                for raw in self.rfile:
+                    time.sleep(standin.latency)
+                    line = raw.decode().strip()
+                    cmd, _, arg = line.partition(' ')
+                    cmd = cmd.upper()
+                    if cmd == 'USER':
+                        self.reply('331 Password required')
+                    elif cmd == 'PASS':
+                        logged = arg == standin.password
+                        if logged:
+                            with standin.lock:
+                                standin.stats['logins'] += 1
+                        self.reply('230 Logged in' if logged else '530 Login incorrect')
+                    elif not logged:
+                        self.reply('530 Not logged in')
+                    elif cmd in ('CWD', 'TYPE', 'NOOP'):
+                        self.reply('200 OK')
+                    elif cmd == 'OPTS':
+                        self.reply('200 OK' if standin.mlsd else '501 Not supported')
+                    elif cmd == 'PASV':
+                        self.pasv = socket.socket()
+                        self.pasv.bind(('127.0.0.1', 0))
+                        self.pasv.listen(1)
+                        port = self.pasv.getsockname()[1]
+                        self.reply(f'227 Entering Passive Mode (127,0,0,1,{port >> 8},{port & 255})')
+                    elif cmd == 'SIZE':
+                        content = standin.files.get(arg)
+                        self.reply(f'213 {len(content)}' if content is not None else '550 Not found')
+                    elif cmd == 'REST':
+                        rest = int(arg)
+                        with standin.lock:
+                            standin.stats['rest'] += 1
+                        self.reply(f'350 Restarting at {rest}')
+                    elif cmd in ('NLST', 'MLSD'):
+                        if cmd == 'MLSD' and not standin.mlsd:
+                            self.reply('500 Unknown command')
+                            continue
+                        with standin.lock:
+                            standin.stats['list'] += 1
+                            names = sorted(standin.files)
+                        self.reply('150 Listing')
+                        if cmd == 'MLSD':
+                            entries = [f'type=file;size={len(standin.files[name])}; {name}' for name in names]
+                        else:
+                            entries = names
+                        data = self.open_data()
+                        data.sendall(''.join(f'{entry}\r\n' for entry in entries).encode())
+                        data.close()
+                        self.reply('226 Done')
+                    elif cmd == 'RETR':
+                        content = standin.files.get(arg)
+                        if content is None:
+                            self.reply('550 Not found')
+                            continue
+                        with standin.lock:
+                            standin.stats['retr'] += 1
+                            cut = standin.truncate_next.pop(arg, None)
+                        self.reply('150 Opening data connection')
+                        data = self.open_data()
+                        payload = content[rest:]
+                        rest = 0
+                        if cut is not None:
+                            data.sendall(payload[:cut])
+                            data.close()
+                            with standin.lock:
+                                standin.stats['bytes'] += cut
+                            self.reply('426 Connection closed; transfer aborted')
+                            continue
+                        data.sendall(payload)
+                        data.close()
+                        with standin.lock:
+                            standin.stats['bytes'] += len(payload)
+                        self.reply('226 Transfer complete')
+                    elif cmd == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Not implemented')
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.server.allow_reuse_address = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def drop_sessions(self):
+        """Derruba todas as sessões de controle abertas (simula queda do link)"""
+        with self.lock:
+            sessions = list(self.sessions)
+        for conn in sessions:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def reset_stats(self):
+        with self.lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.drop_sessions()
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,136 @@
+"""
+Gerador de frames sintéticos de radar (1024x1024) para benchmarks.
+
+As cores seguem a legenda dos radares (mesmas faixas usadas por
+isRainPixel no index.html): azul/ciano para umidade e verde -> magenta
+para intensidades crescentes de chuva. Inclui uma legenda no canto
+superior esquerdo, como nas imagens reais do Mendanha.
+"""
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image
+
+SIZE = 1024
+
+# Cores por classe de intensidade (1..6) e de umidade
+RAIN_COLORS = [
+    (0, 255, 0),      # 1 - verde claro
+    (0, 150, 0),      # 2 - verde escuro
+    (255, 255, 0),    # 3 - amarelo
+    (255, 150, 0),    # 4 - laranja
+    (255, 0, 0),      # 5 - vermelho
+    (255, 0, 255),    # 6 - magenta
+]
+HUMIDITY_COLORS = [
+    (0, 60, 200),     # azul escuro
+    (0, 200, 255),    # ciano
+]
+
+
+def make_cells(rng, count=12, size=SIZE):
+    """Sorteia células de chuva: (cx, cy, raio, pico de intensidade)"""
+    cells = []
+    for _ in range(count):
+        cx = rng.uniform(250, size - 50)
+        cy = rng.uniform(50, size - 50)
+        radius = rng.uniform(20, 90)
+        peak = int(rng.integers(1, 7))
+        cells.append((cx, cy, radius, peak))
+    return cells
+
+
+def render_frame(cells, shift=(0.0, 0.0), size=SIZE, rng=None):
+    """
+    Desenha um frame RGBA com as células deslocadas por `shift` pixels.
+    Cada célula é um degradê radial: umidade na borda e o pico no centro.
+    """
+    rng = rng or np.random.default_rng(0)
+    data = np.zeros((size, size, 4), dtype=np.uint8)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32)
+
+    for cx, cy, radius, peak in cells:
+        cx += shift[0]
+        cy += shift[1]
+        noise = rng.normal(1.0, 0.08, size=(size, size)).astype(np.float32)
+        dist = np.hypot(xx - cx, yy - cy) / radius * noise
+
+        halo = (dist < 1.6) & (data[:, :, 3] == 0)
+        data[halo, :3] = HUMIDITY_COLORS[int(cx) % 2]
+        data[halo, 3] = 255
+
+        for level in range(1, peak + 1):
+            ring = dist < (1.0 - (level - 1) / (peak + 1))
+            data[ring, :3] = RAIN_COLORS[level - 1]
+            data[ring, 3] = 255
+
+    # Legenda (x < 200, y < 500)
+    for i, color in enumerate(HUMIDITY_COLORS + RAIN_COLORS):
+        data[20 + i * 55:60 + i * 55, 20:60, :3] = color
+        data[20 + i * 55:60 + i * 55, 20:60, 3] = 255
+
+    return Image.fromarray(data, 'RGBA')
+
+
+def to_paletted(img):
+    """
+    Converte um frame RGBA para modo P sem perder cores: uma entrada de paleta
+    por cor distinta e a transparência no chunk tRNS (como radares que
+    publicam PNG indexado).
+    """
+    data = np.ascontiguousarray(np.asarray(img.convert('RGBA')))
+    colors, indices = np.unique(data.view(np.uint32).reshape(-1), return_inverse=True)
+    assert len(colors) <= 256, 'mais de 256 cores'
+    rgba = colors.view(np.uint8).reshape(-1, 4)
+    paletted = Image.fromarray(indices.reshape(data.shape[:2]).astype(np.uint8), 'P')
+    paletted.putpalette(rgba[:, :3].reshape(-1).tolist())
+    paletted.info['transparency'] = rgba[:, 3].tobytes()
+    return paletted
+
+
+def save_atomic(img, path):
+    """Grava como o sync faz (temporário + rename), mudando o mtime do diretório"""
+    tmp_path = f'{path}.tmp'
+    img.save(tmp_path, format='PNG')
+    os.replace(tmp_path, path)
+
+
+def write_mendanha_sequence(directory, count=20, seed=42, start=None, step_minutes=5,
+                            palette=False):
+    """
+    Grava `count` frames MDN-YYYYMMDD-HHMM.png em `directory` com células
+    se movendo ~6 px por frame. Retorna a lista de nomes (ordem cronológica).
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    cells = make_cells(rng)
+    start = start or datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=step_minutes * count)
+    names = []
+    for i in range(count):
+        img = render_frame(cells, shift=(6.0 * i, -3.0 * i), rng=np.random.default_rng(seed + i))
+        if palette:
+            img = to_paletted(img)
+        name = (start + timedelta(minutes=step_minutes * i)).strftime('MDN-%Y%m%d-%H%M.png')
+        save_atomic(img, os.path.join(directory, name))
+        names.append(name)
+    return names
+
+
+def write_sumare_sequence(directory, count=20, seed=7, offset=0):
+    """
+    Grava radar001.png .. radarNNN.png em `directory`.
+    Com offset=k, radar001 recebe o conteúdo que era do frame k+1 (como o
+    AlertaRio faz a cada atualização: a sequência "anda" e o último é novo).
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    cells = make_cells(rng)
+    names = []
+    for i in range(count):
+        step = i + offset
+        img = render_frame(cells, shift=(-4.0 * step, 5.0 * step), rng=np.random.default_rng(seed + step))
+        name = f'radar{str(i + 1).zfill(3)}.png'
+        save_atomic(img, os.path.join(directory, name))
+        names.append(name)
+    return names
@@ -1,16 +1,41 @@
-from flask import Flask, jsonify, send_file, Response, request
+from flask import Flask, jsonify, send_file, Response, request, g
 from flask_cors import CORS
 import os
 import re
+import sys
+import _thread
+import json
+import math
 import ftplib
+import bisect
+import fcntl
+import random
+import sqlite3
+import subprocess
 import threading
 import time
+import hashlib
+import gzip
+import mmap
+import struct
+import zlib
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 from io import BytesIO
 from functools import wraps
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFont, features
 import numpy as np
+try:
+    import brotli  # Opcional: variantes .br das páginas estáticas
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
@@ -35,14 +60,22 @@ CORS(app, resources={
 # Token para endpoints administrativos (gere um novo com: python -c "import secrets; print(secrets.token_hex(32))")
 ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', 'cor_rio_radar_2024_token_seguro')
 
-# Rate limiting simples (em memória)
-rate_limit_store = {}
+# Rate limiting por token bucket: cada chave (IP + tipo) tem até N fichas,
+# repostas continuamente à taxa de N por janela
 RATE_LIMIT_WINDOW = 60  # segundos
 RATE_LIMIT_MAX_REQUESTS = {
     'gif': 10,      # 10 GIFs por minuto
     'sync': 5,      # 5 syncs por minuto
+    'tiles': 5000,  # O player pede os tiles visíveis de cada frame da animação
     'default': 500  # 500 requests por minuto (aumentado para DEV)
 }
+# 'memory': buckets por processo (com gunicorn -w N o limite efetivo é N vezes maior)
+# 'shared': buckets no state.db, o mesmo limite para todos os workers
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_MAX_KEYS = 10000  # buckets em memória (LRU)
+rate_limit_store = OrderedDict()  # chave -> (fichas, último acesso)
+rate_limit_lock = threading.Lock()
+rate_limit_cleanup = {'last': 0.0}
 
 # ============================================
 # CONFIGURAÇÃO DE DIRETÓRIOS
@@ -51,85 +84,3273 @@ RATE_LIMIT_MAX_REQUESTS = {
 CACHE_DIR = os.environ.get('CACHE_DIR', '/var/www/radar-nowcast/cache')
 MENDANHA_DIR = os.path.join(CACHE_DIR, 'mendanha')
 SUMARE_DIR = os.path.join(CACHE_DIR, 'sumare')
+COMPOSITE_DIR = os.path.join(CACHE_DIR, 'composite')
 EXPORT_DIR = os.path.join(CACHE_DIR, 'exports')
+TILES_DIR = os.path.join(CACHE_DIR, 'tiles')
 
 os.makedirs(MENDANHA_DIR, exist_ok=True)
 os.makedirs(SUMARE_DIR, exist_ok=True)
+os.makedirs(COMPOSITE_DIR, exist_ok=True)
 os.makedirs(EXPORT_DIR, exist_ok=True)
+os.makedirs(TILES_DIR, exist_ok=True)
+
+# 'composite' é o mosaico dos dois radares, gerado pelo servidor (ver update_composite)
+RADAR_DIRS = {'mendanha': MENDANHA_DIR, 'sumare': SUMARE_DIR, 'composite': COMPOSITE_DIR}
+COMPOSITE_SOURCES = ['mendanha', 'sumare']
+# Limites geográficos dos frames [[sul, oeste], [norte, leste]], os mesmos do
+# overlay no mapa (RADAR_CONFIG em mosaic.html)
+RADAR_BOUNDS = {
+    'mendanha': [[-24.8, -46.5], [-20.8, -40.5]],
+    'sumare': [[-24.431567, -45.336972], [-21.478793, -41.159092]]
+}
+# Grade do mosaico: a união das áreas dos radares
+RADAR_BOUNDS['composite'] = [
+    [min(RADAR_BOUNDS[radar][0][0] for radar in COMPOSITE_SOURCES), min(RADAR_BOUNDS[radar][0][1] for radar in COMPOSITE_SOURCES)],
+    [max(RADAR_BOUNDS[radar][1][0] for radar in COMPOSITE_SOURCES), max(RADAR_BOUNDS[radar][1][1] for radar in COMPOSITE_SOURCES)]
+]
+
+# ============================================
+# CREDENCIAIS VIA VARIÁVEIS DE AMBIENTE
+# ============================================
+
+FTP_CONFIG = {
+    'host': os.environ.get('FTP_HOST', '82.180.153.43'),
+    'port': int(os.environ.get('FTP_PORT', '21')),
+    'user': os.environ.get('FTP_USER', 'u109222483.CorInea'),
+    'password': os.environ.get('FTP_PASSWORD', ''),  # OBRIGATÓRIO definir via ambiente
+    'path': '/',
+    'pattern': r'MDN-.*\.png$',
+    'timeout': 30,
+    'backoff_base': 5,      # segundos; dobra a cada falha de conexão
+    'backoff_max': 600
+}
+
+SUMARE_CONFIG = {
+    'base_url': os.environ.get('SUMARE_BASE_URL', 'https://alertario.rio.rj.gov.br/upload/Mapa/semfundo/radar'),
+    'frames': 20,
+    'workers': 6,           # Downloads simultâneos (limitado para não sobrecarregar o AlertaRio)
+    'timeout': (5, 10)      # (conexão, leitura) em segundos
+}
+
+# Verificar se a senha foi configurada
+if not FTP_CONFIG['password']:
+    print("⚠️  AVISO: FTP_PASSWORD não configurada. Defina a variável de ambiente.")
+
+MAX_HOURS = 24
+
+# Agendamento do sync: cada radar roda em sua própria thread, com jitter.
+# Nos radares, 'interval' é só o palpite inicial: a cadência é aprendida (CADENCE_CONFIG)
+SYNC_ENABLED = os.environ.get('SYNC_ENABLED', '1') == '1'
+SYNC_SCHEDULE = {
+    'mendanha': {'interval': 120, 'jitter': 10, 'adaptive': True},
+    'sumare': {'interval': 120, 'jitter': 10, 'adaptive': True},
+    'exports': {'interval': 300, 'jitter': 30, 'adaptive': False},
+    'history': {'interval': 3600, 'jitter': 120, 'adaptive': False}
+}
+SYNC_LEADER_RETRY = 30  # segundos entre tentativas de assumir a liderança
+SYNC_PROCESS_CHECK = 5  # segundos entre verificações do processo de sync pelo worker líder
+SYNC_REQUEST_POLL = 1   # segundos entre consultas aos pedidos de sync manual
+# `python server.py --sync`: este interpretador é o processo de sync (ver run_sync_process)
+SYNC_PROCESS = __name__ == '__main__' and '--sync' in sys.argv[1:]
+
+CADENCE_CONFIG = {
+    'history': 12,          # publicações lembradas por radar
+    'min_interval': 60,     # limites do intervalo de publicação estimado (s)
+    'max_interval': 900,
+    'margin': 10,           # folga após o horário previsto de publicação (s)
+    'retry': 20,            # repetição quando a publicação atrasa (dobra a cada tentativa)
+    'backoff_max': 600      # teto do backoff em falhas/queda da fonte (s)
+}
+FRESHNESS_MAX_HOURS = 24  # janela das métricas de latência de entrega
+
+# ============================================
+# ESTADO COMPARTILHADO ENTRE WORKERS (SQLITE)
+# ============================================
+
+# Todos os workers do gunicorn leem/escrevem aqui (em memória ficaria por processo)
+STATE_DB_PATH = os.path.join(CACHE_DIR, 'state.db')
+# Uma conexão por processo, serializada pelo lock: funciona igual com threads
+# e com greenlets (gunicorn -k gevent), sem abrir uma conexão por requisição
+state_db_conn = {'pid': None, 'conn': None}
+state_db_lock = threading.Lock()
+
+def state_db():
+    """Conexão SQLite do processo (modo WAL: leituras não bloqueiam o sync). Usar com state_db_lock."""
+    if state_db_conn['pid'] != os.getpid():
+        conn = sqlite3.connect(STATE_DB_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS state ('
+                     'key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)')
+        # Latência de entrega por frame: publicado na fonte -> em disco -> primeira entrega
+        conn.execute('CREATE TABLE IF NOT EXISTS freshness ('
+                     'radar TEXT NOT NULL, name TEXT NOT NULL, upstream REAL NOT NULL, '
+                     'available REAL NOT NULL, served REAL, PRIMARY KEY (radar, name, available))')
+        # Buckets do rate limit compartilhado (RATE_LIMIT_BACKEND=shared)
+        conn.execute('CREATE TABLE IF NOT EXISTS rate_limit ('
+                     'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, denied INTEGER NOT NULL)')
+        # Pixels por classe de chuva em cada região, por frame (série curta de /api/regions)
+        conn.execute('CREATE TABLE IF NOT EXISTS region_stats ('
+                     'radar TEXT NOT NULL, time REAL NOT NULL, version TEXT NOT NULL, counts BLOB NOT NULL, '
+                     'PRIMARY KEY (radar, time))')
+        # Total acumulado das métricas de cada worker (somado por /metrics)
+        conn.execute('CREATE TABLE IF NOT EXISTS metrics ('
+                     'worker TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)')
+        state_db_conn.update(pid=os.getpid(), conn=conn)
+    return state_db_conn['conn']
+
+def state_query(sql, params=()):
+    """Executa um comando no estado compartilhado e retorna as linhas"""
+    with state_db_lock:
+        return state_db().execute(sql, params).fetchall()
+
+def set_state(key, value):
+    """Grava um valor JSON no estado compartilhado"""
+    state_query(
+        'INSERT INTO state (key, value, updated) VALUES (?, ?, ?) '
+        'ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated',
+        (key, json.dumps(value), time.time())
+    )
+
+def get_state(key, default=None):
+    """Lê um valor JSON do estado compartilhado"""
+    rows = state_query('SELECT value FROM state WHERE key = ?', (key,))
+    return json.loads(rows[0][0]) if rows else default
+
+def record_sync(radar, stats):
+    """Registra o fim de um sync (horário + estatísticas) para todos os workers"""
+    set_state(f'sync:{radar}', {'last_sync': datetime.now().isoformat(), 'stats': stats})
+
+def get_sync_state(radar):
+    """Último sync de um radar: {'last_sync': ISO ou None, 'stats': dict ou None}"""
+    return get_state(f'sync:{radar}', {'last_sync': None, 'stats': None})
+
+# Locks de arquivo entre processos: um flock LOCK_EX bloqueante não cede ao
+# hub do gevent e pararia o worker inteiro. A espera é feita com LOCK_NB e
+# sleep, que com o monkey patch deixa as outras requisições andarem
+FILE_LOCK_POLL = 0.05  # segundos entre tentativas
+
+def flock_exclusive(lock_file):
+    """Obtém o flock exclusivo de `lock_file` sem bloquear o worker (espera até liberar)"""
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            time.sleep(FILE_LOCK_POLL)
+
+# ============================================
+# MÉTRICAS (FORMATO PROMETHEUS)
+# ============================================
+
+# Cada worker agrega as observações em memória (um dict e um lock por
+# observação) e grava o próprio total acumulado no state.db no máximo a cada
+# flush_interval; /metrics soma as linhas de todos os workers. Um worker
+# encerrado continua somando até expirar, então os contadores só diminuem
+# quando linhas antigas saem (o Prometheus trata como reinício do contador)
+METRICS_CONFIG = {
+    'flush_interval': 10,   # s entre gravações do total de cada worker
+    'stale_hours': 24       # linhas de workers sem atualização há mais tempo são removidas
+}
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # segundos
+METRICS_HELP = {
+    'radar_http_request_duration_seconds': ('histogram', 'Latência das requisições por rota'),
+    'radar_rain_filter_duration_seconds': ('histogram', 'Geração da variante com filtro de chuva'),
+    'radar_export_gif_duration_seconds': ('histogram', 'Exportação de animação (pronta no cache ou montada)'),
+    'radar_download_duration_seconds': ('histogram', 'Download de um frame da fonte'),
+    'radar_download_bytes_total': ('counter', 'Bytes baixados das fontes'),
+    'radar_sync_duration_seconds': ('histogram', 'Duração de um ciclo de cada job de sync'),
+    'radar_cache_requests_total': ('counter', 'Consultas aos caches (result=hit|miss)')
+}
+
+# Séries deste processo: 'nome{rótulos}' -> valor (contador) ou
+# [contagem por bucket..., +Inf, soma] (histograma)
+metrics_state = {'pid': None, 'worker': None, 'series': {}, 'flushed': 0.0}
+metrics_lock = threading.Lock()
+
+def metric_key(name, labels):
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+def local_metrics():
+    """Séries do processo atual (um worker criado por fork não herda as do pai). Usar com metrics_lock."""
+    if metrics_state['pid'] != os.getpid():
+        metrics_state.update(pid=os.getpid(), worker=f'{os.getpid()}-{time.time():.0f}', series={}, flushed=0.0)
+    return metrics_state['series']
+
+def inc_metric(name, value=1, **labels):
+    key = metric_key(name, labels)
+    with metrics_lock:
+        series = local_metrics()
+        series[key] = series.get(key, 0) + value
+
+def observe_metric(name, value, **labels):
+    """Observação num histograma (os buckets ficam cumulativos só na exposição)"""
+    key = metric_key(name, labels)
+    with metrics_lock:
+        series = local_metrics()
+        values = series.get(key)
+        if values is None:
+            values = series[key] = [0] * (len(METRICS_BUCKETS) + 2)
+        values[bisect.bisect_left(METRICS_BUCKETS, value)] += 1
+        values[-1] += value
+
+@contextmanager
+def timed_metric(name, **labels):
+    """Observa a duração do bloco (também quando ele levanta exceção)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_metric(name, time.perf_counter() - started, **labels)
+
+def flush_metrics(force=False):
+    """Grava o total deste worker no state.db (no máximo a cada flush_interval, salvo force)"""
+    now = time.time()
+    with metrics_lock:
+        series = local_metrics()
+        if not force and now - metrics_state['flushed'] < METRICS_CONFIG['flush_interval']:
+            return
+        metrics_state['flushed'] = now
+        worker, payload = metrics_state['worker'], json.dumps(series)
+    try:
+        state_query(
+            'INSERT INTO metrics (worker, data, updated) VALUES (?, ?, ?) '
+            'ON CONFLICT(worker) DO UPDATE SET data = excluded.data, updated = excluded.updated',
+            (worker, payload, now)
+        )
+    except sqlite3.Error as e:
+        print(f'Metrics flush error: {e}')
+
+def collect_metrics():
+    """Séries somadas de todos os workers e quantos workers contribuíram"""
+    flush_metrics(force=True)
+    cutoff = time.time() - METRICS_CONFIG['stale_hours'] * 3600
+    state_query('DELETE FROM metrics WHERE updated < ?', (cutoff,))
+    rows = state_query('SELECT data FROM metrics')
+    merged = {}
+    for (data,) in rows:
+        for key, value in json.loads(data).items():
+            if isinstance(value, list):
+                total = merged.setdefault(key, [0] * len(value))
+                for i, item in enumerate(value):
+                    total[i] += item
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged, len(rows)
+
+def format_metric_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def metrics_exposition(merged, gauges):
+    """Texto no formato de exposição do Prometheus (0.0.4)"""
+    lines = []
+    for name, (kind, text) in list(METRICS_HELP.items()) + [(name, ('gauge', text)) for name, (text, _) in gauges.items()]:
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'gauge':
+            for labels, value in gauges[name][1]:
+                lines.append(f'{metric_key(name, labels)} {format_metric_value(value)}')
+            continue
+        for key in sorted(k for k in merged if k.startswith(name + '{')):
+            value = merged[key]
+            if kind == 'counter':
+                lines.append(f'{key} {format_metric_value(value)}')
+                continue
+            labels = key[len(name) + 1:-1]
+            separator = ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(METRICS_BUCKETS + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {format_metric_value(value[-1])}')
+            lines.append(f'{name}_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Latência por rota (o padrão da rota, não a URL: cardinalidade limitada)"""
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe_metric('radar_http_request_duration_seconds', time.perf_counter() - started,
+                       route=route, method=request.method, code=response.status_code)
+        flush_metrics()
+    return response
+
+# ============================================
+# PROFILER POR AMOSTRAGEM (ADMIN)
+# ============================================
+
+# Amostra as pilhas Python de todas as threads do worker em intervalos fixos
+# e devolve no formato "folded" (uma pilha por linha com a contagem), aceito
+# por flamegraph.pl, speedscope e inferno. Só o worker que recebe o pedido é
+# amostrado; custo zero enquanto desligado
+PROFILER_CONFIG = {
+    'default_seconds': 10,
+    'max_seconds': 60,
+    'default_interval_ms': 5,
+    'min_interval_ms': 1
+}
+profiler_lock = threading.Lock()
+
+def os_thread_primitives():
+    """
+    (start_new_thread, sleep) de threads do sistema. Com gunicorn -k gevent
+    o monkey patch troca threads por greenlets, que só rodariam quando o
+    worker cedesse: a amostra não veria o código que segura a CPU.
+    """
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            return monkey.get_original('_thread', 'start_new_thread'), monkey.get_original('time', 'sleep')
+    except ImportError:
+        pass
+    return _thread.start_new_thread, time.sleep
+
+def profiler_frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+def sample_stacks(seconds, interval):
+    """
+    Pilhas amostradas durante `seconds`: Counter {'thread;f1;f2': amostras}.
+    O amostrador roda numa thread do sistema; quem chamou espera com o sleep
+    normal (que cede aos outros greenlets com gevent).
+    """
+    start_thread, os_sleep = os_thread_primitives()
+    samples = Counter()
+    result = {'done': False, 'error': None}
+
+    def sampler():
+        own = sys._getframe().f_code
+        deadline = time.perf_counter() + seconds
+        try:
+            while time.perf_counter() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    stack = []
+                    while frame is not None:
+                        if frame.f_code is own or frame.f_code is sample_stacks.__code__:
+                            break
+                        stack.append(profiler_frame_label(frame))
+                        frame = frame.f_back
+                    else:
+                        stack.append(names.get(ident, f'thread-{ident}'))
+                        samples[';'.join(reversed(stack))] += 1
+                os_sleep(interval)
+        except Exception as e:
+            result['error'] = e
+        finally:
+            result['done'] = True
+
+    start_thread(sampler, ())
+    while not result['done']:
+        time.sleep(0.05)
+    if result['error'] is not None:
+        raise result['error']
+    return samples
+
+# ============================================
+# FILTRO DE CORES - REMOVER UMIDADE (AZUL)
+# ============================================
+
+# Buffers booleanos do kernel, reaproveitados entre frames (um conjunto por thread e formato)
+classify_workspace = threading.local()
+
+def classify_buffers(shape):
+    """Temporários do kernel de classificação para imagens de um formato"""
+    buffers = getattr(classify_workspace, 'buffers', None)
+    if buffers is None or len(buffers) > 4:
+        buffers = classify_workspace.buffers = {}
+    if shape not in buffers:
+        buffers[shape] = [np.empty(shape, dtype=bool) for _ in range(4)]
+    return buffers[shape]
+
+def rain_class_kernel(r, g, b, a, classes, removed, filter_rain=True):
+    """
+    Classifica pixels em classes de intensidade (0 = sem chuva, 1..6) com as
+    mesmas regras de isRainPixel no cliente:
+    1 verde claro, 2 verde escuro, 3 amarelo, 4 laranja, 5 vermelho, 6 magenta.
+    Preenche `classes` (uint8) e `removed` (bool: azul/ciano, a umidade que o
+    filtro de chuva torna transparente) a partir dos canais já separados, só
+    com operações in place nos buffers da thread. `a` pode ser None (opaco).
+    Com filter_rain, a umidade é descartada; sem ele, ciano conta como 1.
+    """
+    t1, t2, t3, g_mid = classify_buffers(r.shape)
+    classes.fill(0)
+
+    np.greater(g, 100, out=g_mid)
+    np.less(g, 200, out=t1)
+    g_mid &= t1
+
+    # Verdes: R < 100 e B < 100
+    np.less(r, 100, out=t1)
+    np.less(b, 100, out=t2)
+    t1 &= t2
+    np.greater(g, 200, out=t2)
+    t2 &= t1
+    np.copyto(classes, 1, where=t2)
+    np.logical_and(g_mid, t1, out=t2)
+    np.copyto(classes, 2, where=t2)
+
+    # Amarelo, laranja e vermelho: R > 200 e B < 100
+    np.greater(r, 200, out=t1)
+    np.less(b, 100, out=t2)
+    t2 &= t1
+    np.greater(g, 200, out=t3)
+    t3 &= t2
+    np.copyto(classes, 3, where=t3)
+    np.logical_and(g_mid, t2, out=t3)
+    np.copyto(classes, 4, where=t3)
+    np.less(g, 100, out=t3)
+    t2 &= t3
+    np.copyto(classes, 5, where=t2)
+
+    # Magenta: R > 200, B > 200 e G < 100
+    np.greater(b, 200, out=t2)
+    t2 &= t1
+    t2 &= t3
+    np.copyto(classes, 6, where=t2)
+
+    # Umidade: ciano claro (B > 150, G > 150, R < 100) ou azul dominante (B > 100, B > R, B >= G)
+    np.greater(b, 150, out=t1)
+    np.greater(g, 150, out=t2)
+    t1 &= t2
+    np.less(r, 100, out=t2)
+    t1 &= t2
+    np.greater(b, 100, out=removed)
+    np.greater(b, r, out=t2)
+    removed &= t2
+    np.greater_equal(b, g, out=t2)
+    removed &= t2
+    removed |= t1
+
+    if filter_rain:
+        np.copyto(classes, 0, where=removed)
+    else:
+        np.equal(classes, 0, out=t2)
+        t2 &= t1
+        np.copyto(classes, 1, where=t2)
+
+    if a is not None:
+        np.less(a, 100, out=t2)
+        np.copyto(classes, 0, where=t2)
+
+def classify_rain_pixels(data, filter_rain=True):
+    """Classes de chuva (uint8, 0..6) de um array RGBA já decodificado (ver rain_class_kernel)"""
+    classes = np.empty(data.shape[:2], dtype=np.uint8)
+    removed = np.empty(data.shape[:2], dtype=bool)
+    r, g, b, a = (np.ascontiguousarray(data[:, :, i]) for i in range(4))
+    rain_class_kernel(r, g, b, a, classes, removed, filter_rain)
+    return classes
+
+def classify_frame(img, filtered=True):
+    """
+    Classifica um frame decodificado uma única vez. Retorna (classes, imagem):
+    o raster uint8 de classes de chuva (0..6) e, com `filtered`, a imagem com a
+    umidade transparente (None sem `filtered`).
+
+    PNG com paleta é classificado pela paleta (uma tabela de 256 entradas) e o
+    raster sai de uma consulta por índice; a imagem filtrada continua com
+    paleta, só muda a transparência das cores de umidade.
+    """
+    if img.mode == 'P' and img.palette is not None and img.palette.mode == 'RGB':
+        rgb = np.zeros((256, 3), dtype=np.uint8)
+        palette = np.array(img.getpalette(), dtype=np.uint8).reshape(-1, 3)[:256]
+        rgb[:len(palette)] = palette
+        alpha = np.full(256, 255, dtype=np.uint8)
+        transparency = img.info.get('transparency')
+        if isinstance(transparency, bytes):
+            alpha[:len(transparency)] = np.frombuffer(transparency, dtype=np.uint8)[:256]
+        elif isinstance(transparency, int):
+            alpha[transparency] = 0
+
+        lut = np.empty((1, 256), dtype=np.uint8)
+        lut_removed = np.empty((1, 256), dtype=bool)
+        rain_class_kernel(rgb[None, :, 0].copy(), rgb[None, :, 1].copy(), rgb[None, :, 2].copy(),
+                          alpha[None], lut, lut_removed)
+        indices = np.asarray(img)
+        classes = np.empty(indices.shape, dtype=np.uint8)
+        np.take(lut[0], indices, out=classes)
+        if not filtered:
+            return classes, None
+        result = img.copy()
+        result.info['transparency'] = np.where(lut_removed[0], 0, alpha).astype(np.uint8).tobytes()
+        return classes, result
+
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA')
+    bands = img.split()
+    r, g, b = (np.asarray(band) for band in bands[:3])
+    a = np.asarray(bands[3]) if img.mode == 'RGBA' else None
+    classes = np.empty(r.shape, dtype=np.uint8)
+    removed = np.empty(r.shape, dtype=bool)
+    rain_class_kernel(r, g, b, a, classes, removed)
+    if not filtered:
+        return classes, None
+    alpha = a.copy() if a is not None else np.full(r.shape, 255, dtype=np.uint8)
+    np.copyto(alpha, 0, where=removed)
+    return classes, Image.merge('RGBA', (*bands[:3], Image.fromarray(alpha, 'L')))
+
+def encode_rain_filtered(img):
+    """PNG da imagem filtrada (com paleta, a transparência vai no chunk tRNS)"""
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+def filter_rain_only(image_path):
+    """
+    Filtra a imagem do radar para mostrar apenas chuva (verde ou mais intenso).
+    Remove os tons azuis que representam apenas umidade.
+    
+    Baseado na legenda oficial:
+    - Azul claro/escuro: 0.10 - 1 mm/h (umidade, não chuva)
+    - Verde: ~5 mm/h (chuva leve) - MANTER
+    - Amarelo/Laranja: 10-100 mm/h (chuva moderada/forte) - MANTER
+    - Vermelho/Magenta: >100 mm/h (chuva muito forte) - MANTER
+    """
+    try:
+        _, filtered = classify_frame(Image.open(image_path))
+        return encode_rain_filtered(filtered)
+    except Exception as e:
+        print(f'Erro no filtro de chuva: {e}')
+        return None
+
+# ============================================
+# CACHE DO FILTRO DE CHUVA (PRÉ-COMPUTADO)
+# ============================================
+
+# Incrementar sempre que a lógica de filter_rain_only mudar, para invalidar variantes antigas
+RAIN_FILTER_VERSION = 1
+RAIN_CACHE_MAX_ITEMS = 64  # ~20 frames x 3 versões em memória
+
+# LRU em memória compartilhado pelos handlers: chave -> (bytes, etag)
+rain_cache = OrderedDict()
+rain_cache_lock = threading.Lock()
+
+def rain_variant_path(filepath):
+    """
+    Caminho da variante filtrada, gravada ao lado do original.
+    Não termina em .png, então não aparece nas listagens de frames.
+    """
+    return f'{filepath}.rain-v{RAIN_FILTER_VERSION}'
+
+def build_rain_variant(filepath, history=None):
+    """
+    Gera a variante filtrada de um frame uma única vez (chamado no sync).
+    Grava em arquivo temporário e renomeia, para nunca expor um PNG parcial.
+    O raster de classes da mesma decodificação alimenta a detecção de núcleos
+    e, com history=(radar, horário), o histórico compacto.
+    Retorna o caminho da variante ou None em caso de erro.
+    """
+    variant_path = rain_variant_path(filepath)
+    try:
+        source_mtime = os.stat(filepath).st_mtime_ns
+        if os.path.exists(variant_path) and os.stat(variant_path).st_mtime_ns >= source_mtime:
+            return variant_path
+    except OSError:
+        return None
+
+    try:
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        with timed_metric('radar_rain_filter_duration_seconds'):
+            img = Image.open(BytesIO(content))
+            classes, filtered_img = classify_frame(img)
+            filtered = encode_rain_filtered(filtered_img)
+    except Exception as e:
+        print(f'Erro no filtro de chuva: {e}')
+        return None
+
+    if not os.path.exists(nuclei_sidecar_path(filepath)):
+        store_frame_nuclei(filepath, hashlib.sha1(content).hexdigest(),
+                           {'width': img.width, 'height': img.height, 'nuclei': detect_nuclei(classes)})
+    if history is not None:
+        archive_frame(history[0], filepath, history[1], classes)
+
+    tmp_path = f'{variant_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(filtered.getbuffer())
+        os.replace(tmp_path, variant_path)
+        return variant_path
+    except OSError as e:
+        print(f'Erro ao gravar variante filtrada: {e}')
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+def get_rain_variant(filepath):
+    """
+    Retorna (bytes, etag) da variante filtrada de um frame.
+    Ordem de busca: LRU em memória -> arquivo em disco -> geração sob demanda.
+    O ETag é o SHA-1 do conteúdo filtrado (forte e endereçado por conteúdo).
+    """
+    stat = os.stat(filepath)
+    key = (filepath, RAIN_FILTER_VERSION, stat.st_mtime_ns, stat.st_size)
+
+    with rain_cache_lock:
+        entry = rain_cache.get(key)
+        if entry is not None:
+            rain_cache.move_to_end(key)
+    inc_metric('radar_cache_requests_total', cache='rain', result='miss' if entry is None else 'hit')
+    if entry is not None:
+        return entry
+
+    variant_path = build_rain_variant(filepath)
+    if variant_path is None:
+        return None
+
+    with open(variant_path, 'rb') as f:
+        data = f.read()
+    entry = (data, hashlib.sha1(data).hexdigest())
+
+    with rain_cache_lock:
+        rain_cache[key] = entry
+        rain_cache.move_to_end(key)
+        while len(rain_cache) > RAIN_CACHE_MAX_ITEMS:
+            rain_cache.popitem(last=False)
+
+    return entry
+
+# ============================================
+# ÍNDICE DE FRAMES EM MEMÓRIA
+# ============================================
+
+FRAME_TIMESTAMP_PATTERN = re.compile(r'(?:MDN|CMP)-(\d{4})(\d{2})(\d{2})-(\d{2})(\d{2})')
+MENDANHA_LIST_SIZE = 20  # /api/frames/mendanha lista os 20 mais recentes
+# Radares com o horário no nome (MDN-/CMP-): listam os mais recentes, com atraso
+TIMESTAMPED_RADARS = ('mendanha', 'composite')
+
+# radar -> índice (ver build_frame_index); substituído atomicamente a cada rebuild
+frame_indexes = {radar: None for radar in RADAR_DIRS}
+frame_index_lock = threading.Lock()
+
+def parse_frame_timestamp(filename):
+    """Extrai o horário do nome MDN-YYYYMMDD-HHMM_... ou CMP-... (None se não houver)"""
+    match = FRAME_TIMESTAMP_PATTERN.match(filename)
+    if not match:
+        return None
+    try:
+        return datetime(*(int(part) for part in match.groups()))
+    except ValueError:
+        return None
+
+def build_frame_index(radar, previous=None):
+    """
+    Monta o índice de um radar: frames válidos em ordem cronológica, com
+    tamanho, mtime, SHA-1 e horário já extraídos. Entradas que não mudaram
+    são reaproveitadas do índice anterior (só arquivos novos são lidos).
+    """
+    directory = RADAR_DIRS[radar]
+    # mtime do diretório lido antes da listagem: uma mudança concorrente força novo rebuild
+    dir_mtime = os.stat(directory).st_mtime_ns
+    old_entries = {entry['name']: entry for entry in previous['frames']} if previous else {}
+
+    frames = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.png') or not sanitize_filename(filename):
+            continue
+        filepath = os.path.join(directory, filename)
+        try:
+            stat = os.stat(filepath)
+            entry = old_entries.get(filename)
+            if entry is None or entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+                with open(filepath, 'rb') as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+                entry = {
+                    'name': filename,
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'sha1': digest,
+                    'timestamp': parse_frame_timestamp(filename)
+                }
+        except OSError:
+            continue  # Removido durante a listagem
+        frames.append(entry)
+
+    listed = frames[-MENDANHA_LIST_SIZE:] if radar in TIMESTAMPED_RADARS else frames
+    etag = hashlib.sha1('|'.join(f"{e['name']}:{e['sha1']}" for e in listed).encode()).hexdigest()
+
+    return {
+        'dir_mtime': dir_mtime,
+        'frames': frames,
+        'by_name': {entry['name']: entry for entry in frames},
+        'listed': listed,
+        'total_size': sum(entry['size'] for entry in frames),
+        'etag': etag,
+        'response': None   # (chave, corpo JSON serializado, etag) da listagem
+    }
+
+def get_frame_index(radar):
+    """
+    Retorna o índice atual do radar. Custo O(1) por chamada: um stat no
+    diretório detecta mudanças feitas por qualquer processo (sync, limpeza,
+    outro worker), e só então o índice é reconstruído.
+    """
+    index = frame_indexes[radar]
+    try:
+        dir_mtime = os.stat(RADAR_DIRS[radar]).st_mtime_ns
+    except OSError:
+        dir_mtime = None
+
+    if index is None or index['dir_mtime'] != dir_mtime:
+        with frame_index_lock:
+            index = frame_indexes[radar]
+            if index is None or index['dir_mtime'] != dir_mtime:
+                index = build_frame_index(radar, index)
+                frame_indexes[radar] = index
+    return index
+
+def get_frames_response(radar):
+    """
+    Corpo JSON da listagem de frames, serializado uma vez por versão do índice.
+    Para o Mendanha (e o mosaico) o atraso muda com o relógio, então o corpo
+    é refeito no máximo uma vez por minuto. Retorna (corpo, etag).
+    """
+    index = get_frame_index(radar)
+    listed = index['listed']
+
+    latest_timestamp = None
+    delay_minutes = None
+    if radar in TIMESTAMPED_RADARS and listed:
+        frame_time = listed[-1]['timestamp']
+        if frame_time is not None:
+            latest_timestamp = frame_time.isoformat()
+            delay_minutes = int((datetime.now() - frame_time).total_seconds() / 60)
+
+    cached = index['response']
+    if cached is not None and cached[0] == delay_minutes:
+        return cached[1], cached[2]
+
+    body = {
+        'frames': [entry['name'] for entry in listed],
+        'versions': {entry['name']: frame_version(entry) for entry in listed},
+        'count': len(listed)
+    }
+    if radar in TIMESTAMPED_RADARS:
+        body['latest_timestamp'] = latest_timestamp
+        body['delay_minutes'] = delay_minutes
+    if radar == 'mendanha':
+        # Vai nas URLs com filter=rain (rv=): mudar o filtro muda a URL
+        body['rain_filter_version'] = RAIN_FILTER_VERSION
+
+    payload = json.dumps(body, separators=(',', ':'))
+    etag = f"{index['etag'][:20]}-{delay_minutes}-r{RAIN_FILTER_VERSION}"
+    index['response'] = (delay_minutes, payload, etag)
+    return payload, etag
+
+def frames_json_response(radar):
+    """Resposta da listagem com ETag (suporta If-None-Match -> 304)"""
+    payload, etag = get_frames_response(radar)
+    response = Response(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# ============================================
+# ENVIO DOS FRAMES (URLS VERSIONADAS E NGINX)
+# ============================================
+
+# Com o nginx na frente: location internal que aponta para CACHE_DIR (ex.:
+# /_cache). O worker responde só o cabeçalho X-Accel-Redirect e o nginx envia
+# o arquivo com sendfile. Vazio: o worker envia (sendfile do gunicorn).
+FRAME_ACCEL_PREFIX = os.environ.get('FRAME_ACCEL_PREFIX', '').rstrip('/')
+
+FRAME_VERSION_LENGTH = 12
+FRAME_IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def frame_version(entry):
+    """Versão do conteúdo usada nas URLs (?v=): prefixo do SHA-1 do índice"""
+    return entry['sha1'][:FRAME_VERSION_LENGTH]
+
+def frame_cache_control(entry, rain=False):
+    """
+    ?v= com a versão atual: URL endereçada por conteúdo, guardada sem
+    revalidar. Sem versão (ou desatualizada, o Sumaré regrava os mesmos
+    nomes): revalidação pelo ETag a cada uso. Na variante filter=rain a URL
+    também precisa de rv= com a versão atual do filtro.
+    """
+    if request.args.get('v') == frame_version(entry) and (
+            not rain or request.args.get('rv') == str(RAIN_FILTER_VERSION)):
+        return FRAME_IMMUTABLE_CACHE_CONTROL
+    return 'no-cache'
+
+def frame_file_response(radar, entry):
+    """
+    Envia o arquivo de um frame do índice. Com FRAME_ACCEL_PREFIX o nginx lê
+    o arquivo e cuida de ETag, 304 e Range; sem ele, send_file com o SHA-1
+    do índice como ETag. Retorna None se o arquivo sumiu (limpeza).
+    """
+    filepath = os.path.join(RADAR_DIRS[radar], entry['name'])
+    if FRAME_ACCEL_PREFIX:
+        response = Response(mimetype='image/png')
+        response.headers['X-Accel-Redirect'] = f"{FRAME_ACCEL_PREFIX}/{os.path.relpath(filepath, CACHE_DIR)}"
+    else:
+        try:
+            response = send_file(filepath, mimetype='image/png', etag=entry['sha1'], conditional=True)
+        except FileNotFoundError:
+            return None
+    mark_frame_served(radar, entry['name'], filepath, entry['mtime_ns'])
+    response.headers['Cache-Control'] = frame_cache_control(entry)
+    return response
+
+def find_frame(radar, filename):
+    """
+    Entrada do índice para o nome pedido. O índice só tem arquivos listados
+    no diretório do radar, então dispensa exists/realpath por requisição.
+    Retorna (entrada, resposta de erro).
+    """
+    if not sanitize_filename(filename):
+        return None, (jsonify({'error': 'Nome de arquivo inválido'}), 400)
+    entry = get_frame_index(radar)['by_name'].get(filename)
+    if entry is None:
+        return None, (jsonify({'error': 'Arquivo não encontrado'}), 404)
+    return entry, None
+
+# ============================================
+# EVENTOS DE ATUALIZAÇÃO (SERVER-SENT EVENTS)
+# ============================================
+
+# Mesmos limiares de DELAY_WARNING_THRESHOLD/DELAY_CRITICAL_THRESHOLD do index.html
+DELAY_WARNING_MINUTES = 30
+DELAY_CRITICAL_MINUTES = 60
+
+STREAM_CONFIG = {
+    'check_interval': 1.0,   # segundos entre verificações do índice (mudanças de outro processo)
+    'heartbeat': 20,         # comentário periódico para manter proxies e detectar desconexão
+    'backlog': 64,           # eventos guardados para clientes que ficaram para trás
+    'max_clients': 1000,     # conexões simultâneas por worker
+    'retry_ms': 5000         # reconexão do EventSource
+}
+
+# Eventos recentes: (sequência, texto SSE). Clientes esperam na condição
+stream_state = {'seq': 0, 'events': deque(maxlen=STREAM_CONFIG['backlog']), 'clients': 0, 'watcher': None}
+stream_condition = threading.Condition()
+# Último estado visto por radar, para calcular as diferenças
+stream_snapshots = {radar: None for radar in RADAR_DIRS}
+stream_check_lock = threading.Lock()
+
+def delay_level(delay_minutes):
+    """Nível do alerta de atraso: ok, warning, critical (unknown sem horário)"""
+    if delay_minutes is None:
+        return 'unknown'
+    if delay_minutes >= DELAY_CRITICAL_MINUTES:
+        return 'critical'
+    if delay_minutes >= DELAY_WARNING_MINUTES:
+        return 'warning'
+    return 'ok'
+
+def frame_stream_state(radar):
+    """Estado publicável de um radar a partir do índice (frames listados + atraso)"""
+    index = get_frame_index(radar)
+    listed = index['listed']
+    latest_timestamp = None
+    delay_minutes = None
+    if listed and listed[-1]['timestamp'] is not None:
+        latest_timestamp = listed[-1]['timestamp'].isoformat()
+        delay_minutes = int((datetime.now() - listed[-1]['timestamp']).total_seconds() / 60)
+    return {
+        'etag': index['etag'],
+        'frames': {entry['name']: entry['sha1'] for entry in listed},
+        'versions': {entry['name']: frame_version(entry) for entry in listed},
+        'latest_timestamp': latest_timestamp,
+        'delay_minutes': delay_minutes,
+        'level': delay_level(delay_minutes)
+    }
+
+def format_sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+def publish_stream_event(event, data):
+    """Enfileira um evento e acorda todos os clientes deste processo"""
+    with stream_condition:
+        stream_state['seq'] += 1
+        stream_state['events'].append((stream_state['seq'], format_sse(event, data)))
+        stream_condition.notify_all()
+
+def sync_in_progress(radar):
+    """True se algum processo está no meio do sync do radar (lock do run_sync_job)"""
+    try:
+        with open(os.path.join(CACHE_DIR, f'sync-{radar}.lock'), 'a+') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            return False
+    except OSError:
+        return True
+
+def check_frame_updates(radar=None):
+    """
+    Compara o índice com o último estado publicado e emite os eventos:
+    'frames' quando frames entram, saem ou mudam de conteúdo (o Sumaré
+    regrava os mesmos nomes) e 'delay' quando o atraso cruza um limiar
+    (enquanto há alerta, também a cada minuto, para o contador na tela).
+    Chamado pelo sync ao terminar e, em cada worker, pelo stream_watch_loop.
+    """
+    with stream_check_lock:
+        for name in ([radar] if radar else RADAR_DIRS):
+            previous = stream_snapshots[name]
+            current = frame_stream_state(name)
+            stream_snapshots[name] = current
+            if previous is None:
+                continue
+
+            if current['etag'] != previous['etag']:
+                old_frames, new_frames = previous['frames'], current['frames']
+                added = [n for n in new_frames if n not in old_frames]
+                changed = [n for n in new_frames if n in old_frames and old_frames[n] != new_frames[n]]
+                publish_stream_event('frames', {
+                    'radar': name,
+                    'etag': current['etag'],
+                    'added': added,
+                    'removed': [n for n in old_frames if n not in new_frames],
+                    'changed': changed,
+                    'versions': {n: current['versions'][n] for n in added + changed},
+                    'count': len(new_frames),
+                    'latest_timestamp': current['latest_timestamp'],
+                    'delay_minutes': current['delay_minutes']
+                })
+
+            if current['level'] != previous['level'] or (
+                    current['level'] in ('warning', 'critical')
+                    and current['delay_minutes'] != previous['delay_minutes']):
+                publish_stream_event('delay', {
+                    'radar': name,
+                    'delay_minutes': current['delay_minutes'],
+                    'level': current['level']
+                })
+
+def stream_watch_loop():
+    """Detecta frames gravados por outro processo (o líder do sync) e o relógio do atraso"""
+    while True:
+        try:
+            for radar in RADAR_DIRS:
+                # Sync em andamento: esperar terminar para não publicar meia atualização
+                if not sync_in_progress(radar):
+                    check_frame_updates(radar)
+        except Exception as e:
+            print(f'Stream watcher error: {e}')
+        time.sleep(STREAM_CONFIG['check_interval'])
+
+def start_stream_watcher():
+    """Inicia o watcher deste processo na primeira conexão SSE (idempotente)"""
+    with stream_check_lock:
+        watcher = stream_state['watcher']
+        if watcher is None or not watcher.is_alive():
+            watcher = threading.Thread(target=stream_watch_loop, daemon=True, name='stream-watcher')
+            stream_state['watcher'] = watcher
+            watcher.start()
+
+def stream_snapshot_event():
+    """Primeiro evento de cada conexão: estado atual de todos os radares"""
+    radars = {}
+    for radar in RADAR_DIRS:
+        state = stream_snapshots[radar] or frame_stream_state(radar)
+        radars[radar] = {
+            'etag': state['etag'],
+            'frames': list(state['frames']),
+            'latest_timestamp': state['latest_timestamp'],
+            'delay_minutes': state['delay_minutes'],
+            'level': state['level']
+        }
+    return format_sse('snapshot', {'radars': radars})
+
+def stream_frame_events():
+    """
+    Gerador da conexão SSE. Fica parado na condição até haver evento novo
+    (ou o heartbeat), então não consome CPU enquanto ocioso; com workers
+    gevent cada conexão é só um greenlet.
+    """
+    with stream_condition:
+        stream_state['clients'] += 1
+        cursor = stream_state['seq']
+    try:
+        yield f"retry: {STREAM_CONFIG['retry_ms']}\n\n" + stream_snapshot_event()
+        while True:
+            with stream_condition:
+                if stream_state['seq'] == cursor:
+                    stream_condition.wait(timeout=STREAM_CONFIG['heartbeat'])
+                events = stream_state['events']
+                lost = events and events[0][0] > cursor + 1
+                pending = [text for seq, text in events if seq > cursor]
+                cursor = stream_state['seq']
+            if lost:
+                # Cliente ficou para trás além do backlog: mandar o estado completo
+                yield stream_snapshot_event()
+            elif pending:
+                yield ''.join(pending)
+            else:
+                yield ': ping\n\n'
+    finally:
+        with stream_condition:
+            stream_state['clients'] -= 1
+
+# ============================================
+# DETECÇÃO DE NÚCLEOS E TENDÊNCIA (SERVER-SIDE)
+# ============================================
+
+# Mesmos parâmetros de detectNuclei/calculateMovements no index.html
+NUCLEI_VERSION = 1
+NUCLEI_MIN_SIZE = 80          # Tamanho mínimo do cluster (pixels)
+NUCLEI_SEED_STEP = 4          # Passo da varredura de sementes
+LEGEND_AREA = (200, 500)      # Legenda no canto superior esquerdo: x < 200 e y < 500
+MATCH_MAX_DIST = 150          # Distância máxima para associar núcleos entre frames
+TREND_FRAMES = 5              # Quantos frames recentes usar para tendência
+MIN_SPEED = 2                 # Velocidade mínima para considerar movimento
+TREND_MIN_SIZE = 200          # Só núcleos com pelo menos 200 pixels recebem seta
+TREND_MAX_ARROWS = 5          # Máximo de setas por frame
+
+NUCLEI_CACHE_MAX_ITEMS = 120  # 3 radares (com o mosaico) x 20 frames, com folga para a troca de janela
+
+# LRU por conteúdo do frame (SHA-1) -> resultado da detecção
+nuclei_cache = OrderedDict()
+nuclei_cache_lock = threading.Lock()
+
+# Último resultado por radar: (assinatura da janela de frames, frames_data)
+nuclei_results = {radar: None for radar in RADAR_DIRS}
+
+def list_radar_frames(radar):
+    """Lista os frames de um radar na mesma ordem/janela dos endpoints de listagem"""
+    return [entry['name'] for entry in get_frame_index(radar)['listed']]
+
+def label_components(mask):
+    """
+    Rotula componentes 4-conectados de uma máscara booleana só com NumPy.
+    Cada sequência horizontal de pixels vira um nó; sequências que se tocam
+    verticalmente são unidas por propagação do menor rótulo com pointer jumping.
+    Retorna (raster de rótulos int32 com 0 = fundo, número de rótulos).
+    """
+    height, width = mask.shape
+    flat = mask.ravel()
+
+    # Início de cada sequência horizontal
+    starts = flat.copy()
+    starts[1:] &= ~flat[:-1]
+    starts[::width] = flat[::width]
+    run_ids = np.cumsum(starts, dtype=np.int32)
+    run_ids[~flat] = 0
+    run_ids = run_ids.reshape(height, width)
+    run_count = int(run_ids.max())
+    if run_count == 0:
+        return run_ids, 0
+
+    # Pares de sequências vizinhas na vertical
+    touching = mask[:-1] & mask[1:]
+    upper = run_ids[:-1][touching].astype(np.int64)
+    lower = run_ids[1:][touching].astype(np.int64)
+    pairs = np.unique(upper * (run_count + 1) + lower)
+    upper, lower = pairs // (run_count + 1), pairs % (run_count + 1)
+
+    parent = np.arange(run_count + 1, dtype=np.int64)
+    while True:
+        smallest = np.minimum(parent[upper], parent[lower])
+        updated = parent.copy()
+        np.minimum.at(updated, upper, smallest)
+        np.minimum.at(updated, lower, smallest)
+        updated = updated[updated]
+        if np.array_equal(updated, parent):
+            break
+        parent = updated
+
+    # Compactar rótulos para 1..N
+    roots, compact = np.unique(parent, return_inverse=True)
+    labels = compact.astype(np.int32)[run_ids]
+    return labels, len(roots) - 1
+
+def detect_nuclei(classes):
+    """
+    Detecta núcleos de chuva em um raster de classes (equivalente a detectNuclei).
+    Só considera clusters alcançáveis a partir da grade de sementes (passo 4)
+    fora da legenda, com pelo menos NUCLEI_MIN_SIZE pixels e centroide fora da legenda.
+    Os núcleos saem na ordem em que o cliente os encontraria.
+    """
+    mask = classes > 0
+    labels, count = label_components(mask)
+    if count == 0:
+        return []
+
+    legend_x, legend_y = LEGEND_AREA
+    step = NUCLEI_SEED_STEP
+    seeds = labels[::step, ::step].copy()
+    seeds[:-(-legend_y // step), :-(-legend_x // step)] = 0
+    found, first_seed = np.unique(seeds.ravel(), return_index=True)
+    first_seed = first_seed[found > 0]
+    found = found[found > 0]
+
+    ys, xs = np.nonzero(mask)
+    pixel_labels = labels[ys, xs]
+    sizes = np.bincount(pixel_labels, minlength=count + 1)
+    sum_x = np.bincount(pixel_labels, weights=xs, minlength=count + 1)
+    sum_y = np.bincount(pixel_labels, weights=ys, minlength=count + 1)
+    sum_intensity = np.bincount(pixel_labels, weights=classes[ys, xs], minlength=count + 1)
+
+    nuclei = []
+    for label in found[np.argsort(first_seed)]:
+        size = int(sizes[label])
+        if size < NUCLEI_MIN_SIZE:
+            continue
+        center_x = sum_x[label] / size
+        center_y = sum_y[label] / size
+        if center_x >= legend_x or center_y >= legend_y:
+            nuclei.append({
+                'x': round(float(center_x), 2),
+                'y': round(float(center_y), 2),
+                'size': size,
+                'intensity': round(float(sum_intensity[label] / size), 3)
+            })
+    return nuclei
+
+def calculate_movements(frames_data):
+    """
+    Associa núcleos entre frames consecutivos pelo centroide mais próximo e
+    calcula a tendência ponderada dos últimos TREND_FRAMES frames
+    (equivalente a calculateMovements no cliente). Altera frames_data in place.
+    """
+    # Passo 1: movimentos frame-a-frame
+    for current, nxt in zip(frames_data, frames_data[1:]):
+        current['raw_movements'] = []
+        for nucleus in current['nuclei']:
+            best_match, best_dist = None, float('inf')
+            for candidate in nxt['nuclei']:
+                dist = math.hypot(nucleus['x'] - candidate['x'], nucleus['y'] - candidate['y'])
+                if dist < best_dist and dist < MATCH_MAX_DIST:
+                    best_dist, best_match = dist, candidate
+            if best_match:
+                dx = best_match['x'] - nucleus['x']
+                dy = best_match['y'] - nucleus['y']
+                speed = math.hypot(dx, dy)
+                if speed >= MIN_SPEED:
+                    current['raw_movements'].append({'dx': dx, 'dy': dy, 'size': nucleus['size']})
+
+    # Passo 2: tendência por frame usando a janela de frames recentes
+    for i, current in enumerate(frames_data):
+        current['movements'] = []
+        recent = []
+        for j in range(max(0, i - TREND_FRAMES + 1), min(i, len(frames_data) - 2) + 1):
+            recent.extend(frames_data[j].get('raw_movements', []))
+        if not recent:
+            continue
+
+        weights = [m['size'] ** 0.5 for m in recent]
+        total_weight = sum(weights)
+        if total_weight == 0:
+            continue
+        trend_dx = sum(m['dx'] * w for m, w in zip(recent, weights)) / total_weight
+        trend_dy = sum(m['dy'] * w for m, w in zip(recent, weights)) / total_weight
+        trend_speed = math.hypot(trend_dx, trend_dy)
+        if trend_speed < MIN_SPEED:
+            continue
+        trend_angle = math.degrees(math.atan2(trend_dy, trend_dx))
+
+        largest = sorted(
+            (n for n in current['nuclei'] if n['size'] >= TREND_MIN_SIZE),
+            key=lambda n: n['size'], reverse=True
+        )[:TREND_MAX_ARROWS]
+        for nucleus in largest:
+            current['movements'].append({
+                'x': nucleus['x'],
+                'y': nucleus['y'],
+                'dx': round(trend_dx, 3),
+                'dy': round(trend_dy, 3),
+                'speed': round(trend_speed, 3),
+                'angle': round(trend_angle, 2),
+                'intensity': nucleus['intensity'],
+                'size': nucleus['size']
+            })
+
+    for current in frames_data:
+        current.pop('raw_movements', None)
+    return frames_data
+
+def nuclei_sidecar_path(filepath):
+    """Resultado da detecção gravado ao lado do frame (não termina em .png)"""
+    return f'{filepath}.nuclei-v{NUCLEI_VERSION}.json'
+
+def get_frame_nuclei(filepath, digest=None):
+    """
+    Retorna {'width', 'height', 'nuclei'} de um frame, processando-o só uma vez.
+    A chave é o SHA-1 do conteúdo: frames do Sumaré que só mudam de nome
+    (radar002 -> radar001) reaproveitam o resultado. Ordem de busca:
+    memória -> arquivo .nuclei-vN.json -> decodificação + detecção.
+    O SHA-1 pode vir pronto do índice de frames, evitando reler o arquivo.
+    """
+    content = None
+    if digest is None:
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+
+    with nuclei_cache_lock:
+        result = nuclei_cache.get(digest)
+        if result is not None:
+            nuclei_cache.move_to_end(digest)
+    inc_metric('radar_cache_requests_total', cache='nuclei', result='miss' if result is None else 'hit')
+    if result is not None:
+        return result
+
+    sidecar = nuclei_sidecar_path(filepath)
+    try:
+        with open(sidecar) as f:
+            stored = json.load(f)
+        if stored.get('sha1') == digest:
+            result = stored['result']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if result is None:
+        if content is None:
+            with open(filepath, 'rb') as f:
+                content = f.read()
+        img = Image.open(BytesIO(content))
+        classes, _ = classify_frame(img, filtered=False)
+        result = {'width': img.width, 'height': img.height, 'nuclei': detect_nuclei(classes)}
+        store_frame_nuclei(filepath, digest, result)
+        return result
+
+    with nuclei_cache_lock:
+        nuclei_cache[digest] = result
+        while len(nuclei_cache) > NUCLEI_CACHE_MAX_ITEMS:
+            nuclei_cache.popitem(last=False)
+    return result
+
+def store_frame_nuclei(filepath, digest, result):
+    """Grava o resultado da detecção no arquivo .nuclei-vN.json e no LRU"""
+    sidecar = nuclei_sidecar_path(filepath)
+    tmp_path = f'{sidecar}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump({'sha1': digest, 'result': result}, f)
+        os.replace(tmp_path, sidecar)
+    except OSError as e:
+        print(f'Erro ao gravar núcleos de {os.path.basename(filepath)}: {e}')
+
+    with nuclei_cache_lock:
+        nuclei_cache[digest] = result
+        while len(nuclei_cache) > NUCLEI_CACHE_MAX_ITEMS:
+            nuclei_cache.popitem(last=False)
+
+def update_nuclei(radar):
+    """
+    Calcula núcleos e tendências para a janela atual de frames do radar.
+    Chamado no fim de cada sync: só frames novos são decodificados.
+    """
+    directory = RADAR_DIRS[radar]
+    index = get_frame_index(radar)
+    signature = index['etag']
+
+    cached = nuclei_results[radar]
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    frames_data = []
+    for entry in index['listed']:
+        filename = entry['name']
+        try:
+            result = get_frame_nuclei(os.path.join(directory, filename), entry['sha1'])
+        except Exception as e:
+            print(f'Erro na detecção de núcleos ({filename}): {e}')
+            result = {'width': 1024, 'height': 1024, 'nuclei': []}
+        frames_data.append({'frame': filename, **result})
+
+    calculate_movements(frames_data)
+    nuclei_results[radar] = (signature, frames_data)
+    return frames_data
+
+# ============================================
+# HISTÓRICO COMPACTO (RASTER DE CLASSES)
+# ============================================
+
+# Cada frame sincronizado vira um raster uint8 de classes de chuva (0..6,
+# ver rain_class_kernel) comprimido com zlib, em arquivos por radar e dia:
+# - <dia>.live + <dia>.idx: dia em andamento, só acrescentados pelo sync
+# - <dia>.hist: dia fechado e compactado (rasters + índice no final, imutável)
+# Leituras usam o índice de registros fixos e fatiam os rasters por mmap,
+# sem decodificar PNG. O frame mais antigo sai da janela de 24 h em disco,
+# mas continua no histórico.
+HISTORY_DIR = os.path.join(CACHE_DIR, 'history')
+HISTORY_CONFIG = {
+    'retention_days': 365,
+    'live_level': 1,            # zlib rápido durante o sync
+    'compact_level': 6,         # recompressão do dia fechado (9 é ~6x mais lento e só ~5% menor)
+    'compact_after_hours': 6,   # espera após o fim do dia (frames atrasados)
+    'max_range_days': 31,       # janela máxima de /api/history
+    'max_raw_frames': 288       # rasters por resposta com format=raw (um dia do Mendanha)
+}
+HISTORY_CLASSES = 7  # 0 = sem chuva, 1..6
+HISTORY_RECORD = np.dtype([
+    ('time', '<f8'),                        # horário do frame (epoch)
+    ('offset', '<u8'),                      # posição do raster comprimido no arquivo
+    ('length', '<u4'),
+    ('width', '<u2'),
+    ('height', '<u2'),
+    ('counts', '<u4', (HISTORY_CLASSES,))   # pixels por classe (resumo sem descomprimir)
+])
+HISTORY_FOOTER = struct.Struct('<QI4s')      # início do índice, registros, assinatura
+HISTORY_MAGIC = b'RHv1'
+HISTORY_BOUNDARY = 'radar-history'
+
+def history_paths(radar, day):
+    """Arquivos de um dia (YYYYMMDD) do histórico de um radar"""
+    base = os.path.join(HISTORY_DIR, radar, day)
+    return {'live': f'{base}.live', 'idx': f'{base}.idx', 'hist': f'{base}.hist'}
+
+def read_history_index(paths):
+    """
+    Índices de um dia: (registros do arquivo vivo, registros do compactado).
+    Um registro incompleto no fim do .idx (sync interrompido) é ignorado.
+    """
+    try:
+        count = os.path.getsize(paths['idx']) // HISTORY_RECORD.itemsize
+        live = np.fromfile(paths['idx'], dtype=HISTORY_RECORD, count=count)
+    except OSError:
+        live = np.empty(0, dtype=HISTORY_RECORD)
+
+    compacted = np.empty(0, dtype=HISTORY_RECORD)
+    try:
+        with open(paths['hist'], 'rb') as f:
+            f.seek(-HISTORY_FOOTER.size, os.SEEK_END)
+            index_offset, count, magic = HISTORY_FOOTER.unpack(f.read(HISTORY_FOOTER.size))
+            if magic == HISTORY_MAGIC:
+                f.seek(index_offset)
+                compacted = np.fromfile(f, dtype=HISTORY_RECORD, count=count)
+    except OSError:
+        pass
+    return live, compacted
+
+def read_history_day(radar, day, start, end, payloads=False):
+    """
+    Frames de um dia com horário em [start, end]: {horário: (registro, raster
+    comprimido ou None)}. O arquivo vivo é lido antes do compactado: se a
+    compactação acontecer no meio, o .hist novo já contém tudo (mesma chave).
+    """
+    paths = history_paths(radar, day)
+    frames = {}
+    live, compacted = read_history_index(paths)
+    for kind, records in (('live', live), ('hist', compacted)):
+        selected = records[(records['time'] >= start) & (records['time'] <= end)]
+        if len(selected) == 0:
+            continue
+        if not payloads:
+            frames.update((float(record['time']), (record, None)) for record in selected)
+            continue
+        try:
+            with open(paths[kind], 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for record in selected:
+                    offset = int(record['offset'])
+                    frames[float(record['time'])] = (record, data[offset:offset + int(record['length'])])
+        except (OSError, ValueError):
+            continue  # Compactado entre a leitura do índice e a dos dados
+    return frames
+
+def read_history(radar, start, end, payloads=False):
+    """Frames do histórico em [start, end] (epoch), em ordem cronológica"""
+    frames = {}
+    day = datetime.fromtimestamp(start).replace(hour=0, minute=0, second=0, microsecond=0)
+    while day.timestamp() <= end:
+        frames.update(read_history_day(radar, day.strftime('%Y%m%d'), start, end, payloads))
+        day += timedelta(days=1)
+    return [frames[t] for t in sorted(frames)]
+
+def history_write_lock(radar):
+    """Arquivo de lock das escritas no histórico do radar (sync manual roda em qualquer worker)"""
+    directory = os.path.join(HISTORY_DIR, radar)
+    os.makedirs(directory, exist_ok=True)
+    return open(os.path.join(directory, '.lock'), 'a+')
+
+def append_history(radar, timestamp, classes):
+    """
+    Acrescenta o raster de classes de um frame ao dia correspondente.
+    Frames já arquivados (mesmo horário) são ignorados. Retorna True se gravou.
+    """
+    day = datetime.fromtimestamp(timestamp).strftime('%Y%m%d')
+    paths = history_paths(radar, day)
+    classes = np.ascontiguousarray(classes, dtype=np.uint8)
+    payload = zlib.compress(classes.tobytes(), HISTORY_CONFIG['live_level'])
+
+    record = np.zeros(1, dtype=HISTORY_RECORD)
+    record['time'] = timestamp
+    record['length'] = len(payload)
+    record['height'], record['width'] = classes.shape
+    record['counts'] = np.bincount(classes.ravel(), minlength=HISTORY_CLASSES)[:HISTORY_CLASSES]
+
+    with history_write_lock(radar) as lock_file:
+        flock_exclusive(lock_file)
+        try:
+            live, compacted = read_history_index(paths)
+            if timestamp in live['time'] or timestamp in compacted['time']:
+                return False
+            # Raster antes do registro: um índice nunca aponta para dados incompletos
+            with open(paths['live'], 'ab') as f:
+                f.seek(0, os.SEEK_END)
+                record['offset'] = f.tell()
+                f.write(payload)
+            with open(paths['idx'], 'ab') as f:
+                f.seek(0, os.SEEK_END)
+                f.truncate(f.tell() - f.tell() % HISTORY_RECORD.itemsize)
+                f.write(record.tobytes())
+            return True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def archive_frame(radar, filepath, timestamp, classes=None):
+    """Arquiva um frame em disco no histórico (decodifica só se as classes não vierem prontas)"""
+    try:
+        if classes is None:
+            classes, _ = classify_frame(Image.open(filepath), filtered=False)
+        return append_history(radar, timestamp, classes)
+    except Exception as e:
+        print(f'Erro ao arquivar {os.path.basename(filepath)} no histórico: {e}')
+        return False
+
+def compact_history_day(radar, day):
+    """
+    Junta o arquivo vivo de um dia fechado ao .hist (recomprimindo os rasters
+    com compact_level) e remove o arquivo vivo. O .hist é trocado por rename.
+    A recompressão é feita antes do lock, para não segurar o sync.
+    """
+    paths = history_paths(radar, day)
+    live, _ = read_history_index(paths)
+    live_times = set(live['time'].tolist())
+    recompressed = {}
+    for timestamp, (_, payload) in read_history_day(radar, day, -math.inf, math.inf, payloads=True).items():
+        if timestamp in live_times:
+            recompressed[timestamp] = zlib.compress(zlib.decompress(payload), HISTORY_CONFIG['compact_level'])
+
+    with history_write_lock(radar) as lock_file:
+        flock_exclusive(lock_file)
+        try:
+            _, compacted = read_history_index(paths)
+            compacted_times = set(compacted['time'].tolist())
+            # Relido sob o lock: frames arquivados durante a recompressão entram como estão
+            frames = read_history_day(radar, day, -math.inf, math.inf, payloads=True)
+            tmp_path = f"{paths['hist']}.{os.getpid()}.tmp"
+            records = np.zeros(len(frames), dtype=HISTORY_RECORD)
+            with open(tmp_path, 'wb') as f:
+                for i, timestamp in enumerate(sorted(frames)):
+                    record, payload = frames[timestamp]
+                    if timestamp not in compacted_times and timestamp in recompressed:
+                        payload = recompressed[timestamp]
+                    records[i] = record
+                    records[i]['offset'] = f.tell()
+                    records[i]['length'] = len(payload)
+                    f.write(payload)
+                index_offset = f.tell()
+                f.write(records.tobytes())
+                f.write(HISTORY_FOOTER.pack(index_offset, len(records), HISTORY_MAGIC))
+            os.replace(tmp_path, paths['hist'])
+            for kind in ('live', 'idx'):
+                if os.path.exists(paths[kind]):
+                    os.remove(paths[kind])
+            return len(records)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def compact_history():
+    """
+    Manutenção do histórico (job do agendador): compacta os dias fechados e
+    remove os que passaram da retenção.
+    """
+    now = datetime.now()
+    stats = {'compacted': 0, 'removed': 0}
+    for radar in RADAR_DIRS:
+        directory = os.path.join(HISTORY_DIR, radar)
+        if not os.path.isdir(directory):
+            continue
+        days = sorted({f.split('.')[0] for f in os.listdir(directory) if re.match(r'^\d{8}\.(live|idx|hist)$', f)})
+        for day in days:
+            day_end = datetime.strptime(day, '%Y%m%d') + timedelta(days=1)
+            paths = history_paths(radar, day)
+            if day_end < now - timedelta(days=HISTORY_CONFIG['retention_days']):
+                for path in paths.values():
+                    if os.path.exists(path):
+                        os.remove(path)
+                stats['removed'] += 1
+            elif os.path.exists(paths['idx']) and day_end + timedelta(hours=HISTORY_CONFIG['compact_after_hours']) < now:
+                try:
+                    frames = compact_history_day(radar, day)
+                    stats['compacted'] += 1
+                    print(f'Histórico {radar} {day} compactado: {frames} frames')
+                except (OSError, zlib.error) as e:
+                    print(f'Erro ao compactar histórico {radar} {day}: {e}')
+    return stats
+
+def archive_old_frames(radar, max_hours):
+    """
+    Substitui a remoção pura da janela de 24 h: frames que vão sair do disco e
+    ainda não estão no histórico (ex.: baixados antes dele existir) são
+    arquivados antes de clean_old_files.
+    """
+    directory = RADAR_DIRS[radar]
+    cutoff = time.time() - max_hours * 3600
+    for entry in get_frame_index(radar)['frames']:
+        if entry['timestamp'] is not None and entry['mtime_ns'] / 1e9 < cutoff:
+            archive_frame(radar, os.path.join(directory, entry['name']), entry['timestamp'].timestamp())
+    clean_old_files(directory, max_hours)
+
+def parse_history_time(value):
+    """Horário ISO 8601 de /api/history em hora local (com fuso, é convertido)"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+def history_summary(record):
+    """Resumo JSON de um frame do histórico (a partir do índice, sem descomprimir)"""
+    counts = [int(c) for c in record['counts']]
+    rain_classes = [level for level in range(1, HISTORY_CLASSES) if counts[level]]
+    return {
+        'time': datetime.fromtimestamp(float(record['time'])).isoformat(timespec='seconds'),
+        'width': int(record['width']),
+        'height': int(record['height']),
+        'rain_pixels': sum(counts[1:]),
+        'max_class': max(rain_classes) if rain_classes else 0,
+        'class_counts': counts
+    }
+
+def build_history_raw(frames):
+    """Rasters comprimidos em multipart/mixed (zlib, uint8 linha a linha), sem recomprimir"""
+    parts = []
+    for record, payload in frames:
+        header = (f'--{HISTORY_BOUNDARY}\r\n'
+                  f'Content-Type: application/zlib\r\n'
+                  f'Content-Length: {len(payload)}\r\n'
+                  f'X-Frame-Time: {datetime.fromtimestamp(float(record["time"])).isoformat(timespec="seconds")}\r\n'
+                  f'X-Frame-Size: {int(record["width"])}x{int(record["height"])}\r\n\r\n')
+        parts.extend((header.encode(), payload, b'\r\n'))
+    parts.append(f'--{HISTORY_BOUNDARY}--\r\n'.encode())
+    return b''.join(parts)
+
+# ============================================
+# ACUMULADO DE CHUVA (JANELAS DESLIZANTES)
+# ============================================
+
+# Taxa representativa (mm/h) de cada classe, pela legenda (ver filter_rain_only):
+# verde ~5 mm/h, amarelo/laranja 10-100 mm/h, vermelho/magenta >100 mm/h
+RAIN_RATE_MM_H = np.array([0, 5, 10, 20, 50, 100, 150], dtype=np.int32)
+ACCUM_WINDOWS = {'1h': 3600, '3h': 3 * 3600, '24h': 24 * 3600}
+ACCUM_MAX_GAP = 900         # duração máxima atribuída a um frame (s): queda da fonte não vira chuva
+ACCUM_DEFAULT_STEP = 300    # duração do primeiro frame (sem anterior)
+ACCUM_THRESHOLDS = [1, 5, 10, 25, 50, 100]  # mm: áreas de excedência no JSON
+# Faixas do overlay PNG (mm acumulados -> cor); abaixo da primeira, transparente
+ACCUM_BANDS = [
+    (0.5, (190, 230, 255)),
+    (1, (120, 190, 255)),
+    (5, (40, 120, 240)),
+    (10, (0, 200, 80)),
+    (25, (255, 230, 0)),
+    (50, (255, 140, 0)),
+    (100, (230, 0, 0)),
+    (150, (200, 0, 200))
+]
+ACCUM_EXCEEDANCE_COLOR = (230, 0, 0)
+ACCUM_DIR = os.path.join(CACHE_DIR, 'accumulation')
+ACCUM_CACHE_MAX_ITEMS = 24
+
+# Estado por radar (somas inteiras em mm/h x s por pixel, exatas ao somar e subtrair):
+# {'mtime_ns', 'times', 'steps', 'starts': {janela: horário do frame mais antigo}, 'sums': {janela: int32}}
+accum_states = {radar: None for radar in RADAR_DIRS}
+accum_lock = threading.Lock()
+accum_cache = OrderedDict()  # (radar, janela, limiar, formato, versão) -> (corpo, etag)
+accum_cache_lock = threading.Lock()
+
+def accumulation_path(radar):
+    """Estado do acumulado de um radar, compartilhado entre os workers"""
+    return os.path.join(ACCUM_DIR, f'{radar}.npz')
+
+def load_accumulation(radar):
+    """
+    Estado do acumulado gravado pelo sync (o processo líder). Outros workers
+    recarregam só quando o arquivo muda (um stat por chamada).
+    """
+    try:
+        mtime_ns = os.stat(accumulation_path(radar)).st_mtime_ns
+    except OSError:
+        return None
+    state = accum_states[radar]
+    if state is not None and state['mtime_ns'] == mtime_ns:
+        return state
+    with np.load(accumulation_path(radar)) as data:
+        state = {
+            'mtime_ns': mtime_ns,
+            'times': data['times'].tolist(),
+            'steps': data['steps'].tolist(),
+            'starts': dict(zip(ACCUM_WINDOWS, data['starts'].tolist())),
+            'sums': {window: data[f'sum_{window}'] for window in ACCUM_WINDOWS}
+        }
+    accum_states[radar] = state
+    return state
+
+def save_accumulation(radar, state):
+    """Grava o estado (temporário + rename) para os demais workers"""
+    os.makedirs(ACCUM_DIR, exist_ok=True)
+    path = accumulation_path(radar)
+    tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, times=np.array(state['times'], dtype=np.float64),
+             steps=np.array(state['steps'], dtype=np.int32),
+             starts=np.array([state['starts'][w] for w in ACCUM_WINDOWS], dtype=np.float64),
+             **{f'sum_{window}': state['sums'][window] for window in ACCUM_WINDOWS})
+    os.replace(tmp_path, path)
+    state['mtime_ns'] = os.stat(path).st_mtime_ns
+    accum_states[radar] = state
+
+def history_raster(record, payload):
+    """Raster de classes de um frame do histórico"""
+    return np.frombuffer(zlib.decompress(payload), dtype=np.uint8).reshape(int(record['height']), int(record['width']))
+
+def frame_rainfall(classes, step):
+    """Contribuição de um frame: taxa da classe (mm/h) x duração (s), por pixel"""
+    contribution = np.take(RAIN_RATE_MM_H, classes)
+    contribution *= step
+    return contribution
+
+def new_accumulation_state():
+    """Estado vazio: as janelas começam no primeiro frame somado"""
+    return {'times': [], 'steps': [], 'starts': {window: None for window in ACCUM_WINDOWS}, 'sums': None}
+
+def accumulate_frames(radar, state, frames):
+    """
+    Soma frames (em ordem cronológica) às janelas e subtrai os que saíram de
+    cada uma. Cada janela é um sufixo de state['times'], a partir de
+    state['starts'][janela], e termina no frame mais recente.
+    LookupError se um frame a subtrair não estiver mais no histórico.
+    """
+    for record, payload in frames:
+        timestamp = float(record['time'])
+        classes = history_raster(record, payload)
+        if state['sums'] is not None and state['sums']['1h'].shape != classes.shape:
+            print(f'Acumulado {radar}: tamanho do frame mudou, janelas reiniciadas')
+            state.update(new_accumulation_state())
+        if state['sums'] is None:
+            state['sums'] = {window: np.zeros(classes.shape, dtype=np.int32) for window in ACCUM_WINDOWS}
+
+        times = state['times']
+        step = int(round(min(timestamp - times[-1], ACCUM_MAX_GAP))) if times else ACCUM_DEFAULT_STEP
+        contribution = frame_rainfall(classes, step)
+        times.append(timestamp)
+        state['steps'].append(step)
+
+        for window, seconds in ACCUM_WINDOWS.items():
+            state['sums'][window] += contribution
+            if state['starts'][window] is None:
+                state['starts'][window] = timestamp
+            first = bisect.bisect_left(times, state['starts'][window])
+            last = bisect.bisect_right(times, timestamp - seconds)
+            for i in range(first, last):
+                expired = read_history(radar, times[i], times[i], payloads=True)
+                if not expired:
+                    raise LookupError(times[i])
+                state['sums'][window] -= frame_rainfall(history_raster(*expired[0]), state['steps'][i])
+            state['starts'][window] = times[max(first, last)]
+
+    # Frames anteriores à maior janela não são mais necessários
+    keep = bisect.bisect_left(state['times'], min(state['starts'].values()))
+    del state['times'][:keep]
+    del state['steps'][:keep]
+
+def update_accumulation(radar):
+    """
+    Soma os frames novos do histórico às janelas de 1h/3h/24h (chamado no fim
+    do sync). Custo proporcional aos frames novos: os que saem de uma janela
+    são relidos do histórico e subtraídos. Sem estado gravado (ou se um frame
+    a subtrair sumiu do histórico), reconstrói a partir das últimas 24 h.
+    Retorna o número de frames somados.
+    """
+    with accum_lock:
+        now = time.time()
+        loaded = load_accumulation(radar)
+        if loaded is not None and loaded['times']:
+            # Cópia: o estado carregado continua servindo requisições até ser substituído
+            state = {'times': list(loaded['times']), 'steps': list(loaded['steps']),
+                     'starts': dict(loaded['starts']),
+                     'sums': {window: sums.copy() for window, sums in loaded['sums'].items()}}
+            latest = state['times'][-1]
+            frames = [f for f in read_history(radar, latest, now, payloads=True) if float(f[0]['time']) > latest]
+            if not frames:
+                return 0
+            try:
+                accumulate_frames(radar, state, frames)
+                save_accumulation(radar, state)
+                return len(frames)
+            except LookupError as e:
+                print(f'Acumulado {radar}: frame {e} fora do histórico, reconstruindo')
+
+        state = new_accumulation_state()
+        frames = read_history(radar, now - max(ACCUM_WINDOWS.values()), now, payloads=True)
+        if not frames:
+            return 0
+        accumulate_frames(radar, state, frames)
+        save_accumulation(radar, state)
+        return len(frames)
+
+def accumulation_mm(state, window):
+    """Acumulado da janela em mm por pixel (float32)"""
+    return state['sums'][window].astype(np.float32) / 3600
+
+def accumulation_stats(radar, state, window):
+    """Estatísticas JSON de uma janela (máximo, média na área com chuva, áreas de excedência)"""
+    mm = accumulation_mm(state, window)
+    rain = mm[mm > 0]
+    start = state['starts'][window]
+    end = state['times'][-1]
+    count = len(state['times']) - bisect.bisect_left(state['times'], start)
+    return {
+        'radar': radar,
+        'window': window,
+        'start': datetime.fromtimestamp(start).isoformat(timespec='seconds'),
+        'end': datetime.fromtimestamp(end).isoformat(timespec='seconds'),
+        'frames': count,
+        'width': int(mm.shape[1]),
+        'height': int(mm.shape[0]),
+        'max_mm': round(float(mm.max()), 2),
+        'mean_mm': round(float(rain.mean()), 2) if rain.size else 0.0,
+        'rain_pixels': int(rain.size),
+        'exceedance': {str(threshold): int((rain >= threshold).sum()) for threshold in ACCUM_THRESHOLDS},
+        'rates_mm_h': RAIN_RATE_MM_H[1:].tolist()
+    }
+
+def render_accumulation_png(state, window, threshold=None):
+    """
+    Overlay PNG com paleta do acumulado: faixas de ACCUM_BANDS ou, com
+    threshold, só os pixels que atingiram o limiar (mapa de excedência).
+    """
+    mm = accumulation_mm(state, window)
+    if threshold is not None:
+        indices = (mm >= threshold).astype(np.uint8)
+        colors = [(0, 0, 0), ACCUM_EXCEEDANCE_COLOR]
+    else:
+        indices = np.searchsorted(np.array([band for band, _ in ACCUM_BANDS], dtype=np.float32),
+                                  mm, side='right').astype(np.uint8)
+        colors = [(0, 0, 0)] + [color for _, color in ACCUM_BANDS]
+    img = Image.fromarray(indices, 'P')
+    img.putpalette([channel for color in colors for channel in color])
+    output = BytesIO()
+    img.save(output, format='PNG', transparency=bytes([0] + [200] * (len(colors) - 1)))
+    return output.getvalue()
+
+def get_accumulation(radar, window, threshold=None, fmt='json'):
+    """
+    Resposta pronta (JSON ou PNG) do acumulado e sua versão (ETag), em cache
+    por versão do estado. None se ainda não houver acumulado.
+    """
+    state = load_accumulation(radar)
+    if state is None or not state['times']:
+        return None
+    version = state['mtime_ns']
+    key = (radar, window, threshold, fmt, version)
+    with accum_cache_lock:
+        entry = accum_cache.get(key)
+        if entry is not None:
+            accum_cache.move_to_end(key)
+    inc_metric('radar_cache_requests_total', cache='accumulation', result='miss' if entry is None else 'hit')
+    if entry is not None:
+        return entry
+
+    if fmt == 'png':
+        body = render_accumulation_png(state, window, threshold)
+    else:
+        body = json.dumps(accumulation_stats(radar, state, window))
+    entry = (body, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    with accum_cache_lock:
+        accum_cache[key] = entry
+        while len(accum_cache) > ACCUM_CACHE_MAX_ITEMS:
+            accum_cache.popitem(last=False)
+    return entry
+
+# ============================================
+# ESTATÍSTICAS POR REGIÃO (BAIRROS)
+# ============================================
+
+# Polígonos das regiões em GeoJSON (nome na propriedade 'nome'). O arquivo
+# incluído tem contornos simplificados de alguns bairros do Rio; REGIONS_FILE
+# pode apontar para os limites oficiais (ex.: bairros do Data.Rio)
+REGIONS_FILE = os.environ.get('REGIONS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regions.geojson'))
+REGIONS_NAME_KEYS = ('nome', 'NOME', 'name', 'NAME')
+REGIONS_SERIES_HOURS = 6     # série por região guardada no state.db
+REGIONS_DEFAULT_HOURS = 1    # série devolvida por padrão em /api/regions
+
+# (radar, altura, largura) -> (pixels dentro de alguma região, rótulo da região x classes)
+region_rasters = {}
+region_rasters_lock = threading.Lock()
+
+def load_regions(path):
+    """
+    Lê as regiões (Polygon ou MultiPolygon; cada polígono é [anel externo,
+    buracos...] em lng/lat). Os ids seguem a ordem do arquivo, a partir de 1.
+    A versão muda com o arquivo ou com RADAR_BOUNDS (invalida as séries).
+    """
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        collection = json.loads(content)
+    except (OSError, ValueError) as e:
+        print(f'⚠️  AVISO: regiões não carregadas ({path}): {e}')
+        return {'regions': [], 'version': None}
+
+    regions = []
+    for feature in collection.get('features', []):
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'Polygon':
+            polygons = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            continue
+        properties = feature.get('properties') or {}
+        region_id = len(regions) + 1
+        name = next((str(properties[key]) for key in REGIONS_NAME_KEYS if properties.get(key)), f'Região {region_id}')
+        regions.append({'id': region_id, 'name': name, 'polygons': polygons})
+    version = hashlib.sha1(content + json.dumps(RADAR_BOUNDS).encode()).hexdigest()[:12]
+    return {'regions': regions, 'version': version}
+
+REGIONS = load_regions(REGIONS_FILE)
+
+def mercator_y(lat):
+    """Coordenada y em Web Mercator (a projeção do mapa)"""
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+def rasterize_regions(radar, height, width):
+    """
+    Raster de rótulos (0 = fora de qualquer região) no grid do frame. O
+    overlay do Leaflet estica o frame em Web Mercator: x é linear na
+    longitude e y em mercator_y(lat). Polígonos maiores são desenhados
+    primeiro, para que enclaves nos buracos de outra região fiquem por cima.
+    """
+    (south, west), (north, east) = RADAR_BOUNDS[radar]
+    top, bottom = mercator_y(north), mercator_y(south)
+
+    def to_pixels(ring):
+        return [((point[0] - west) / (east - west) * width,
+                 (top - mercator_y(point[1])) / (top - bottom) * height) for point in ring]
+
+    shapes = []
+    for region in REGIONS['regions']:
+        for polygon in region['polygons']:
+            rings = [to_pixels(ring) for ring in polygon if len(ring) >= 3]
+            if rings:
+                exterior = rings[0]
+                area = abs(sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(exterior, exterior[1:] + exterior[:1])))
+                shapes.append((area, region['id'], rings))
+
+    img = Image.new('I', (width, height), 0)
+    draw = ImageDraw.Draw(img)
+    for _, region_id, rings in sorted(shapes, key=lambda shape: -shape[0]):
+        draw.polygon(rings[0], fill=region_id)
+        for hole in rings[1:]:
+            draw.polygon(hole, fill=0)
+    return np.array(img, dtype=np.int32)
+
+def region_index(radar, shape):
+    """Pixels das regiões no grid do frame, rasterizados uma vez por radar e tamanho de frame"""
+    key = (radar,) + shape
+    with region_rasters_lock:
+        entry = region_rasters.get(key)
+        if entry is None:
+            labels = rasterize_regions(radar, *shape).ravel()
+            pixels = np.flatnonzero(labels)
+            entry = (pixels, labels[pixels].astype(np.intp) * HISTORY_CLASSES)
+            region_rasters[key] = entry
+    return entry
+
+def region_histogram(radar, classes):
+    """Pixels por classe de chuva em cada região: uint32 [regiões, classes], num único bincount"""
+    pixels, base = region_index(radar, classes.shape)
+    counts = np.bincount(base + classes.ravel()[pixels], minlength=(len(REGIONS['regions']) + 1) * HISTORY_CLASSES)
+    return counts.reshape(-1, HISTORY_CLASSES)[1:].astype(np.uint32)
+
+def update_region_stats(radar):
+    """
+    Grava no state.db o histograma por região dos frames novos do histórico
+    (chamado no fim do sync) e descarta o que passou de REGIONS_SERIES_HOURS.
+    Retorna o número de frames processados.
+    """
+    if not REGIONS['regions']:
+        return 0
+    now = time.time()
+    version = REGIONS['version']
+    latest = state_query('SELECT MAX(time) FROM region_stats WHERE radar = ? AND version = ?', (radar, version))[0][0]
+    if latest is None:
+        latest = now - REGIONS_SERIES_HOURS * 3600
+    frames = [f for f in read_history(radar, latest, now, payloads=True) if float(f[0]['time']) > latest]
+    for record, payload in frames:
+        counts = region_histogram(radar, history_raster(record, payload))
+        state_query('INSERT OR REPLACE INTO region_stats (radar, time, version, counts) VALUES (?, ?, ?, ?)',
+                    (radar, float(record['time']), version, counts.tobytes()))
+    state_query('DELETE FROM region_stats WHERE radar = ? AND (time < ? OR version != ?)',
+                (radar, now - REGIONS_SERIES_HOURS * 3600, version))
+    return len(frames)
+
+def find_regions(query):
+    """Regiões pelo id ou nome (sem diferenciar maiúsculas); todas se query for vazio"""
+    if not query:
+        return REGIONS['regions']
+    query = query.strip().casefold()
+    return [region for region in REGIONS['regions'] if str(region['id']) == query or region['name'].casefold() == query]
+
+def region_stats(radar, hours, regions):
+    """
+    Valores do frame mais recente e série das últimas `hours` horas (até ele)
+    por região: cobertura de chuva, classe máxima e taxa média (mm/h, pelas
+    taxas de RAIN_RATE_MM_H). None se ainda não houver estatísticas.
+    """
+    version = REGIONS['version']
+    rows = state_query(
+        'SELECT time, counts FROM region_stats WHERE radar = ? AND version = ? AND time >= '
+        '(SELECT MAX(time) FROM region_stats WHERE radar = ? AND version = ?) - ? ORDER BY time',
+        (radar, version, radar, version, hours * 3600))
+    if not rows:
+        return None
+
+    counts = np.stack([np.frombuffer(blob, dtype=np.uint32).reshape(-1, HISTORY_CLASSES) for _, blob in rows])
+    total = counts.sum(axis=2).astype(np.float64)
+    valid = total > 0
+    total[~valid] = 1
+    coverage = (total - counts[:, :, 0]) / total
+    mean_rate = (counts @ RAIN_RATE_MM_H) / total
+    present = counts[:, :, :0:-1] > 0  # classes 6..1
+    max_class = np.where(present.any(axis=2), HISTORY_CLASSES - 1 - present.argmax(axis=2), 0)
+
+    # Séries por região (listas Python de uma vez; None onde a região não tem pixels)
+    series = {
+        'coverage': np.round(coverage, 3).T.tolist(),
+        'max_class': max_class.T.tolist(),
+        'mean_rate_mm_h': np.round(mean_rate, 2).T.tolist()
+    }
+    result = []
+    for region in regions:
+        i = region['id'] - 1
+        region_series = {key: values[i] for key, values in series.items()}
+        if not valid[:, i].all():
+            region_series = {key: [v if ok else None for v, ok in zip(values, valid[:, i])]
+                             for key, values in region_series.items()}
+        latest = {key: values[-1] for key, values in region_series.items()}
+        result.append({
+            'id': region['id'],
+            'name': region['name'],
+            'pixels': int(total[-1, i]) if valid[-1, i] else 0,
+            **latest,
+            'max_rate_mm_h': int(RAIN_RATE_MM_H[latest['max_class']]) if latest['max_class'] is not None else None,
+            'series': region_series
+        })
+    return {
+        'radar': radar,
+        'time': datetime.fromtimestamp(rows[-1][0]).isoformat(timespec='seconds'),
+        'times': [datetime.fromtimestamp(t).isoformat(timespec='seconds') for t, _ in rows],
+        'regions': result,
+        'rates_mm_h': RAIN_RATE_MM_H[1:].tolist()
+    }
+
+# ============================================
+# ALERTAS AUTOMÁTICOS (REGRAS NO SYNC)
+# ============================================
+
+# Regra: chuva de classe >= min_class cobrindo >= min_pixels dentro de uma
+# região de REGIONS ('region': id ou nome) ou de um círculo ('circle': lat,
+# lng, radius_km). Avaliada pelo sync em cada frame novo do histórico
+ALERT_RULES_FILE = os.environ.get('ALERT_RULES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alert_rules.json'))
+# Destinos dos eventos, separados por vírgula: log, queue (arquivo JSONL local), webhook
+ALERT_SINKS = [sink.strip() for sink in os.environ.get('ALERT_SINKS', 'log').split(',') if sink.strip()]
+ALERT_WEBHOOK_URL = os.environ.get('ALERT_WEBHOOK_URL', '')
+ALERT_QUEUE_PATH = os.path.join(CACHE_DIR, 'alerts', 'queue.jsonl')
+ALERT_CONFIG = {
+    'clear_ratio': 0.5,         # histerese: alerta ativo só encerra com área < min_pixels x clear_ratio
+    'clear_frames': 2,          # ... por esse número de frames seguidos
+    'max_catchup': 3600,        # após uma parada, avalia no máximo a última hora de frames
+    'recent_events': 100,       # eventos guardados para /api/alerts
+    'webhook_timeout': (3, 5),  # (conexão, leitura) em segundos
+    'webhook_retries': 3        # tentativas por evento (1 s, 2 s, ... entre elas)
+}
+
+# (regra, radar, altura, largura) -> índices dos pixels da área da regra
+alert_masks = {}
+alert_masks_lock = threading.Lock()
+alert_webhook_executor = ThreadPoolExecutor(max_workers=1)  # entrega fora da thread do sync
+
+def load_alert_rules(path):
+    """
+    Lê e valida as regras (lista JSON). Regras inválidas são ignoradas com
+    aviso; clear_pixels (histerese) é min_pixels x clear_ratio se omitido.
+    """
+    try:
+        with open(path) as f:
+            items = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        print(f'⚠️  AVISO: regras de alerta não carregadas ({path}): {e}')
+        return []
+
+    rules = []
+    for item in items:
+        try:
+            rule = {
+                'id': str(item['id']),
+                'name': item.get('name', str(item['id'])),
+                'radar': item.get('radar', 'mendanha'),
+                'min_class': int(item['min_class']),
+                'min_pixels': int(item['min_pixels'])
+            }
+            rule['clear_pixels'] = int(item.get('clear_pixels', math.ceil(rule['min_pixels'] * ALERT_CONFIG['clear_ratio'])))
+            if 'region' in item:
+                regions = find_regions(str(item['region']))
+                if len(regions) != 1:
+                    raise ValueError(f"região {item['region']!r} não encontrada")
+                rule['region'] = regions[0]['id']
+            elif 'circle' in item:
+                rule['circle'] = {key: float(item['circle'][key]) for key in ('lat', 'lng', 'radius_km')}
+            else:
+                raise ValueError('defina region ou circle')
+            if rule['radar'] not in RADAR_DIRS or not 1 <= rule['min_class'] < HISTORY_CLASSES or rule['min_pixels'] < 1:
+                raise ValueError('radar, min_class ou min_pixels inválido')
+            if any(r['id'] == rule['id'] for r in rules):
+                raise ValueError('id repetido')
+        except (KeyError, TypeError, ValueError) as e:
+            print(f'⚠️  AVISO: regra de alerta ignorada ({item!r}): {e}')
+            continue
+        rules.append(rule)
+    return rules
+
+ALERT_RULES = load_alert_rules(ALERT_RULES_FILE)
+
+def circle_pixels(radar, shape, circle):
+    """Pixels do frame cujo centro está a até radius_km do ponto (mesma projeção de rasterize_regions)"""
+    height, width = shape
+    (south, west), (north, east) = RADAR_BOUNDS[radar]
+    top, bottom = mercator_y(north), mercator_y(south)
+    x = (np.arange(width) + 0.5) / width * (east - west) + west
+    y = top - (np.arange(height) + 0.5) / height * (top - bottom)
+    lat = np.degrees(2 * np.arctan(np.exp(y)) - math.pi / 2)
+    # Distância equiretangular (raios de poucas dezenas de km)
+    dx = (x - circle['lng']) * 111.32 * math.cos(math.radians(circle['lat']))
+    dy = (lat - circle['lat']) * 110.57
+    inside = dy[:, None] ** 2 + dx[None, :] ** 2 <= circle['radius_km'] ** 2
+    return np.flatnonzero(inside)
+
+def alert_rule_pixels(rule, radar, shape):
+    """Área da regra no grid do frame, calculada uma vez por tamanho de frame"""
+    key = (rule['id'], radar) + shape
+    with alert_masks_lock:
+        pixels = alert_masks.get(key)
+    if pixels is None:
+        if 'region' in rule:
+            region_pixels, base = region_index(radar, shape)
+            pixels = region_pixels[base == rule['region'] * HISTORY_CLASSES]
+        else:
+            pixels = circle_pixels(radar, shape, rule['circle'])
+        with alert_masks_lock:
+            alert_masks[key] = pixels
+    return pixels
+
+def evaluate_alert_rule(rule, radar, classes):
+    """(pixels com classe >= min_class na área da regra, classe máxima na área)"""
+    values = classes.ravel()[alert_rule_pixels(rule, radar, classes.shape)]
+    if values.size == 0:
+        return 0, 0
+    return int(np.count_nonzero(values >= rule['min_class'])), int(values.max())
+
+def alert_event(kind, rule, radar, timestamp, status, area, max_class):
+    """Evento entregue aos destinos; 'id' é o mesmo no início e no fim do alerta (deduplicação)"""
+    return {
+        'id': f"{rule['id']}:{radar}:{int(status['since'])}",
+        'type': kind,
+        'rule': rule['id'],
+        'name': rule['name'],
+        'radar': radar,
+        'time': datetime.fromtimestamp(timestamp).isoformat(timespec='seconds'),
+        'since': datetime.fromtimestamp(status['since']).isoformat(timespec='seconds'),
+        'area_pixels': area,
+        'max_class': max_class,
+        'peak_area_pixels': status['peak_area'],
+        'peak_class': status['peak_class'],
+        'min_class': rule['min_class'],
+        'min_pixels': rule['min_pixels']
+    }
+
+def step_alert_rule(rule, radar, timestamp, status, area, max_class):
+    """
+    Máquina de estados de uma regra em um frame. Dispara quando a área
+    atinge min_pixels; depois só encerra após clear_frames frames seguidos
+    abaixo de clear_pixels (histerese), então oscilações em torno do limiar
+    não geram alertas repetidos. Retorna (novo estado, evento ou None).
+    """
+    if not status.get('active'):
+        if area < rule['min_pixels']:
+            return status, None
+        status = {'active': True, 'since': timestamp, 'below': 0, 'peak_area': area, 'peak_class': max_class}
+        return status, alert_event('alert', rule, radar, timestamp, status, area, max_class)
+
+    status = dict(status, peak_area=max(status['peak_area'], area), peak_class=max(status['peak_class'], max_class))
+    if area >= rule['clear_pixels']:
+        status['below'] = 0
+        return status, None
+    status['below'] += 1
+    if status['below'] < ALERT_CONFIG['clear_frames']:
+        return status, None
+    return {'active': False}, alert_event('clear', rule, radar, timestamp, status, area, max_class)
+
+def evaluate_alerts(radar):
+    """
+    Avalia as regras do radar nos frames novos do histórico (chamado no fim
+    do sync). O estado de cada regra fica no state.db, então um reinício ou
+    a troca de líder não repete alertas. Na primeira execução só o frame
+    mais recente é avaliado. Retorna os eventos gerados (já entregues).
+    """
+    rules = [rule for rule in ALERT_RULES if rule['radar'] == radar]
+    if not rules:
+        return []
+    now = time.time()
+    state = get_state(f'alerts:{radar}', {'last': None, 'rules': {}})
+    if state['last'] is None:
+        frames = read_history(radar, now - ALERT_CONFIG['max_catchup'], now, payloads=True)[-1:]
+    else:
+        start = max(state['last'], now - ALERT_CONFIG['max_catchup'])
+        frames = [f for f in read_history(radar, start, now, payloads=True) if float(f[0]['time']) > state['last']]
+    if not frames:
+        return []
+
+    events = []
+    for record, payload in frames:
+        timestamp = float(record['time'])
+        classes = history_raster(record, payload)
+        for rule in rules:
+            area, max_class = evaluate_alert_rule(rule, radar, classes)
+            status, event = step_alert_rule(rule, radar, timestamp, state['rules'].get(rule['id'], {}), area, max_class)
+            state['rules'][rule['id']] = status
+            if event:
+                events.append(event)
+    state['last'] = float(frames[-1][0]['time'])
+    # Regras removidas do arquivo deixam de existir no estado
+    state['rules'] = {rule['id']: state['rules'][rule['id']] for rule in rules if rule['id'] in state['rules']}
+    set_state(f'alerts:{radar}', state)
+
+    if events:
+        recent = get_state('alerts:events', [])
+        set_state('alerts:events', (recent + events)[-ALERT_CONFIG['recent_events']:])
+        deliver_alerts(events)
+    return events
+
+def send_alert_log(event):
+    print(f"🚨 Alerta {'iniciado' if event['type'] == 'alert' else 'encerrado'}: {event['name']} "
+          f"({event['radar']}, {event['time']}, {event['area_pixels']} pixels, classe máx. {event['max_class']})")
+
+def send_alert_queue(event):
+    """Fila local: uma linha JSON por evento, para outro processo consumir"""
+    os.makedirs(os.path.dirname(ALERT_QUEUE_PATH), exist_ok=True)
+    with open(ALERT_QUEUE_PATH, 'a') as f:
+        flock_exclusive(f)
+        f.write(json.dumps(event) + '\n')
+
+def post_alert_webhook(event):
+    """POST do evento em JSON, com novas tentativas (roda no alert_webhook_executor)"""
+    for attempt in range(ALERT_CONFIG['webhook_retries']):
+        try:
+            response = requests.post(ALERT_WEBHOOK_URL, json=event, timeout=ALERT_CONFIG['webhook_timeout'])
+            if response.status_code < 300:
+                return True
+            error = f'HTTP {response.status_code}'
+        except requests.RequestException as e:
+            error = e
+        print(f"Erro no webhook de alerta ({event['id']}, tentativa {attempt + 1}): {error}")
+        if attempt + 1 < ALERT_CONFIG['webhook_retries']:
+            time.sleep(2 ** attempt)
+    return False
+
+def send_alert_webhook(event):
+    if ALERT_WEBHOOK_URL:
+        return alert_webhook_executor.submit(post_alert_webhook, event)
+
+ALERT_SINK_HANDLERS = {
+    'log': send_alert_log,
+    'queue': send_alert_queue,
+    'webhook': send_alert_webhook
+}
+
+def deliver_alerts(events):
+    """Entrega os eventos a cada destino de ALERT_SINKS (falha em um não impede os outros)"""
+    for sink in ALERT_SINKS:
+        handler = ALERT_SINK_HANDLERS.get(sink)
+        if handler is None:
+            continue
+        for event in events:
+            try:
+                handler(event)
+            except Exception as e:
+                print(f'Erro ao entregar alerta ({sink}): {e}')
+
+# ============================================
+# NOWCAST (EXTRAPOLAÇÃO POR CAMPO DE MOVIMENTO)
+# ============================================
+
+# A cada sync, estima um campo de movimento denso entre os frames recentes
+# do histórico (block matching vetorizado num raster reduzido) e desloca o
+# último frame ao longo dele para gerar as previsões de +10/+20/+30 min
+NOWCAST_LEADS = [10, 20, 30]   # minutos à frente do último frame
+NOWCAST_CONFIG = {
+    'scale': 4,         # redução do raster de classes para estimar o movimento
+    'block': 8,         # blocos de 8x8 no raster reduzido (32x32 pixels)
+    'search': 4,        # deslocamento máximo por intervalo, no raster reduzido (16 pixels)
+    'pairs': 3,         # pares de frames consecutivos combinados no custo
+    'max_gap': 900,     # frames mais espaçados que isso (s) não formam par
+    'min_rain': 0.05,   # fração de chuva no bloco para o vetor ser confiável
+    'min_contrast': 0.1,  # melhor custo pelo menos 10% abaixo do custo médio do bloco
+    'step': 300         # passo da advecção (s)
+}
+# Mesmas cores de intensityColors no index.html (classes 1..6)
+NOWCAST_COLORS = [(0, 255, 0), (0, 136, 0), (255, 255, 0), (255, 153, 0), (255, 0, 0), (255, 0, 255)]
+NOWCAST_DIR = os.path.join(CACHE_DIR, 'nowcast')
+# Frames de previsão sem ?v=: o sync seguinte pode refazê-los
+NOWCAST_CACHE_CONTROL = 'public, max-age=60'
+
+# radar -> (mtime do index.json, índice) lido por cada worker
+nowcast_indexes = {radar: None for radar in RADAR_DIRS}
+
+def coarse_field(classes):
+    """Classe média em blocos scale x scale (legenda zerada), base do block matching"""
+    scale, block = NOWCAST_CONFIG['scale'], NOWCAST_CONFIG['block']
+    cell = scale * block
+    height, width = classes.shape[0] // cell * cell, classes.shape[1] // cell * cell
+    field = classes[:height, :width].astype(np.float32)
+    legend_x, legend_y = LEGEND_AREA
+    field[:legend_y, :legend_x] = 0
+    return field.reshape(height // scale, scale, width // scale, scale).mean(axis=(1, 3))
+
+def parabolic_offset(minus, center, plus):
+    """Posição subpixel do mínimo pela parábola nos três custos vizinhos (em [-0.5, 0.5])"""
+    denominator = minus - 2 * center + plus
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(denominator > 0, (minus - plus) / (2 * denominator), 0)
+    return np.clip(offset, -0.5, 0.5)
+
+def estimate_motion(fields):
+    """
+    Block matching: para cada deslocamento (dy, dx) até ±search, soma das
+    diferenças absolutas, por bloco, entre cada campo e o anterior
+    deslocado, acumulada em todos os pares. Um laço por deslocamento, cada
+    um vetorizado sobre o raster inteiro.
+    Retorna (vy, vx, peso) por bloco, em pixels reduzidos por intervalo.
+    """
+    search, block = NOWCAST_CONFIG['search'], NOWCAST_CONFIG['block']
+    height, width = fields[-1].shape
+    rows, cols = height // block, width // block
+    size = 2 * search + 1
+    cost = np.zeros((size, size, rows, cols), dtype=np.float32)
+    for previous, current in zip(fields, fields[1:]):
+        padded = np.pad(previous, search)
+        for i in range(size):
+            for j in range(size):
+                # shifted(y, x) = previous(y - dy, x - dx), com dy = i - search, dx = j - search
+                shifted = padded[2 * search - i:2 * search - i + height, 2 * search - j:2 * search - j + width]
+                cost[i, j] += np.abs(current - shifted).reshape(rows, block, cols, block).sum(axis=(1, 3))
+
+    flat = cost.reshape(size * size, rows, cols)
+    best = flat.argmin(axis=0)
+    iy, ix = np.divmod(best, size)
+    by, bx = np.indices((rows, cols))
+    center = flat[best, by, bx]
+    interior_y = (iy > 0) & (iy < size - 1)
+    interior_x = (ix > 0) & (ix < size - 1)
+    cy0, cy1 = np.clip(iy - 1, 0, size - 1), np.clip(iy + 1, 0, size - 1)
+    cx0, cx1 = np.clip(ix - 1, 0, size - 1), np.clip(ix + 1, 0, size - 1)
+    vy = iy - search + np.where(interior_y, parabolic_offset(cost[cy0, ix, by, bx], center, cost[cy1, ix, by, bx]), 0)
+    vx = ix - search + np.where(interior_x, parabolic_offset(cost[iy, cx0, by, bx], center, cost[iy, cx1, by, bx]), 0)
+
+    # Confiável: bloco com chuva e mínimo bem definido (sem chuva, todo deslocamento custa igual)
+    rain = (fields[-1] > 0).reshape(rows, block, cols, block).mean(axis=(1, 3))
+    mean_cost = flat.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        contrast = np.where(mean_cost > 0, (mean_cost - center) / mean_cost, 0)
+    weight = ((rain >= NOWCAST_CONFIG['min_rain']) & (contrast >= NOWCAST_CONFIG['min_contrast'])).astype(np.float32)
+    return vy.astype(np.float32), vx.astype(np.float32), weight
+
+def box_sum(values):
+    """Soma em janela 3x3 (bordas com zero)"""
+    padded = np.pad(values, 1)
+    rows, cols = values.shape
+    return sum(padded[i:i + rows, j:j + cols] for i in range(3) for j in range(3))
+
+def smooth_motion(vy, vx, weight):
+    """
+    Média ponderada 5x5 dos vetores confiáveis (convolução normalizada).
+    Blocos sem vizinho confiável recebem o movimento médio; sem nenhum
+    vetor confiável, o campo é nulo (persistência).
+    """
+    total = weight.sum()
+    if total == 0:
+        return np.zeros_like(vy), np.zeros_like(vx)
+    mean_y, mean_x = (vy * weight).sum() / total, (vx * weight).sum() / total
+    den = box_sum(box_sum(weight))
+    smoothed = []
+    for values, mean in ((vy, mean_y), (vx, mean_x)):
+        num = box_sum(box_sum(values * weight))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            smoothed.append(np.where(den > 0, num / den, mean).astype(np.float32))
+    return smoothed
+
+def interpolation_matrix(size, count, cell):
+    """Pesos da interpolação linear de `count` centros de bloco (de `cell` pixels) para `size` pixels"""
+    position = np.clip((np.arange(size) + 0.5) / cell - 0.5, 0, count - 1)
+    low = np.floor(position).astype(np.intp)
+    high = np.minimum(low + 1, count - 1)
+    fraction = (position - low).astype(np.float32)
+    matrix = np.zeros((size, count), dtype=np.float32)
+    rows = np.arange(size)
+    np.add.at(matrix, (rows, low), 1 - fraction)
+    np.add.at(matrix, (rows, high), fraction)
+    return matrix
+
+def sample_bilinear(grid, y, x):
+    """Valores de `grid` nas posições fracionárias (y, x), limitadas à grade"""
+    rows, cols = grid.shape
+    y = np.clip(y, 0, rows - 1)
+    x = np.clip(x, 0, cols - 1)
+    y0, x0 = np.floor(y).astype(np.intp), np.floor(x).astype(np.intp)
+    y1, x1 = np.minimum(y0 + 1, rows - 1), np.minimum(x0 + 1, cols - 1)
+    fy, fx = y - y0, x - x0
+    return ((grid[y0, x0] * (1 - fx) + grid[y0, x1] * fx) * (1 - fy)
+            + (grid[y1, x0] * (1 - fx) + grid[y1, x1] * fx) * fy)
+
+def advect(classes, vy, vx, leads):
+    """
+    Advecção semi-lagrangiana para trás com o campo por bloco (pixels/s).
+    As trajetórias são integradas nos centros dos blocos (o campo só varia
+    nessa escala), em passos de NOWCAST_CONFIG['step'] com o campo
+    interpolado na posição atual; o deslocamento total é interpolado para
+    cada pixel e cada previsão é uma única indexação do último frame.
+    Retorna um raster de classes por antecedência (segundos).
+    """
+    height, width = classes.shape
+    cell = NOWCAST_CONFIG['scale'] * NOWCAST_CONFIG['block']
+    rows = interpolation_matrix(height, vy.shape[0], cell)
+    cols = interpolation_matrix(width, vy.shape[1], cell)
+    source = classes.copy()
+    legend_x, legend_y = LEGEND_AREA
+    source[:legend_y, :legend_x] = 0
+
+    by, bx = np.indices(vy.shape, dtype=np.float32)
+    py, px = by.copy(), bx.copy()
+    ys, xs = np.arange(height, dtype=np.float32)[:, None], np.arange(width, dtype=np.float32)[None, :]
+    elapsed = 0
+    forecasts = []
+    for lead in leads:
+        while elapsed < lead:
+            dt = min(NOWCAST_CONFIG['step'], lead - elapsed)
+            step_y, step_x = sample_bilinear(vy, py, px), sample_bilinear(vx, py, px)
+            py -= step_y * dt / cell
+            px -= step_x * dt / cell
+            elapsed += dt
+        iy = np.rint(ys + rows @ ((py - by) * cell) @ cols.T).astype(np.intp)
+        ix = np.rint(xs + rows @ ((px - bx) * cell) @ cols.T).astype(np.intp)
+        inside = (iy >= 0) & (iy < height) & (ix >= 0) & (ix < width)
+        forecast = np.zeros_like(classes)
+        forecast[inside] = source[iy[inside], ix[inside]]
+        forecasts.append(forecast)
+    return forecasts
+
+def render_classes_png(classes):
+    """PNG com paleta de um raster de classes (classe 0 transparente)"""
+    img = Image.fromarray(classes, 'P')
+    img.putpalette([0, 0, 0] + [channel for color in NOWCAST_COLORS for channel in color])
+    output = BytesIO()
+    img.save(output, format='PNG', transparency=bytes([0] + [255] * len(NOWCAST_COLORS)))
+    return output.getvalue()
+
+def nowcast_index_path(radar):
+    return os.path.join(NOWCAST_DIR, radar, 'index.json')
+
+def load_nowcast_index(radar):
+    """Índice da previsão atual, relido só quando o sync grava um novo"""
+    try:
+        mtime_ns = os.stat(nowcast_index_path(radar)).st_mtime_ns
+    except OSError:
+        return None
+    cached = nowcast_indexes[radar]
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    with open(nowcast_index_path(radar)) as f:
+        index = json.load(f)
+    nowcast_indexes[radar] = (mtime_ns, index)
+    return index
+
+def motion_summary(radar, vy, vx, weight, shape):
+    """Velocidade (km/h) e direção (graus, para onde a chuva vai) médias dos blocos confiáveis"""
+    total = weight.sum()
+    if total == 0:
+        return {'speed_kmh': 0.0, 'direction_deg': None}
+    (south, west), (north, east) = RADAR_BOUNDS[radar]
+    km_x = (east - west) * 111.32 * math.cos(math.radians((north + south) / 2)) / shape[1]
+    km_y = (north - south) * 110.57 / shape[0]
+    east_kmh = float((vx * weight).sum() / total) * km_x * 3600
+    north_kmh = -float((vy * weight).sum() / total) * km_y * 3600
+    return {
+        'speed_kmh': round(math.hypot(east_kmh, north_kmh), 1),
+        'direction_deg': round(math.degrees(math.atan2(east_kmh, north_kmh)) % 360)
+    }
+
+def update_nowcast(radar):
+    """
+    Gera as previsões a partir do último frame do histórico (chamado no fim
+    do sync; nada a fazer se ele não mudou). Os PNGs têm o horário base no
+    nome (imutáveis); o conjunto anterior é mantido para quem ainda o está
+    carregando. Retorna o índice ou None sem frames suficientes.
+    """
+    now = time.time()
+    frames = read_history(radar, now - (NOWCAST_CONFIG['pairs'] + 1) * NOWCAST_CONFIG['max_gap'], now, payloads=True)
+    if len(frames) < 2:
+        return None
+    base = float(frames[-1][0]['time'])
+    previous = load_nowcast_index(radar)
+    if previous is not None and previous['base'] == base:
+        return previous
+
+    # Frames consecutivos (intervalo <= max_gap, mesmo tamanho) terminando no último
+    chain = [frames[-1]]
+    for frame in reversed(frames[:-1]):
+        record, last = frame[0], chain[-1][0]
+        if (len(chain) > NOWCAST_CONFIG['pairs'] or float(last['time']) - float(record['time']) > NOWCAST_CONFIG['max_gap']
+                or (record['width'], record['height']) != (last['width'], last['height'])):
+            break
+        chain.append(frame)
+    if len(chain) < 2:
+        return None
+    chain.reverse()
+    interval = (base - float(chain[0][0]['time'])) / (len(chain) - 1)
+
+    rasters = [history_raster(record, payload) for record, payload in chain]
+    latest = rasters[-1]
+    vy, vx, weight = estimate_motion([coarse_field(raster) for raster in rasters])
+    smooth_y, smooth_x = smooth_motion(vy, vx, weight)
+    # Pixels reduzidos por intervalo -> pixels por segundo
+    factor = NOWCAST_CONFIG['scale'] / interval
+    forecasts = advect(latest, smooth_y * factor, smooth_x * factor, [lead * 60 for lead in NOWCAST_LEADS])
+
+    directory = os.path.join(NOWCAST_DIR, radar)
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.fromtimestamp(base).strftime('%Y%m%d-%H%M%S')
+    names = []
+    versions = {}
+    for lead, forecast in zip(NOWCAST_LEADS, forecasts):
+        name = f'nowcast-{radar}-{stamp}-{lead:02d}.png'
+        body = render_classes_png(forecast)
+        write_atomic(os.path.join(directory, name), lambda f: f.write(body))
+        names.append(name)
+        versions[name] = hashlib.sha1(body).hexdigest()[:FRAME_VERSION_LENGTH]
+
+    index = {
+        'base': base,
+        'frames': names,
+        'versions': versions,
+        'valid': [base + lead * 60 for lead in NOWCAST_LEADS],
+        'lead_minutes': NOWCAST_LEADS,
+        'motion': motion_summary(radar, vy * factor, vx * factor, weight, latest.shape),
+        'etag': hashlib.sha1('|'.join(f'{name}:{versions[name]}' for name in names).encode()).hexdigest()
+    }
+    write_atomic(nowcast_index_path(radar), lambda f: f.write(json.dumps(index).encode()))
+
+    keep = set(names) | set(previous['frames'] if previous else [])
+    for filename in os.listdir(directory):
+        if filename.endswith('.png') and filename not in keep:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+    return index
+
+# ============================================
+# MOSAICO COMPOSTO (MENDANHA + SUMARÉ)
+# ============================================
+
+# Os dois radares são reprojetados numa grade comum (Web Mercator, como o
+# mapa) com índices pré-computados: cada frame de origem vira um único
+# gather. Frames do mesmo intervalo de 5 min são combinados pela maior
+# classe de chuva e servidos como o radar 'composite' (CMP-YYYYMMDD-HHMM.png).
+# A entrada é o histórico de classes, então nenhum PNG é decodificado.
+COMPOSITE_CONFIG = {
+    'width': 1536,    # largura da grade (a altura segue a proporção em Web Mercator)
+    'step': 300,      # intervalo de cada frame do mosaico (s)
+    'max_age': 600,   # frame de um radar vale para o intervalo se tiver até 10 min
+    'hours': 3        # janela reavaliada a cada sync (intervalos mais antigos não mudam)
+}
+COMPOSITE_LOCK = os.path.join(CACHE_DIR, 'sync-composite.lock')
+
+# (radar, altura, largura) -> remapeamento da origem para a grade do mosaico
+composite_remaps = {}
+composite_remaps_lock = threading.Lock()
+
+def composite_shape():
+    """Altura e largura da grade do mosaico (pixels quadrados no mapa)"""
+    (south, west), (north, east) = RADAR_BOUNDS['composite']
+    width = COMPOSITE_CONFIG['width']
+    height = round(width * (mercator_y(north) - mercator_y(south)) / math.radians(east - west))
+    return height, width
+
+def build_composite_remap(radar, height, width):
+    """
+    Para cada pixel da grade coberto pelo radar, o índice do pixel de origem
+    (vizinho mais próximo). x é linear na longitude e y em mercator_y(lat)
+    nos dois grids, então linhas e colunas são independentes e a área
+    coberta é um retângulo. A legenda da origem fica de fora.
+    Retorna (fatia de linhas, fatia de colunas, índices, pixels da legenda).
+    """
+    (south, west), (north, east) = RADAR_BOUNDS['composite']
+    grid_height, grid_width = composite_shape()
+    top, bottom = mercator_y(north), mercator_y(south)
+    lngs = west + (np.arange(grid_width) + 0.5) / grid_width * (east - west)
+    ys = top - (np.arange(grid_height) + 0.5) / grid_height * (top - bottom)
+
+    (south, west), (north, east) = RADAR_BOUNDS[radar]
+    top, bottom = mercator_y(north), mercator_y(south)
+    cols = np.floor((lngs - west) / (east - west) * width).astype(np.intp)
+    rows = np.floor((top - ys) / (top - bottom) * height).astype(np.intp)
+    valid_cols = np.flatnonzero((cols >= 0) & (cols < width))
+    valid_rows = np.flatnonzero((rows >= 0) & (rows < height))
+    if len(valid_cols) == 0 or len(valid_rows) == 0:
+        return None
+    row_slice = slice(valid_rows[0], valid_rows[-1] + 1)
+    col_slice = slice(valid_cols[0], valid_cols[-1] + 1)
+    rows, cols = rows[row_slice], cols[col_slice]
+
+    index = rows[:, None] * width + cols[None, :]
+    legend_x, legend_y = LEGEND_AREA
+    legend = np.flatnonzero((rows[:, None] < legend_y) & (cols[None, :] < legend_x))
+    return row_slice, col_slice, index, legend
+
+def composite_remap(radar, shape):
+    """Remapeamento de um radar, calculado uma vez por tamanho de frame"""
+    key = (radar,) + shape
+    with composite_remaps_lock:
+        if key not in composite_remaps:
+            composite_remaps[key] = build_composite_remap(radar, *shape)
+        return composite_remaps[key]
+
+def merge_into_composite(composite, radar, classes):
+    """Reprojeta um raster de classes e combina com o mosaico pela maior classe (in-place)"""
+    remap = composite_remap(radar, classes.shape)
+    if remap is None:
+        return
+    row_slice, col_slice, index, legend = remap
+    values = np.take(classes, index)
+    values.flat[legend] = 0
+    window = composite[row_slice, col_slice]
+    np.maximum(window, values, out=window)
+
+def composite_frame_name(slot):
+    return datetime.fromtimestamp(slot).strftime('CMP-%Y%m%d-%H%M.png')
+
+def composite_slots(times, start):
+    """
+    Frames de origem de cada intervalo do mosaico: {início: {radar: horário}}.
+    Um intervalo existe se algum radar tem frame nele; cada radar entra com
+    o último frame até o fim do intervalo, se tiver até max_age.
+    """
+    step, max_age = COMPOSITE_CONFIG['step'], COMPOSITE_CONFIG['max_age']
+    slots = {}
+    for slot in sorted({int(t // step) * step for radar_times in times.values() for t in radar_times if t >= start}):
+        end = slot + step
+        sources = {}
+        for radar, radar_times in times.items():
+            position = bisect.bisect_left(radar_times, end) - 1
+            if position >= 0 and radar_times[position] > end - max_age:
+                sources[radar] = radar_times[position]
+        slots[slot] = sources
+    return slots
+
+def update_composite():
+    """
+    Regrava os frames do mosaico cujos frames de origem mudaram (chamado no
+    fim do sync de cada radar). Um frame do Mendanha que chega atrasado
+    refaz só os intervalos em que entra. O lock de arquivo é o mesmo que
+    sync_in_progress consulta: o stream não publica o mosaico pela metade.
+    Retorna quantos frames foram gravados.
+    """
+    now = time.time()
+    start = now - COMPOSITE_CONFIG['hours'] * 3600
+    with open(COMPOSITE_LOCK, 'a+') as lock_file:
+        flock_exclusive(lock_file)
+        try:
+            frames = {radar: {float(record['time']): (record, payload)
+                              for record, payload in read_history(radar, start - COMPOSITE_CONFIG['max_age'], now, payloads=True)}
+                      for radar in COMPOSITE_SOURCES}
+            slots = composite_slots({radar: sorted(radar_frames) for radar, radar_frames in frames.items()}, start)
+            previous = get_state('composite:sources', {})
+
+            shape = composite_shape()
+            rasters = {}
+            written = 0
+            for slot, sources in slots.items():
+                name = composite_frame_name(slot)
+                if previous.get(str(slot)) == sources and os.path.exists(os.path.join(COMPOSITE_DIR, name)):
+                    continue
+                composite = np.zeros(shape, dtype=np.uint8)
+                for radar, timestamp in sources.items():
+                    # Um frame pode valer para dois intervalos seguidos: descomprimir uma vez
+                    key = (radar, timestamp)
+                    if key not in rasters:
+                        rasters[key] = history_raster(*frames[radar][timestamp])
+                    merge_into_composite(composite, radar, rasters[key])
+                body = render_classes_png(composite)
+                write_atomic(os.path.join(COMPOSITE_DIR, name), lambda f: f.write(body))
+                written += 1
+
+            set_state('composite:sources', {str(slot): sources for slot, sources in slots.items()})
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    clean_old_files(COMPOSITE_DIR, MAX_HOURS)
+    return written
+
+# ============================================
+# EXPORTAÇÃO DE ANIMAÇÕES (GIF, WEBP, APNG)
+# ============================================
+
+# Incrementar se a composição/quantização/codificação dos frames mudar
+EXPORT_VERSION = 2
+GIF_FRAME_DURATION = 500  # ms por frame
+GIF_MAX_FRAMES = 20       # Frames da exportação sem janela (os mais recentes)
+
+# formato -> (mimetype, extensão do arquivo)
+EXPORT_FORMATS = {
+    'gif': ('image/gif', 'gif'),
+    'webp': ('image/webp', 'webp'),
+    'apng': ('image/apng', 'png')
+}
+
+EXPORT_CONFIG = {
+    'max_frames': 72,       # Janela com from/to: até 6 h do Mendanha (evita DoS)
+    'max_step': 12,
+    'label_size': 22,       # px do horário sobreposto em 1024 px de altura
+    # Processos que codificam os frames (por worker); 0 codifica no próprio worker
+    'processes': int(os.environ.get('EXPORT_PROCESSES', '2'))
+}
+
+# Um lock por animação em construção: requisições simultâneas esperam a mesma build
+export_build_locks = {}
+export_build_locks_guard = threading.Lock()
+
+export_pool_state = {'pid': None, 'pool': None}
+export_pool_lock = threading.Lock()
+export_fonts = {}
+
+def export_frame_path(digest, fmt, size, label):
+    """Bloco de um frame já codificado, endereçado pelo SHA-1 da origem e pelas opções"""
+    suffix = hashlib.sha1(label.encode()).hexdigest()[:10] if label else 'plain'
+    return os.path.join(EXPORT_DIR, f'frame-v{EXPORT_VERSION}-{digest}-{fmt}-{size[0]}x{size[1]}-{suffix}.block')
+
+def export_key(radar, entries, fmt, size, timestamps):
+    """Chave da animação final: radar + opções + lista ordenada de frames (nome + SHA-1 do índice)"""
+    h = hashlib.sha1(f'{radar}:v{EXPORT_VERSION}:{fmt}:{size[0]}x{size[1]}:{int(timestamps)}'.encode())
+    for entry in entries:
+        h.update(f"|{entry['name']}:{entry['sha1']}".encode())
+    return h.hexdigest()
+
+def touch(path):
+    """Atualiza o mtime para que clean_old_files não remova arquivos ainda em uso"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def write_atomic(path, write):
+    """Grava via arquivo temporário + rename (leitores nunca veem arquivo parcial)"""
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def encode_gif_frame_block(frame):
+    """
+    Codifica um frame (modo P) como bloco GIF autocontido: descritor de imagem
+    com paleta local + dados LZW. Blocos podem ser concatenados em qualquer
+    ordem por write_gif, sem reabrir nem recodificar as imagens.
+    """
+    buffer = BytesIO()
+    frame.save(buffer, format='GIF')
+    data = buffer.getvalue()
+
+    # Cabeçalho (6) + descritor lógico da tela (7) + paleta global opcional
+    flags = data[10]
+    table_size = 3 * (2 ** ((flags & 0x07) + 1)) if flags & 0x80 else 0
+    global_table = data[13:13 + table_size]
+    pos = 13 + table_size
+
+    # Pular extensões até o descritor de imagem (0x2C)
+    while data[pos] == 0x21:
+        pos += 2
+        while data[pos]:
+            pos += data[pos] + 1
+        pos += 1
+
+    descriptor = bytearray(data[pos:pos + 10])
+    image_data = data[pos + 10:data.rindex(b'\x3b')]
+    if not descriptor[9] & 0x80 and global_table:
+        # Paleta global vira paleta local do frame (preservando o bit de entrelaçamento)
+        descriptor[9] = 0x80 | (descriptor[9] & 0x40) | (flags & 0x07)
+        return bytes(descriptor) + global_table + image_data
+    return bytes(descriptor) + image_data
+
+def export_font(size):
+    font = export_fonts.get(size)
+    if font is None:
+        try:
+            font = ImageFont.load_default(size)
+        except (TypeError, OSError):
+            font = ImageFont.load_default()  # Pillow sem FreeType: fonte bitmap fixa
+        export_fonts[size] = font
+    return font
+
+def export_frame_label(entry):
+    """Horário sobreposto: do nome do frame; no Sumaré (nomes fixos), do arquivo"""
+    moment = entry['timestamp'] or datetime.fromtimestamp(entry['mtime_ns'] / 1e9)
+    return moment.strftime('%d/%m/%Y %H:%M')
+
+def compose_export_frame(filepath, size, label):
+    """Frame sobre fundo preto no tamanho da animação, com o horário opcional no canto inferior esquerdo"""
+    img = Image.open(filepath)
+    if img.mode == 'P' and 'transparency' in img.info:
+        img = img.convert('RGBA')
+    if img.size != size:
+        img = img.resize(size, Image.NEAREST)
+    if img.mode == 'RGBA':
+        frame = Image.new('RGB', img.size, (0, 0, 0))
+        frame.paste(img, mask=img.split()[3])
+    else:
+        frame = img.convert('RGB')
+
+    if label:
+        font = export_font(max(10, round(EXPORT_CONFIG['label_size'] * size[1] / 1024)))
+        draw = ImageDraw.Draw(frame)
+        left, top, right, bottom = draw.textbbox((0, 0), label, font=font)
+        pad = max(2, (bottom - top) // 3)
+        box_top = size[1] - (bottom - top) - 2 * pad
+        draw.rectangle((0, box_top, right - left + 2 * pad, size[1]), fill=(0, 0, 0))
+        draw.text((pad - left, box_top + pad - top), label, fill=(255, 255, 255), font=font)
+    return frame
+
+def encode_export_block(frame, fmt):
+    """
+    Bloco autocontido de um frame, concatenável sem recodificar: GIF
+    (descritor + paleta local + LZW), APNG (fluxo zlib dos IDAT, RGB 8 bits)
+    ou WebP (chunks VP8L sem perdas).
+    """
+    if fmt == 'gif':
+        return encode_gif_frame_block(frame.quantize(colors=256))
+
+    buffer = BytesIO()
+    if fmt == 'apng':
+        frame.save(buffer, format='PNG')
+        data = buffer.getvalue()
+        parts, pos = [], 8
+        while pos < len(data):
+            length = int.from_bytes(data[pos:pos + 4], 'big')
+            if data[pos + 4:pos + 8] == b'IDAT':
+                parts.append(data[pos + 8:pos + 8 + length])
+            pos += length + 12
+        return b''.join(parts)
+
+    frame.save(buffer, format='WEBP', lossless=True, method=4)
+    data = buffer.getvalue()
+    parts, pos = [], 12
+    while pos < len(data):
+        length = int.from_bytes(data[pos + 4:pos + 8], 'little')
+        end = pos + 8 + length + (length & 1)
+        if data[pos:pos + 4] in (b'ALPH', b'VP8 ', b'VP8L'):
+            parts.append(data[pos:end])
+        pos = end
+    return b''.join(parts)
+
+def prepare_export_frame(filepath, cached_path, fmt, size, label):
+    """
+    Codifica um frame e grava o bloco em EXPORT_DIR. Roda nos processos do
+    pool: só caminhos e números trafegam entre processos, nunca imagens.
+    Retorna False se a origem não pôde ser lida (o frame fica de fora).
+    """
+    if os.path.exists(cached_path):
+        touch(cached_path)
+        return True
+    try:
+        block = encode_export_block(compose_export_frame(filepath, size, label), fmt)
+    except Exception as e:
+        print(f'Error loading {os.path.basename(filepath)}: {e}')
+        return False
+    write_atomic(cached_path, lambda f: f.write(block))
+    return True
+
+def export_pool():
+    """
+    Pool de processos deste worker (criado no primeiro uso, depois do fork
+    do gunicorn), usado pelas exportações e pelo corte de tiles. Uma
+    exportação grande ocupa os núcleos livres e o worker continua atendendo:
+    com gevent, a espera pelo resultado cede aos outros greenlets. None com
+    EXPORT_PROCESSES=0.
+    """
+    if EXPORT_CONFIG['processes'] <= 0:
+        return None
+    with export_pool_lock:
+        if export_pool_state['pid'] != os.getpid():
+            export_pool_state.update(pid=os.getpid(), pool=ProcessPoolExecutor(
+                max_workers=EXPORT_CONFIG['processes'], mp_context=multiprocessing.get_context('fork')))
+        return export_pool_state['pool']
+
+def prepare_export_frames(jobs):
+    """Codifica no pool os frames sem bloco em EXPORT_DIR (ou no worker, se o pool não estiver disponível)"""
+    missing = []
+    for job in jobs:
+        if os.path.exists(job[1]):
+            touch(job[1])
+        else:
+            missing.append(job)
+    if not missing:
+        return
+
+    pool = export_pool()
+    if pool is not None:
+        try:
+            list(pool.map(prepare_export_frame, *zip(*missing)))
+            return
+        except BrokenProcessPool as e:
+            with export_pool_lock:
+                export_pool_state['pid'] = None  # Recriado no próximo uso
+            print(f'Pool de exportação indisponível, codificando no worker: {e}')
+    for job in missing:
+        prepare_export_frame(*job)
+
+def read_block(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def write_gif(f, block_paths, size, duration):
+    """GIF animado (loop infinito) gravado bloco a bloco"""
+    width, height = size
+    f.write(b'GIF89a' + width.to_bytes(2, 'little') + height.to_bytes(2, 'little') + b'\x70\x00\x00')
+    f.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+    delay = (duration // 10).to_bytes(2, 'little')  # centésimos de segundo
+    for path in block_paths:
+        f.write(b'\x21\xf9\x04\x00' + delay + b'\x00\x00')
+        f.write(read_block(path))
+    f.write(b'\x3b')
+
+def png_chunk(kind, payload):
+    return len(payload).to_bytes(4, 'big') + kind + payload + zlib.crc32(kind + payload).to_bytes(4, 'big')
+
+def write_apng(f, block_paths, size, duration):
+    """APNG (loop infinito): IDAT no primeiro frame, fdAT nos demais, cada um com seu fcTL"""
+    width, height = size
+    f.write(b'\x89PNG\r\n\x1a\n')
+    f.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+    f.write(png_chunk(b'acTL', struct.pack('>II', len(block_paths), 0)))
+    sequence = 0
+    for i, path in enumerate(block_paths):
+        f.write(png_chunk(b'fcTL', struct.pack('>IIIIIHHBB', sequence, width, height, 0, 0, duration, 1000, 0, 0)))
+        sequence += 1
+        if i == 0:
+            f.write(png_chunk(b'IDAT', read_block(path)))
+        else:
+            f.write(png_chunk(b'fdAT', sequence.to_bytes(4, 'big') + read_block(path)))
+            sequence += 1
+    f.write(png_chunk(b'IEND', b''))
+
+def riff_chunk(fourcc, payload):
+    return fourcc + len(payload).to_bytes(4, 'little') + payload + (b'\x00' if len(payload) & 1 else b'')
+
+def write_webp(f, block_paths, size, duration):
+    """
+    WebP animado (loop infinito). O tamanho do RIFF vai no cabeçalho, então
+    vem da soma dos blocos em disco antes de gravar o primeiro frame.
+    """
+    width, height = size
+    dimensions = (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little')
+    header = riff_chunk(b'VP8X', b'\x02\x00\x00\x00' + dimensions)  # só o bit de animação
+    anim = riff_chunk(b'ANIM', b'\x00\x00\x00\xff\x00\x00')       # fundo preto, loop infinito
+    # ANMF: posição (0, 0), tamanho, duração e "sem mistura" com o frame anterior
+    frame_header = bytes(6) + dimensions + duration.to_bytes(3, 'little') + b'\x02'
+    block_sizes = [os.path.getsize(path) for path in block_paths]
+    total = 4 + len(header) + len(anim) + sum(8 + len(frame_header) + block_size for block_size in block_sizes)
+    f.write(b'RIFF' + total.to_bytes(4, 'little') + b'WEBP' + header + anim)
+    for path, block_size in zip(block_paths, block_sizes):
+        f.write(b'ANMF' + (len(frame_header) + block_size).to_bytes(4, 'little') + frame_header)
+        f.write(read_block(path))
+
+EXPORT_WRITERS = {'gif': write_gif, 'apng': write_apng, 'webp': write_webp}
+
+def build_export(radar, entries, fmt='gif', scale=1.0, timestamps=False):
+    """
+    Retorna (caminho, chave) da animação dos frames, construindo-a se preciso.
+    Cada frame é codificado uma vez por (conteúdo, formato, tamanho, horário)
+    no pool de processos; a animação é montada bloco a bloco direto no
+    arquivo, com um frame em memória por vez. O arquivo fica em EXPORT_DIR
+    até o conjunto de frames mudar; builds concorrentes da mesma chave
+    (threads ou workers) são coalescidas.
+    """
+    directory = RADAR_DIRS[radar]
+    # Tamanho da animação: o do frame mais recente na escala pedida (só lê o cabeçalho do PNG)
+    with Image.open(os.path.join(directory, entries[-1]['name'])) as newest:
+        size = (max(1, round(newest.width * scale)), max(1, round(newest.height * scale)))
+
+    key = export_key(radar, entries, fmt, size, timestamps)
+    output_path = os.path.join(EXPORT_DIR, f'radar_{radar}_{key}.{EXPORT_FORMATS[fmt][1]}')
+    ready = os.path.exists(output_path)
+    inc_metric('radar_cache_requests_total', cache='export', result='hit' if ready else 'miss')
+    if ready:
+        touch(output_path)
+        return output_path, key
+
+    with export_build_locks_guard:
+        build_lock = export_build_locks.setdefault(key, threading.Lock())
+
+    try:
+        with build_lock:
+            # Lock de arquivo para coalescer também entre workers do gunicorn
+            with open(f'{output_path}.lock', 'w') as lock_file:
+                flock_exclusive(lock_file)
+                if not os.path.exists(output_path):
+                    jobs = []
+                    for entry in entries:
+                        label = export_frame_label(entry) if timestamps else ''
+                        jobs.append((os.path.join(directory, entry['name']),
+                                     export_frame_path(entry['sha1'], fmt, size, label), fmt, size, label))
+                    prepare_export_frames(jobs)
+
+                    block_paths = [job[1] for job in jobs if os.path.exists(job[1])]
+                    if not block_paths:
+                        return None, key
+                    write_atomic(output_path,
+                                 lambda f: EXPORT_WRITERS[fmt](f, block_paths, size, GIF_FRAME_DURATION))
+    finally:
+        with export_build_locks_guard:
+            export_build_locks.pop(key, None)
+
+    return output_path, key
 
 # ============================================
-# CREDENCIAIS VIA VARIÁVEIS DE AMBIENTE
+# PACOTE DE FRAMES (BUNDLE MULTIPART)
 # ============================================
 
-FTP_CONFIG = {
-    'host': os.environ.get('FTP_HOST', '82.180.153.43'),
-    'user': os.environ.get('FTP_USER', 'u109222483.CorInea'),
-    'password': os.environ.get('FTP_PASSWORD', ''),  # OBRIGATÓRIO definir via ambiente
-    'path': '/',
-    'pattern': r'MDN-.*\.png$'
-}
+# Incrementar se o redimensionamento/codificação das variantes mudar
+BUNDLE_VERSION = 1
+BUNDLE_SCALES = (1.0, 0.5, 0.25)
+BUNDLE_FORMATS = {'png': 'image/png', 'webp': 'image/webp'}
+BUNDLE_BOUNDARY = 'radar-frame-bundle'
+BUNDLE_CACHE_MAX_ITEMS = 160  # variantes em memória (~2 radares x 20 frames x 4 combinações)
 
-# Verificar se a senha foi configurada
-if not FTP_CONFIG['password']:
-    print("⚠️  AVISO: FTP_PASSWORD não configurada. Defina a variável de ambiente.")
+# LRU: (sha1 da origem, filtro, escala, formato) -> bytes
+bundle_cache = OrderedDict()
+bundle_cache_lock = threading.Lock()
 
-last_sync = {'mendanha': None, 'sumare': None}
-MAX_HOURS = 24
+def frame_variant_path(digest, filter_rain, scale, fmt):
+    """Variante redimensionada/WebP em EXPORT_DIR (endereçada pelo conteúdo da origem)"""
+    kind = 'rain' if filter_rain else 'raw'
+    return os.path.join(EXPORT_DIR, f'variant-v{BUNDLE_VERSION}-{digest}-{kind}-{int(scale * 100)}.{fmt}')
+
+def encode_frame_variant(source, scale, fmt):
+    """
+    Redimensiona com NEAREST (mantém as cores exatas da paleta, que o
+    cliente classifica por intensidade) e codifica em PNG ou WebP sem perdas.
+    """
+    img = Image.open(BytesIO(source))
+    if scale != 1:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        img = img.resize(size, Image.NEAREST)
+    output = BytesIO()
+    if fmt == 'webp':
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        img.save(output, 'WEBP', lossless=True, method=4)
+    else:
+        img.save(output, 'PNG')
+    return output.getvalue()
+
+def get_frame_variant(filepath, filter_rain, scale, fmt):
+    """
+    Bytes de um frame na variante pedida. O tamanho original em PNG é o
+    próprio arquivo (ou a variante de chuva); as demais são geradas uma vez
+    e reaproveitadas (memória -> EXPORT_DIR -> codificação).
+    """
+    if filter_rain:
+        variant = get_rain_variant(filepath)
+        if variant is None:
+            return None
+        source, digest = variant
+    else:
+        with open(filepath, 'rb') as f:
+            source = f.read()
+        digest = hashlib.sha1(source).hexdigest()
+
+    if scale == 1 and fmt == 'png':
+        return source
+
+    key = (digest, filter_rain, scale, fmt)
+    with bundle_cache_lock:
+        data = bundle_cache.get(key)
+        if data is not None:
+            bundle_cache.move_to_end(key)
+    inc_metric('radar_cache_requests_total', cache='bundle', result='miss' if data is None else 'hit')
+    if data is not None:
+        return data
+
+    cached_path = frame_variant_path(digest, filter_rain, scale, fmt)
+    if os.path.exists(cached_path):
+        touch(cached_path)
+        with open(cached_path, 'rb') as f:
+            data = f.read()
+    else:
+        data = encode_frame_variant(source, scale, fmt)
+        write_atomic(cached_path, lambda f: f.write(data))
+
+    with bundle_cache_lock:
+        bundle_cache[key] = data
+        while len(bundle_cache) > BUNDLE_CACHE_MAX_ITEMS:
+            bundle_cache.popitem(last=False)
+    return data
+
+def select_bundle_entries(radar, since=None):
+    """
+    Frames do pacote: os listados, ou só os posteriores a `since` no
+    Mendanha e no mosaico (nomes em ordem cronológica). O Sumaré regrava
+    sempre os mesmos nomes, então o pacote dele é sempre completo.
+    """
+    listed = get_frame_index(radar)['listed']
+    if since and radar in TIMESTAMPED_RADARS:
+        return [entry for entry in listed if entry['name'] > since]
+    return listed
+
+def build_frame_bundle(radar, entries, filter_rain, scale, fmt):
+    """
+    Corpo multipart/mixed com um frame por parte (Content-Disposition traz o
+    nome). Retorna (corpo, etag, nº de frames); o etag muda se qualquer parte mudar.
+    """
+    mimetype = BUNDLE_FORMATS[fmt]
+    parts = []
+    digests = []
+    for entry in entries:
+        data = get_frame_variant(os.path.join(RADAR_DIRS[radar], entry['name']), filter_rain, scale, fmt)
+        if data is None:
+            continue
+        headers = (f'--{BUNDLE_BOUNDARY}\r\n'
+                   f'Content-Type: {mimetype}\r\n'
+                   f'Content-Length: {len(data)}\r\n'
+                   f'Content-Disposition: inline; filename="{entry["name"]}"\r\n\r\n')
+        parts.append(headers.encode() + data + b'\r\n')
+        digests.append(f"{entry['name']}:{entry['sha1']}")
+    parts.append(f'--{BUNDLE_BOUNDARY}--\r\n'.encode())
+
+    key = f'{BUNDLE_VERSION}|{radar}|{filter_rain}|{scale}|{fmt}|' + '|'.join(digests)
+    return b''.join(parts), hashlib.sha1(key.encode()).hexdigest(), len(digests)
 
 # ============================================
-# FILTRO DE CORES - REMOVER UMIDADE (AZUL)
+# PIRÂMIDE DE TILES (XYZ EM WEB MERCATOR)
 # ============================================
 
-def filter_rain_only(image_path):
+# Os frames já estão em Web Mercator dentro de RADAR_BOUNDS (x linear na
+# longitude e y em mercator_y(lat), como o imageOverlay os desenha), então
+# cada tile é um recorte reamostrado por vizinho mais próximo. Os frames
+# listados são cortados uma vez no sync, no pool de processos do processo de
+# sync, antes do aviso por SSE; frames mais antigos, na primeira requisição.
+# Os tiles de um frame ficam num único arquivo (índice + PNGs), endereçado
+# pelo SHA-1 do frame: renomear no Sumaré não recorta de novo. Tiles
+# totalmente transparentes não são gravados (a rota responde 204).
+TILE_VERSION = 1  # Incrementar se o recorte/codificação mudar
+TILE_CONFIG = {
+    'size': 256,
+    'min_zoom': 5,        # Área inteira de um radar em 1-4 tiles
+    'max_zoom': 8         # ~resolução nativa de um frame de 1024 px (acima, o Leaflet amplia)
+}
+TILE_MAGIC = b'RTIL'
+TILE_ENTRY = struct.Struct('>BIIII')  # z, x, y, deslocamento, tamanho
+TILE_INDEX_MAX_ITEMS = 64
+
+# LRU dos índices lidos: caminho do pacote -> {(z, x, y): (deslocamento, tamanho)}
+tile_indexes = OrderedDict()
+tile_indexes_lock = threading.Lock()
+tile_build_locks = {}
+tile_build_locks_guard = threading.Lock()
+
+def tile_pack_path(radar, digest):
+    return os.path.join(TILES_DIR, f'{radar}-{digest}-v{TILE_VERSION}.tiles')
+
+def tile_axis(zoom, start, end, length):
     """
-    Filtra a imagem do radar para mostrar apenas chuva (verde ou mais intenso).
-    Remove os tons azuis que representam apenas umidade.
-    
-    Baseado na legenda oficial:
-    - Azul claro/escuro: 0.10 - 1 mm/h (umidade, não chuva)
-    - Verde: ~5 mm/h (chuva leve) - MANTER
-    - Amarelo/Laranja: 10-100 mm/h (chuva moderada/forte) - MANTER
-    - Vermelho/Magenta: >100 mm/h (chuva muito forte) - MANTER
+    Num eixo (em pixels globais do zoom): primeiro tile coberto e, para cada
+    pixel dos tiles cobertos, o índice do pixel de origem (-1 fora do frame)
+    """
+    size = TILE_CONFIG['size']
+    first, last = int(start // size), int(math.ceil(end / size)) - 1
+    centers = np.arange(first * size, (last + 1) * size) + 0.5
+    source = np.floor((centers - start) / (end - start) * length).astype(np.intp)
+    source[(source < 0) | (source >= length)] = -1
+    return first, source
+
+def cut_tiles(radar, img):
+    """
+    Corta um frame (RGBA) em todos os zooms da pirâmide.
+    Retorna [(z, x, y, png)] só com os tiles que têm algum pixel visível.
+    """
+    (south, west), (north, east) = RADAR_BOUNDS[radar]
+    pixels = np.asarray(img.convert('RGBA'))
+    height, width = pixels.shape[:2]
+    size = TILE_CONFIG['size']
+    tiles = []
+    for zoom in range(TILE_CONFIG['min_zoom'], TILE_CONFIG['max_zoom'] + 1):
+        world = size * 2 ** zoom
+        x0, cols = tile_axis(zoom, (west + 180) / 360 * world, (east + 180) / 360 * world, width)
+        y0, rows = tile_axis(zoom, (1 - mercator_y(north) / math.pi) / 2 * world,
+                             (1 - mercator_y(south) / math.pi) / 2 * world, height)
+        canvas = np.zeros((len(rows), len(cols), 4), dtype=np.uint8)
+        valid_rows, valid_cols = np.flatnonzero(rows >= 0), np.flatnonzero(cols >= 0)
+        canvas[valid_rows[0]:valid_rows[-1] + 1, valid_cols[0]:valid_cols[-1] + 1] = \
+            pixels[rows[valid_rows]][:, cols[valid_cols]]
+
+        for ty in range(len(rows) // size):
+            for tx in range(len(cols) // size):
+                tile = canvas[ty * size:(ty + 1) * size, tx * size:(tx + 1) * size]
+                if not tile[:, :, 3].any():
+                    continue
+                buffer = BytesIO()
+                Image.fromarray(tile, 'RGBA').save(buffer, format='PNG')
+                tiles.append((zoom, x0 + tx, y0 + ty, buffer.getvalue()))
+    return tiles
+
+def write_tile_pack(path, tiles):
+    """Pacote: 'RTIL', quantidade, índice (z, x, y, deslocamento, tamanho) e os PNGs em sequência"""
+    offset = 8 + TILE_ENTRY.size * len(tiles)
+    index = []
+    for z, x, y, data in tiles:
+        index.append(TILE_ENTRY.pack(z, x, y, offset, len(data)))
+        offset += len(data)
+
+    def write(f):
+        f.write(TILE_MAGIC + len(tiles).to_bytes(4, 'big'))
+        f.write(b''.join(index))
+        for tile in tiles:
+            f.write(tile[3])
+
+    write_atomic(path, write)
+
+def read_tile_index(path):
+    """Índice do pacote, lido uma vez por processo (o arquivo nunca muda: o nome tem o SHA-1)"""
+    with tile_indexes_lock:
+        index = tile_indexes.get(path)
+        if index is not None:
+            tile_indexes.move_to_end(path)
+            return index
+
+    with open(path, 'rb') as f:
+        header = f.read(8)
+        if header[:4] != TILE_MAGIC:
+            raise ValueError(f'Pacote de tiles inválido: {os.path.basename(path)}')
+        count = int.from_bytes(header[4:], 'big')
+        data = f.read(TILE_ENTRY.size * count)
+    index = {}
+    for z, x, y, offset, length in TILE_ENTRY.iter_unpack(data):
+        index[(z, x, y)] = (offset, length)
+
+    with tile_indexes_lock:
+        tile_indexes[path] = index
+        while len(tile_indexes) > TILE_INDEX_MAX_ITEMS:
+            tile_indexes.popitem(last=False)
+    return index
+
+def cut_tile_pack(radar, filepath, path):
+    """Corta um frame e grava o pacote (roda no pool de processos)"""
+    with Image.open(filepath) as img:
+        tiles = cut_tiles(radar, img)
+    write_tile_pack(path, tiles)
+
+def build_tile_pack(radar, entry):
     """
+    Retorna o caminho do pacote de tiles de um frame do índice, cortando-o
+    se o sync ainda não o cortou (frames antigos). O corte roda no pool de
+    processos do worker (com gevent, as outras requisições seguem atendidas
+    enquanto isso); builds concorrentes do mesmo frame são coalescidas.
+    """
+    path = tile_pack_path(radar, entry['sha1'])
+    if os.path.exists(path):
+        return path
+
+    with tile_build_locks_guard:
+        build_lock = tile_build_locks.setdefault(path, threading.Lock())
     try:
-        img = Image.open(image_path).convert('RGBA')
-        data = np.array(img)
-        
-        # Separar canais
-        r, g, b, a = data[:,:,0], data[:,:,1], data[:,:,2], data[:,:,3]
-        
-        # Detectar pixels azuis (umidade):
-        # - Azul é dominante (B > R e B > G)
-        # - Ou tons de ciano/azul claro
-        # Tons azuis típicos do radar: RGB aproximados
-        # - Azul escuro: ~(0-50, 50-100, 150-255)
-        # - Azul claro/ciano: ~(0-100, 100-200, 200-255)
-        
-        # Criar máscara para pixels azuis (umidade)
-        # Pixel é azul se: B > 100 AND B > R AND B >= G
-        blue_mask = (b > 100) & (b > r) & (b >= g)
-        
-        # Também remover ciano claro (onde G e B são altos mas R é baixo)
-        cyan_mask = (b > 150) & (g > 150) & (r < 100)
-        
-        # Combinar máscaras
-        remove_mask = blue_mask | cyan_mask
-        
-        # Tornar pixels azuis transparentes
-        data[remove_mask, 3] = 0
-        
-        # Criar nova imagem
-        filtered_img = Image.fromarray(data, 'RGBA')
-        
-        # Salvar em buffer
-        buffer = BytesIO()
-        filtered_img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        return buffer
-    except Exception as e:
-        print(f'Erro no filtro de chuva: {e}')
+        with build_lock:
+            if not os.path.exists(path):
+                filepath = os.path.join(RADAR_DIRS[radar], entry['name'])
+                pool = export_pool()
+                if pool is None:
+                    cut_tile_pack(radar, filepath, path)
+                else:
+                    try:
+                        pool.submit(cut_tile_pack, radar, filepath, path).result()
+                    except BrokenProcessPool as e:
+                        with export_pool_lock:
+                            export_pool_state['pid'] = None  # Recriado no próximo uso
+                        print(f'Pool de processos indisponível, cortando tiles no worker: {e}')
+                        cut_tile_pack(radar, filepath, path)
+    finally:
+        with tile_build_locks_guard:
+            tile_build_locks.pop(path, None)
+    return path
+
+def update_tiles(radar):
+    """
+    Corta no pool de processos os frames listados que ainda não têm pacote
+    (chamado no fim do sync, antes do aviso aos clientes). Retorna quantos
+    pacotes foram cortados.
+    """
+    missing = []
+    for entry in get_frame_index(radar)['listed']:
+        path = tile_pack_path(radar, entry['sha1'])
+        if not os.path.exists(path):
+            missing.append((entry['name'], os.path.join(RADAR_DIRS[radar], entry['name']), path))
+    if not missing:
+        return 0
+
+    pool = export_pool()
+    if pool is not None:
+        try:
+            futures = [(name, pool.submit(cut_tile_pack, radar, filepath, path))
+                       for name, filepath, path in missing]
+            built = 0
+            for name, future in futures:
+                try:
+                    future.result()
+                    built += 1
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    print(f'Erro ao cortar tiles de {name}: {e}')
+            return built
+        except BrokenProcessPool as e:
+            with export_pool_lock:
+                export_pool_state['pid'] = None  # Recriado no próximo uso
+            print(f'Pool de processos indisponível, cortando tiles no sync: {e}')
+    built = 0
+    for name, filepath, path in missing:
+        if os.path.exists(path):
+            continue
+        try:
+            cut_tile_pack(radar, filepath, path)
+            built += 1
+        except Exception as e:
+            print(f'Erro ao cortar tiles de {name}: {e}')
+    return built
+
+def read_tile(radar, entry, z, x, y):
+    """Bytes do PNG de um tile ou None se o tile é vazio (transparente ou fora do frame)"""
+    path = tile_pack_path(radar, entry['sha1'])
+    ready = os.path.exists(path)
+    inc_metric('radar_cache_requests_total', cache='tiles', result='hit' if ready else 'miss')
+    if not ready:
+        build_tile_pack(radar, entry)
+    location = read_tile_index(path).get((z, x, y))
+    if location is None:
         return None
+    offset, length = location
+    with open(path, 'rb') as f:
+        return os.pread(f.fileno(), length, offset)
 
 # ============================================
 # FUNÇÕES DE SEGURANÇA
@@ -160,31 +3381,66 @@ def sanitize_filename(filename):
     
     return filename
 
+def take_token_memory(key, capacity, now):
+    """
+    Consome uma ficha do bucket em memória. Retorna as fichas restantes
+    (negativo: requisição negada, faltam -fichas para a próxima).
+    """
+    rate = capacity / RATE_LIMIT_WINDOW
+    with rate_limit_lock:
+        bucket = rate_limit_store.pop(key, None)
+        tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        rate_limit_store[key] = (tokens, now)
+        # Sem acesso há uma janela o bucket já está cheio: descartar não muda nada
+        while len(rate_limit_store) > RATE_LIMIT_MAX_KEYS:
+            rate_limit_store.popitem(last=False)
+        while rate_limit_store:
+            oldest = next(iter(rate_limit_store))
+            if now - rate_limit_store[oldest][1] < RATE_LIMIT_WINDOW:
+                break
+            del rate_limit_store[oldest]
+    return tokens if allowed else tokens - 1
+
+def take_token_shared(key, capacity, now):
+    """Mesmo que take_token_memory, com o bucket no state.db (um único UPSERT atômico)"""
+    rate = capacity / RATE_LIMIT_WINDOW
+    rows = state_query(
+        'INSERT INTO rate_limit (key, tokens, updated, denied) VALUES (?1, ?2 - 1, ?3, 0) '
+        'ON CONFLICT(key) DO UPDATE SET '
+        'denied = MIN(?2, tokens + (?3 - updated) * ?4) < 1, '
+        'tokens = MIN(?2, tokens + (?3 - updated) * ?4) - (MIN(?2, tokens + (?3 - updated) * ?4) >= 1), '
+        'updated = ?3 '
+        'RETURNING tokens, denied',
+        (key, capacity, now, rate)
+    )
+    tokens, denied = rows[0]
+    # Buckets parados há uma janela estão cheios: removidos de tempos em tempos
+    if now - rate_limit_cleanup['last'] > RATE_LIMIT_WINDOW:
+        rate_limit_cleanup['last'] = now
+        state_query('DELETE FROM rate_limit WHERE updated < ?', (now - RATE_LIMIT_WINDOW,))
+    return tokens - 1 if denied else tokens
+
 def rate_limit(limit_type='default'):
-    """Decorator para rate limiting"""
+    """Decorator para rate limiting (token bucket, custo O(1) por requisição)"""
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            client_ip = request.remote_addr
-            key = f"{client_ip}:{limit_type}"
-            now = time.time()
-            
-            # Limpar entradas antigas
-            if key in rate_limit_store:
-                rate_limit_store[key] = [t for t in rate_limit_store[key] if now - t < RATE_LIMIT_WINDOW]
-            else:
-                rate_limit_store[key] = []
+            key = f"{request.remote_addr}:{limit_type}"
+            capacity = RATE_LIMIT_MAX_REQUESTS.get(limit_type, RATE_LIMIT_MAX_REQUESTS['default'])
+            take_token = take_token_shared if RATE_LIMIT_BACKEND == 'shared' else take_token_memory
+            tokens = take_token(key, capacity, time.time())
             
-            # Verificar limite
-            max_requests = RATE_LIMIT_MAX_REQUESTS.get(limit_type, RATE_LIMIT_MAX_REQUESTS['default'])
-            if len(rate_limit_store[key]) >= max_requests:
-                return jsonify({
+            if tokens < 0:
+                retry_after = math.ceil(-tokens * RATE_LIMIT_WINDOW / capacity)
+                response = jsonify({
                     'error': 'Rate limit exceeded. Tente novamente em alguns segundos.',
-                    'retry_after': RATE_LIMIT_WINDOW
-                }), 429
-            
-            # Registrar requisição
-            rate_limit_store[key].append(now)
+                    'retry_after': retry_after
+                })
+                response.headers['Retry-After'] = str(retry_after)
+                return response, 429
             
             return f(*args, **kwargs)
         return decorated_function
@@ -204,98 +3460,708 @@ def require_admin_token(f):
     return decorated_function
 
 # ============================================
-# FUNÇÕES DE SINCRONIZAÇÃO
+# FUNÇÕES DE SINCRONIZAÇÃO
+# ============================================
+
+def clean_old_files(directory, max_hours=24):
+    """Remove arquivos com mais de X horas"""
+    try:
+        now = datetime.now()
+        cutoff = now - timedelta(hours=max_hours)
+        
+        for filename in os.listdir(directory):
+            filepath = os.path.join(directory, filename)
+            if os.path.isfile(filepath):
+                file_time = datetime.fromtimestamp(os.path.getmtime(filepath))
+                if file_time < cutoff:
+                    os.remove(filepath)
+                    print(f'Removed old file: {filename}')
+    except Exception as e:
+        print(f'Clean error: {e}')
+
+# Sessão FTP persistente e listagem lembrada entre ciclos
+ftp_state = {
+    'conn': None,
+    'failures': 0,
+    'next_attempt': 0.0,
+    'mlsd': None,        # None = ainda não testado
+    'known': set(),      # nomes vistos na última listagem
+    'recent': [],        # 20 arquivos MDN mais recentes (ordem decrescente)
+    'sizes': {}          # tamanho remoto por arquivo (MLSD ou SIZE)
+}
+mendanha_sync_lock = threading.Lock()
+
+def close_ftp_connection():
+    """Fecha a sessão FTP atual (sem propagar erros)"""
+    conn = ftp_state['conn']
+    ftp_state['conn'] = None
+    if conn is not None:
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+def get_ftp_connection():
+    """
+    Retorna a sessão FTP persistente, abrindo uma nova se necessário.
+    Falhas de conexão aplicam backoff exponencial: durante a espera retorna None.
+    """
+    if ftp_state['conn'] is not None:
+        return ftp_state['conn']
+
+    if time.time() < ftp_state['next_attempt']:
+        return None
+
+    try:
+        conn = ftplib.FTP(timeout=FTP_CONFIG['timeout'])
+        conn.connect(FTP_CONFIG['host'], FTP_CONFIG['port'])
+        conn.login(FTP_CONFIG['user'], FTP_CONFIG['password'])
+        conn.cwd(FTP_CONFIG['path'])
+    except ftplib.all_errors as e:
+        ftp_state['failures'] += 1
+        delay = min(FTP_CONFIG['backoff_max'], FTP_CONFIG['backoff_base'] * 2 ** (ftp_state['failures'] - 1))
+        ftp_state['next_attempt'] = time.time() + delay
+        print(f'FTP connection error: {e} (nova tentativa em {delay}s)')
+        return None
+
+    ftp_state['conn'] = conn
+    ftp_state['failures'] = 0
+    ftp_state['next_attempt'] = 0.0
+    return conn
+
+def list_ftp_files(ftp):
+    """
+    Lista o diretório remoto. Usa MLSD (nome + tamanho em uma só ida) quando o
+    servidor suporta; senão cai para NLST. Retorna {nome: tamanho ou None}.
+    """
+    if ftp_state['mlsd'] is not False:
+        try:
+            # Sem OPTS MLST: os fatos padrão (type, size) bastam e economizam uma ida
+            listing = {name: int(facts['size']) if 'size' in facts else None
+                       for name, facts in ftp.mlsd()
+                       if facts.get('type', 'file') == 'file'}
+            ftp_state['mlsd'] = True
+            return listing
+        except ftplib.error_perm:
+            ftp_state['mlsd'] = False
+    return {name: None for name in ftp.nlst()}
+
+def update_ftp_listing(listing):
+    """
+    Atualiza a listagem lembrada: só nomes ainda não vistos passam pelo regex
+    e pela ordenação. Retorna os 20 arquivos MDN mais recentes.
+    """
+    new_names = [name for name in listing if name not in ftp_state['known']]
+    ftp_state['known'] = set(listing)
+
+    matching = [name for name in new_names if re.match(FTP_CONFIG['pattern'], name)]
+    recent = [name for name in ftp_state['recent'] if name in listing] + matching
+    recent.sort(reverse=True)
+    ftp_state['recent'] = recent[:20]
+
+    for name in ftp_state['recent']:
+        if listing[name] is not None:
+            ftp_state['sizes'][name] = listing[name]
+    ftp_state['sizes'] = {name: size for name, size in ftp_state['sizes'].items() if name in listing}
+    return ftp_state['recent']
+
+def download_ftp_file(ftp, filename, local_path):
+    """
+    Baixa um arquivo para <local_path>.part e renomeia ao final, para que
+    /api/frame/mendanha nunca sirva um PNG truncado. Um .part deixado por um
+    download interrompido é retomado com REST; o tamanho final é conferido
+    com o tamanho remoto quando conhecido.
+    """
+    started = time.perf_counter()
+    part_path = f'{local_path}.part'
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    remote_size = ftp_state['sizes'].get(filename)
+    if remote_size is None:
+        try:
+            ftp.voidcmd('TYPE I')
+            remote_size = ftp.size(filename)
+            ftp_state['sizes'][filename] = remote_size
+        except ftplib.all_errors:
+            remote_size = None
+
+    if remote_size is not None and offset > remote_size:
+        offset = 0
+
+    with open(part_path, 'ab' if offset else 'wb') as f:
+        try:
+            ftp.retrbinary(f'RETR {filename}', f.write, rest=offset or None)
+        except ftplib.error_perm:
+            if not offset:
+                raise
+            # Servidor sem REST: recomeçar do zero
+            f.seek(0)
+            f.truncate()
+            ftp.retrbinary(f'RETR {filename}', f.write)
+
+    size = os.path.getsize(part_path)
+    if remote_size is not None and size != remote_size:
+        raise ftplib.Error(f'{filename}: tamanho {size} != {remote_size}')
+
+    os.replace(part_path, local_path)
+    observe_metric('radar_download_duration_seconds', time.perf_counter() - started, source='mendanha')
+    inc_metric('radar_download_bytes_total', size - offset, source='mendanha')
+
+def sync_mendanha():
+    """Sincroniza imagens do radar Mendanha via FTP (sessão persistente)"""
+    if not FTP_CONFIG['password']:
+        print("Erro: FTP_PASSWORD não configurada")
+        return None
+    
+    with mendanha_sync_lock:
+        try:
+            started = time.perf_counter()
+            archive_old_frames('mendanha', MAX_HOURS)
+            
+            ftp = get_ftp_connection()
+            if ftp is None:
+                print('Mendanha sync skipped: FTP indisponível (backoff)')
+                return None
+            
+            try:
+                listing = list_ftp_files(ftp)
+            except ftplib.all_errors:
+                # Sessão expirou no servidor desde o último ciclo: reconectar uma vez
+                close_ftp_connection()
+                ftp = get_ftp_connection()
+                if ftp is None:
+                    print('Mendanha sync skipped: FTP indisponível (backoff)')
+                    return None
+                listing = list_ftp_files(ftp)
+            
+            radar_files = update_ftp_listing(listing)
+            existing = set(os.listdir(MENDANHA_DIR))
+            # A cadência é aprendida pelo horário no nome, inclusive de frames já baixados
+            publications = [(name, parse_frame_timestamp(name)) for name in radar_files]
+            record_publications('mendanha', [ts.timestamp() for _, ts in publications if ts])
+            
+            stats = {'downloaded': 0, 'error': 0, 'bytes': 0}
+            for filename in radar_files:
+                # Validar nome do arquivo do FTP também
+                safe_filename = sanitize_filename(filename)
+                if safe_filename and safe_filename not in existing:
+                    local_path = os.path.join(MENDANHA_DIR, safe_filename)
+                    try:
+                        download_ftp_file(ftp, filename, local_path)
+                    except ftplib.error_temp as e:
+                        # Conexão caiu no meio do download: o .part é retomado no próximo ciclo
+                        stats['error'] += 1
+                        print(f'Error downloading {safe_filename}: {e}')
+                        raise
+                    except ftplib.Error as e:
+                        stats['error'] += 1
+                        print(f'Error downloading {safe_filename}: {e}')
+                        continue
+                    stats['downloaded'] += 1
+                    stats['bytes'] += os.path.getsize(local_path)
+                    upstream = parse_frame_timestamp(safe_filename)
+                    if upstream:
+                        record_frame_available('mendanha', safe_filename, upstream.timestamp())
+                    print(f'Downloaded: {safe_filename}')
+                    # Pré-computar variante com filtro de chuva (servida sem reprocessar),
+                    # núcleos e histórico a partir da mesma decodificação
+                    build_rain_variant(local_path, ('mendanha', upstream.timestamp()) if upstream else None)
+            
+            stats['seconds'] = round(time.perf_counter() - started, 3)
+            record_sync('mendanha', stats)
+            remaining = len(get_frame_index('mendanha')['frames'])
+            update_nuclei('mendanha')
+            try:
+                update_accumulation('mendanha')
+            except Exception as e:
+                print(f'Erro no acumulado de chuva (mendanha): {e}')
+            try:
+                update_region_stats('mendanha')
+            except Exception as e:
+                print(f'Erro nas estatísticas por região (mendanha): {e}')
+            try:
+                evaluate_alerts('mendanha')
+            except Exception as e:
+                print(f'Erro na avaliação de alertas (mendanha): {e}')
+            try:
+                update_nowcast('mendanha')
+            except Exception as e:
+                print(f'Erro no nowcast (mendanha): {e}')
+            try:
+                if update_composite():
+                    update_nuclei('composite')
+            except Exception as e:
+                print(f'Erro no mosaico composto: {e}')
+            for radar in ('mendanha', 'composite'):
+                try:
+                    update_tiles(radar)
+                except Exception as e:
+                    print(f'Erro nos tiles ({radar}): {e}')
+            check_frame_updates('mendanha')
+            check_frame_updates('composite')
+            
+            print(f"Mendanha sync completed: {remaining} files "
+                  f"({stats['downloaded']} new, {stats['bytes'] / 1024:.0f} KB in {stats['seconds']}s)")
+            return stats
+        except ftplib.all_errors as e:
+            # Sessão em estado desconhecido: reconectar no próximo ciclo
+            close_ftp_connection()
+            print(f'Mendanha sync error: {e}')
+        except Exception as e:
+            print(f'Mendanha sync error: {e}')
+        return None
+
+# Sessão HTTP compartilhada (keep-alive): reaproveita conexões TLS entre frames e syncs
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=SUMARE_CONFIG['workers']))
+http_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=SUMARE_CONFIG['workers']))
+
+SUMARE_VALIDATORS_FILE = os.path.join(SUMARE_DIR, 'validators.json')
+
+def load_sumare_validators():
+    """ETag/Last-Modified de cada frame do Sumaré, persistidos entre reinícios"""
+    try:
+        with open(SUMARE_VALIDATORS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def fetch_sumare_frame(filename, url, validators):
+    """
+    Baixa um frame do Sumaré com GET condicional.
+    Retorna (filename, status, bytes, validadores) com status
+    'updated', 'not_modified' ou 'error'.
+    """
+    local_path = os.path.join(SUMARE_DIR, filename)
+    headers = {}
+    # Só revalidar se o arquivo local ainda existir
+    if validators and os.path.exists(local_path):
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    try:
+        with timed_metric('radar_download_duration_seconds', source='sumare'):
+            response = http_session.get(url, headers=headers, timeout=SUMARE_CONFIG['timeout'])
+        if response.status_code == 304:
+            return filename, 'not_modified', 0, validators
+        if response.status_code != 200:
+            print(f'Error downloading {filename}: HTTP {response.status_code}')
+            return filename, 'error', 0, validators
+
+        content = response.content
+        inc_metric('radar_download_bytes_total', len(content), source='sumare')
+        write_atomic(local_path, lambda f: f.write(content))
+        return filename, 'updated', len(content), {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+    except Exception as e:
+        print(f'Error downloading {filename}: {e}')
+        return filename, 'error', 0, validators
+
+def sumare_new_frames(previous_digests, upstream):
+    """
+    Frames do Sumaré com conteúdo novo neste sync, do mais antigo ao mais
+    recente, com o horário estimado de cada um: [(entrada, horário)]. A
+    janela do AlertaRio anda (o conteúdo de radar002 passa para radar001),
+    então novo é o conteúdo que não estava em nenhum slot antes; depois de
+    uma queda podem ser vários. O último tem o horário da publicação e os
+    anteriores recuam pela cadência aprendida, sem chegar ao último frame
+    já arquivado (quem processa o histórico só olha para frente).
+    """
+    new = [entry for entry in get_frame_index('sumare')['frames'] if entry['sha1'] not in previous_digests]
+    if not new:
+        return []
+    interval = get_cadence('sumare')['interval'] or SYNC_SCHEDULE['sumare']['interval']
+    archived = read_history('sumare', upstream - MAX_HOURS * 3600, upstream)
+    if archived:
+        last = float(archived[-1][0]['time'])
+        if last < upstream:
+            interval = min(interval, (upstream - last) / len(new))
+    return [(entry, upstream - (len(new) - 1 - i) * interval) for i, entry in enumerate(new)]
+
+def sync_sumare():
+    """Baixa imagens do radar Sumaré do AlertaRio (em paralelo, com GET condicional)"""
+    try:
+        started = time.perf_counter()
+        validators = load_sumare_validators()
+        previous_digests = {entry['sha1'] for entry in get_frame_index('sumare')['frames']}
+        
+        jobs = []
+        for i in range(1, SUMARE_CONFIG['frames'] + 1):
+            filename = f'radar{str(i).zfill(3)}.png'
+            url = f"{SUMARE_CONFIG['base_url']}{str(i).zfill(3)}.png"
+            jobs.append((filename, url, validators.get(filename)))
+        
+        with ThreadPoolExecutor(max_workers=SUMARE_CONFIG['workers']) as pool:
+            results = list(pool.map(lambda job: fetch_sumare_frame(*job), jobs))
+        
+        stats = {'updated': 0, 'not_modified': 0, 'error': 0, 'bytes': 0}
+        changed = False
+        for filename, status, size, frame_validators in results:
+            stats[status] += 1
+            stats['bytes'] += size
+            if frame_validators != validators.get(filename):
+                validators[filename] = frame_validators
+                changed = True
+        
+        if changed:
+            write_atomic(SUMARE_VALIDATORS_FILE, lambda f: f.write(json.dumps(validators).encode()))
+        
+        if stats['updated']:
+            # Janela deslizante: uma mudança de validadores = uma nova publicação.
+            # O último frame é o mais recente; sem Last-Modified, vale a hora da detecção
+            latest = jobs[-1][0]
+            upstream = parse_http_date((validators.get(latest) or {}).get('last_modified')) or time.time()
+            record_publications('sumare', [upstream])
+            new_frames = sumare_new_frames(previous_digests, upstream)
+            if len(new_frames) > 1:
+                print(f'Sumaré: {len(new_frames)} frames novos na janela (arquivando todos)')
+            for entry, timestamp in new_frames:
+                # Só o mais recente entra na latência aprendida (os anteriores chegam atrasados por definição)
+                record_frame_available('sumare', entry['name'], timestamp, learn_lag=entry['name'] == latest)
+                archive_frame('sumare', os.path.join(SUMARE_DIR, entry['name']), timestamp)
+        
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        record_sync('sumare', stats)
+        get_frame_index('sumare')
+        update_nuclei('sumare')
+        try:
+            update_accumulation('sumare')
+        except Exception as e:
+            print(f'Erro no acumulado de chuva (sumare): {e}')
+        try:
+            update_region_stats('sumare')
+        except Exception as e:
+            print(f'Erro nas estatísticas por região (sumare): {e}')
+        try:
+            evaluate_alerts('sumare')
+        except Exception as e:
+            print(f'Erro na avaliação de alertas (sumare): {e}')
+        try:
+            update_nowcast('sumare')
+        except Exception as e:
+            print(f'Erro no nowcast (sumare): {e}')
+        try:
+            if update_composite():
+                update_nuclei('composite')
+        except Exception as e:
+            print(f'Erro no mosaico composto: {e}')
+        for radar in ('sumare', 'composite'):
+            try:
+                update_tiles(radar)
+            except Exception as e:
+                print(f'Erro nos tiles ({radar}): {e}')
+        check_frame_updates('sumare')
+        check_frame_updates('composite')
+        print(f"Sumaré sync completed: {stats['updated']} updated, {stats['not_modified']} not modified, "
+              f"{stats['error']} errors, {stats['bytes'] / 1024:.0f} KB in {stats['seconds']}s")
+        # Só erros (fonte fora do ar) contam como falha para o backoff
+        return stats if stats['error'] < len(jobs) else None
+    except Exception as e:
+        print(f'Sumaré sync error: {e}')
+        return None
+
+def clean_exports():
+    """Limpeza do cache de exportação (animações e blocos de frame sem uso há 1h) e dos tiles"""
+    clean_old_files(EXPORT_DIR, 1)
+    clean_old_files(TILES_DIR, MAX_HOURS)
+    return True
+
+SYNC_JOBS = {
+    'mendanha': sync_mendanha,
+    'sumare': sync_sumare,
+    'exports': clean_exports,
+    'history': compact_history
+}
+
+# ============================================
+# CADÊNCIA ADAPTATIVA E LATÊNCIA DE ENTREGA
+# ============================================
+
+def parse_http_date(value):
+    """Converte um cabeçalho Last-Modified em epoch (None se ausente/inválido)"""
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def get_cadence(radar):
+    """Estado da cadência de um radar (compartilhado entre workers)"""
+    return get_state(f'cadence:{radar}', {
+        'publishes': [], 'lags': [], 'interval': None, 'failures': 0, 'misses': 0, 'next_poll': None
+    })
+
+def estimate_publish_interval(publishes):
+    """Mediana dos intervalos entre publicações consecutivas (None sem histórico)"""
+    gaps = sorted(b - a for a, b in zip(publishes, publishes[1:]) if b > a)
+    if not gaps:
+        return None
+    median = gaps[len(gaps) // 2]
+    return min(max(median, CADENCE_CONFIG['min_interval']), CADENCE_CONFIG['max_interval'])
+
+def record_publications(radar, timestamps):
+    """Registra horários de publicação na fonte (epoch) e reestima o intervalo"""
+    if not timestamps:
+        return
+    cadence = get_cadence(radar)
+    publishes = sorted(set(cadence['publishes']) | set(timestamps))
+    cadence['publishes'] = publishes[-CADENCE_CONFIG['history']:]
+    cadence['interval'] = estimate_publish_interval(cadence['publishes'])
+    set_state(f'cadence:{radar}', cadence)
+
+def record_frame_available(radar, name, upstream, learn_lag=True):
+    """
+    Frame novo gravado em disco: guarda a latência fonte -> disco. Com
+    learn_lag=False (frames recuperados depois de uma queda) não entra no
+    atraso usado para agendar a próxima consulta.
+    """
+    now = time.time()
+    state_query(
+        'INSERT OR IGNORE INTO freshness (radar, name, upstream, available) VALUES (?, ?, ?, ?)',
+        (radar, name, upstream, now)
+    )
+    state_query('DELETE FROM freshness WHERE available < ?', (now - FRESHNESS_MAX_HOURS * 3600,))
+    if not learn_lag:
+        return
+    # Atraso entre a publicação e o arquivo aparecer na fonte, para agendar a próxima consulta
+    cadence = get_cadence(radar)
+    cadence['lags'] = (cadence['lags'] + [max(0, now - upstream)])[-CADENCE_CONFIG['history']:]
+    set_state(f'cadence:{radar}', cadence)
+
+# Versões de frame já marcadas como entregues neste processo: (radar, nome, mtime) -> None
+served_marks = OrderedDict()
+served_marks_lock = threading.Lock()
+
+def mark_frame_served(radar, name, filepath, mtime_ns=None):
+    """
+    Primeira entrega de uma versão do frame: no máximo um UPDATE por worker.
+    Com o mtime_ns do índice, dispensa o stat.
+    """
+    if mtime_ns is None:
+        try:
+            mtime_ns = os.stat(filepath).st_mtime_ns
+        except OSError:
+            return
+    key = (radar, name, mtime_ns)
+    with served_marks_lock:
+        if key in served_marks:
+            return
+        served_marks[key] = None
+        while len(served_marks) > 512:
+            served_marks.popitem(last=False)
+    try:
+        state_query(
+            'UPDATE freshness SET served = ? WHERE radar = ? AND name = ? AND served IS NULL',
+            (time.time(), radar, name)
+        )
+    except sqlite3.Error as e:
+        print(f'Freshness update error: {e}')
+
+def adaptive_sync_delay(radar, result):
+    """
+    Próxima consulta de um radar: logo após o horário previsto da próxima
+    publicação (última publicação + intervalo aprendido + atraso mínimo
+    observado até o arquivo aparecer). Publicação atrasada é reconsultada em
+    intervalos que dobram; falhas do sync também fazem backoff exponencial.
+    """
+    cadence = get_cadence(radar)
+    now = time.time()
+    interval = cadence['interval'] or SYNC_SCHEDULE[radar]['interval']
+
+    if result is None:
+        cadence['failures'] += 1
+        delay = CADENCE_CONFIG['retry'] * 2 ** cadence['failures']
+    else:
+        cadence['failures'] = 0
+        expected = None
+        if cadence['publishes']:
+            lag = min(cadence['lags']) if cadence['lags'] else 0
+            expected = cadence['publishes'][-1] + interval + lag + CADENCE_CONFIG['margin']
+        if expected is None:
+            delay = interval
+        elif expected > now:
+            cadence['misses'] = 0
+            delay = expected - now
+        else:
+            cadence['misses'] += 1
+            delay = CADENCE_CONFIG['retry'] * 2 ** (cadence['misses'] - 1)
+
+    delay = min(max(delay, 1), CADENCE_CONFIG['backoff_max'])
+    cadence['next_poll'] = now + delay
+    set_state(f'cadence:{radar}', cadence)
+    return delay
+
+def percentiles(values):
+    """p50/p90/máximo de uma lista de latências (segundos)"""
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'p50': round(pick(0.5), 1), 'p90': round(pick(0.9), 1), 'max': round(values[-1], 1)}
+
+def freshness_metrics(radar):
+    """Latências de entrega das últimas 24h: fonte -> disco -> primeira entrega"""
+    since = time.time() - FRESHNESS_MAX_HOURS * 3600
+    rows = state_query(
+        'SELECT upstream, available, served FROM freshness WHERE radar = ? AND available >= ?',
+        (radar, since)
+    )
+    served = [row for row in rows if row[2] is not None]
+    cadence = get_cadence(radar)
+    return {
+        'frames': len(rows),
+        'upstream_to_disk': percentiles([available - upstream for upstream, available, _ in rows]),
+        'disk_to_served': percentiles([s - available for _, available, s in served]),
+        'upstream_to_served': percentiles([s - upstream for upstream, _, s in served]),
+        'publish_interval': cadence['interval'],
+        'next_poll': datetime.fromtimestamp(cadence['next_poll']).isoformat() if cadence['next_poll'] else None
+    }
+
+# ============================================
+# AGENDADOR DE SYNC (PROCESSO PRÓPRIO, INICIADO PELO WORKER LÍDER)
 # ============================================
 
-def clean_old_files(directory, max_hours=24):
-    """Remove arquivos com mais de X horas"""
-    try:
-        now = datetime.now()
-        cutoff = now - timedelta(hours=max_hours)
-        
-        for filename in os.listdir(directory):
-            filepath = os.path.join(directory, filename)
-            if os.path.isfile(filepath):
-                file_time = datetime.fromtimestamp(os.path.getmtime(filepath))
-                if file_time < cutoff:
-                    os.remove(filepath)
-                    print(f'Removed old file: {filename}')
-    except Exception as e:
-        print(f'Clean error: {e}')
+# O sync (FTP, downloads, NumPy/PIL) não roda nos workers: com gunicorn -k
+# gevent ele seguraria o hub e todas as requisições do worker. O worker
+# eleito líder sobe `python server.py --sync` (interpretador novo, sem
+# gevent nem os greenlets do worker), que roda uma thread por job e termina
+# junto com ele; se o processo de sync cair, o líder sobe outro
 
-def sync_mendanha():
-    """Sincroniza imagens do radar Mendanha via FTP"""
-    global last_sync
-    
-    if not FTP_CONFIG['password']:
-        print("Erro: FTP_PASSWORD não configurada")
-        return
-    
-    try:
-        clean_old_files(MENDANHA_DIR, MAX_HOURS)
-        
-        ftp = ftplib.FTP(FTP_CONFIG['host'], timeout=30)
-        ftp.login(FTP_CONFIG['user'], FTP_CONFIG['password'])
-        ftp.cwd(FTP_CONFIG['path'])
-        
-        files = ftp.nlst()
-        radar_files = [f for f in files if re.match(FTP_CONFIG['pattern'], f)]
-        radar_files.sort(reverse=True)
-        radar_files = radar_files[:20]
-        
-        existing = set(os.listdir(MENDANHA_DIR))
-        
-        for filename in radar_files:
-            # Validar nome do arquivo do FTP também
-            safe_filename = sanitize_filename(filename)
-            if safe_filename and safe_filename not in existing:
-                local_path = os.path.join(MENDANHA_DIR, safe_filename)
-                with open(local_path, 'wb') as f:
-                    ftp.retrbinary(f'RETR {filename}', f.write)
-                print(f'Downloaded: {safe_filename}')
-        
-        ftp.quit()
-        last_sync['mendanha'] = datetime.now().isoformat()
-        
-        remaining = len([f for f in os.listdir(MENDANHA_DIR) if f.endswith('.png')])
-        print(f'Mendanha sync completed: {remaining} files')
-    except Exception as e:
-        print(f'Mendanha sync error: {e}')
+SYNC_LEADER_LOCK = os.path.join(CACHE_DIR, 'sync-leader.lock')
+scheduler_state = {'leader_file': None, 'supervisor': None, 'process': None}
+scheduler_lock = threading.Lock()
 
-def sync_sumare():
-    """Baixa imagens do radar Sumaré do AlertaRio"""
-    global last_sync
-    try:
-        base_url = 'https://alertario.rio.rj.gov.br/upload/Mapa/semfundo/radar'
-        
-        for i in range(1, 21):
-            filename = f'radar{str(i).zfill(3)}.png'
-            url = f'{base_url}{str(i).zfill(3)}.png'
-            local_path = os.path.join(SUMARE_DIR, filename)
-            
-            try:
-                response = requests.get(url, timeout=10)
-                if response.status_code == 200:
-                    with open(local_path, 'wb') as f:
-                        f.write(response.content)
-            except Exception as e:
-                print(f'Error downloading {filename}: {e}')
-        
-        last_sync['sumare'] = datetime.now().isoformat()
-        print(f'Sumaré sync completed: 20 files')
-    except Exception as e:
-        print(f'Sumaré sync error: {e}')
+def try_acquire_leadership():
+    """
+    Eleição de líder por lock de arquivo: só o processo que obtém o flock
+    exclusivo sobe o processo de sync. Se ele morrer, o SO libera o lock e outro
+    worker assume na próxima tentativa.
+    """
+    with scheduler_lock:
+        if scheduler_state['leader_file'] is not None:
+            return True
+        lock_file = open(SYNC_LEADER_LOCK, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f'{os.getpid()}\n')
+        lock_file.flush()
+        scheduler_state['leader_file'] = lock_file
+        print(f'Sync leader: pid {os.getpid()}')
+        return True
+
+def is_sync_leader():
+    return scheduler_state['leader_file'] is not None
+
+def run_sync_job(name):
+    """
+    Executa um job de sync com lock de arquivo por job, para que o sync
+    manual (em qualquer worker) nunca rode junto com o agendado.
+    """
+    with open(os.path.join(CACHE_DIR, f'sync-{name}.lock'), 'a+') as lock_file:
+        flock_exclusive(lock_file)
+        started = time.perf_counter()
+        result = None
+        try:
+            result = SYNC_JOBS[name]()
+            return result
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            observe_metric('radar_sync_duration_seconds', time.perf_counter() - started,
+                           job=name, result='ok' if result is not None else 'error')
+            flush_metrics()
+
+def next_sync_delay(name, result):
+    """
+    Intervalo até a próxima execução do job. Radares seguem a cadência
+    aprendida (jitter só para depois, nunca antes da publicação prevista);
+    os demais jobs usam intervalo fixo com jitter.
+    """
+    schedule = SYNC_SCHEDULE[name]
+    if schedule['adaptive']:
+        return adaptive_sync_delay(name, result) + random.uniform(0, schedule['jitter'])
+    return max(1, schedule['interval'] + random.uniform(-schedule['jitter'], schedule['jitter']))
+
+def request_sync(name):
+    """Pede ao processo de sync que antecipe o job (sync manual)"""
+    set_state(f'sync-request:{name}', time.time())
+
+def wait_next_sync(name, started, delay):
+    """Espera `delay` segundos ou até um pedido de sync manual feito depois de `started`"""
+    deadline = time.time() + delay
+    while time.time() < deadline:
+        time.sleep(max(0, min(SYNC_REQUEST_POLL, deadline - time.time())))
+        if get_state(f'sync-request:{name}', 0) > started:
+            return
+
+def sync_job_loop(name):
+    """Loop de um job no processo de sync: independente dos demais"""
+    # Jitter inicial para que os jobs não disparem todos juntos
+    time.sleep(random.uniform(0, SYNC_SCHEDULE[name]['jitter']))
+    while True:
+        started = time.time()
+        result = None
+        try:
+            result = run_sync_job(name)
+        except Exception as e:
+            print(f'Sync job {name} error: {e}')
+        wait_next_sync(name, started, next_sync_delay(name, result))
+
+def run_sync_process():
+    """
+    Corpo do processo de sync (python server.py --sync). Iniciado pelo
+    worker líder (SYNC_PARENT_PID), termina quando ele sai; rodando sozinho
+    (programa próprio no Supervisor), disputa a liderança como um worker.
+    """
+    parent = int(os.environ.get('SYNC_PARENT_PID', '0'))
+    if not parent:
+        while not try_acquire_leadership():
+            time.sleep(SYNC_LEADER_RETRY)
+    print(f'Processo de sync: pid {os.getpid()}')
+    for name in SYNC_JOBS:
+        threading.Thread(target=sync_job_loop, args=(name,), daemon=True, name=f'sync-{name}').start()
+    while not parent or os.getppid() == parent:
+        time.sleep(1)
+    print('Processo de sync: o worker líder saiu, encerrando')
+
+def start_sync_process():
+    """Sobe o processo de sync, filho deste worker"""
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), '--sync'],
+                            env=dict(os.environ, SYNC_PARENT_PID=str(os.getpid())))
 
-def sync_loop():
-    """Loop de sincronização em background"""
+def sync_supervisor_loop():
+    """Disputa a liderança; no líder, mantém o processo de sync rodando"""
     while True:
-        sync_mendanha()
-        sync_sumare()
-        clean_old_files(EXPORT_DIR, 1)
-        time.sleep(120)
+        if not try_acquire_leadership():
+            time.sleep(SYNC_LEADER_RETRY)
+            continue
+        process = scheduler_state['process']
+        if process is None or process.poll() is not None:
+            if process is not None:
+                print(f'Processo de sync saiu (código {process.returncode}), reiniciando')
+            scheduler_state['process'] = start_sync_process()
+        time.sleep(SYNC_PROCESS_CHECK)
 
-sync_thread = threading.Thread(target=sync_loop, daemon=True)
-sync_thread.start()
+def start_sync_scheduler():
+    """Inicia o supervisor do sync (idempotente). Todo worker chama; só o líder sobe o processo."""
+    with scheduler_lock:
+        thread = scheduler_state['supervisor']
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=sync_supervisor_loop, daemon=True, name='sync-supervisor')
+            scheduler_state['supervisor'] = thread
+            thread.start()
+
+if SYNC_ENABLED and not SYNC_PROCESS:
+    start_sync_scheduler()
 
 # ============================================
 # ENDPOINTS PÚBLICOS (com rate limiting)
@@ -304,36 +4170,9 @@ sync_thread.start()
 @app.route('/api/frames/mendanha')
 @rate_limit('default')
 def get_mendanha_frames():
-    """Lista frames do Mendanha"""
-    try:
-        files = os.listdir(MENDANHA_DIR)
-        files = [f for f in files if f.endswith('.png') and sanitize_filename(f)]
-        files.sort()  # Ordem cronológica (mais antigo primeiro)
-        files = files[-20:]  # Pegar os 20 mais recentes
-
-        # Extrair timestamp do último frame para detectar atraso
-        latest_timestamp = None
-        delay_minutes = None
-        if files:
-            latest_file = files[-1]
-            # Formato: MDN-YYYYMMDD-HHMM_...
-            match = re.match(r'MDN-(\d{4})(\d{2})(\d{2})-(\d{2})(\d{2})', latest_file)
-            if match:
-                year, month, day, hour, minute = match.groups()
-                latest_timestamp = f"{year}-{month}-{day}T{hour}:{minute}:00"
-                try:
-                    frame_time = datetime(int(year), int(month), int(day), int(hour), int(minute))
-                    now = datetime.now()
-                    delay_minutes = int((now - frame_time).total_seconds() / 60)
-                except:
-                    pass
-
-        return jsonify({
-            'frames': files,
-            'count': len(files),
-            'latest_timestamp': latest_timestamp,
-            'delay_minutes': delay_minutes
-        })
+    """Lista frames do Mendanha (a partir do índice em memória)"""
+    try:
+        return frames_json_response('mendanha')
     except Exception as e:
         return jsonify({'error': 'Erro interno'}), 500
 
@@ -341,192 +4180,651 @@ def get_mendanha_frames():
 @rate_limit('default')
 def get_mendanha_frame(filename):
     """Serve uma imagem do Mendanha (com filtro opcional)"""
-    # CORREÇÃO: Validar filename contra Path Traversal
-    safe_filename = sanitize_filename(filename)
-    if not safe_filename:
-        return jsonify({'error': 'Nome de arquivo inválido'}), 400
-    
-    filepath = os.path.join(MENDANHA_DIR, safe_filename)
+    entry, error = find_frame('mendanha', filename)
+    if error:
+        return error
     
-    # Verificação adicional: garantir que está dentro do diretório esperado
-    real_path = os.path.realpath(filepath)
-    if not real_path.startswith(os.path.realpath(MENDANHA_DIR)):
-        return jsonify({'error': 'Acesso negado'}), 403
+    # Verificar se filtro de chuva está ativo
+    if request.args.get('filter', '') == 'rain':
+        filepath = os.path.join(MENDANHA_DIR, entry['name'])
+        variant = get_rain_variant(filepath)
+        if variant:
+            mark_frame_served('mendanha', entry['name'], filepath, entry['mtime_ns'])
+            data, etag = variant
+            response = Response(data, mimetype='image/png')
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = frame_cache_control(entry, rain=True)
+            return response.make_conditional(request)
     
-    if os.path.exists(filepath):
-        # Verificar se filtro de chuva está ativo
-        filter_rain = request.args.get('filter', '') == 'rain'
-        
-        if filter_rain:
-            filtered = filter_rain_only(filepath)
-            if filtered:
-                response = send_file(filtered, mimetype='image/png')
-                response.headers['Cache-Control'] = 'public, max-age=60'
-                return response
-        
-        response = send_file(filepath, mimetype='image/png')
-        return response
-    return jsonify({'error': 'Arquivo não encontrado'}), 404
+    return frame_file_response('mendanha', entry) or (jsonify({'error': 'Arquivo não encontrado'}), 404)
 
 @app.route('/api/frames/sumare')
 @rate_limit('default')
 def get_sumare_frames():
-    """Lista frames do Sumaré"""
+    """Lista frames do Sumaré (a partir do índice em memória)"""
     try:
-        files = os.listdir(SUMARE_DIR)
-        files = [f for f in files if f.endswith('.png') and sanitize_filename(f)]
-        files.sort()
-        return jsonify({'frames': files, 'count': len(files)})
+        return frames_json_response('sumare')
     except Exception as e:
         return jsonify({'error': 'Erro interno'}), 500
 
 @app.route('/api/frame/sumare/<filename>')
 @rate_limit('default')
 def get_sumare_frame(filename):
-    """Serve uma imagem do Sumaré"""
-    # CORREÇÃO: Validar filename contra Path Traversal
+    """
+    Serve uma imagem do Sumaré. O AlertaRio regrava os mesmos nomes: sem ?v=
+    o cliente revalida (ETag = SHA-1 do conteúdo) em vez de baixar de novo.
+    """
+    entry, error = find_frame('sumare', filename)
+    if error:
+        return error
+    return frame_file_response('sumare', entry) or (jsonify({'error': 'Arquivo não encontrado'}), 404)
+
+@app.route('/api/frames/composite')
+@rate_limit('default')
+def get_composite_frames():
+    """Lista frames do mosaico Mendanha + Sumaré (a partir do índice em memória)"""
+    try:
+        return frames_json_response('composite')
+    except Exception as e:
+        print(f'Erro ao listar frames do mosaico: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+
+@app.route('/api/frame/composite/<filename>')
+@rate_limit('default')
+def get_composite_frame(filename):
+    """
+    Serve um frame do mosaico. O intervalo é refeito quando um frame atrasado
+    do Mendanha chega, então sem ?v= o cliente revalida (ETag) em vez de guardar.
+    """
+    entry, error = find_frame('composite', filename)
+    if error:
+        return error
+    return frame_file_response('composite', entry) or (jsonify({'error': 'Arquivo não encontrado'}), 404)
+
+@app.route('/api/tiles/<radar>/<filename>/<int:z>/<int:x>/<int:y>.png')
+@rate_limit('tiles')
+def get_frame_tile(radar, filename, z, x, y):
+    """
+    Tile XYZ (256 px, Web Mercator) de um frame, cortado no sync (frames
+    antigos: na primeira requisição). Tiles sem nenhum pixel visível ou fora
+    da área do radar: 204 sem corpo. Aceita ?v= como /api/frame (URL imutável).
+    """
+    if radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
+    if not TILE_CONFIG['min_zoom'] <= z <= TILE_CONFIG['max_zoom']:
+        return jsonify({'error': f"Zoom fora da pirâmide ({TILE_CONFIG['min_zoom']} a {TILE_CONFIG['max_zoom']})"}), 404
+    entry, error = find_frame(radar, filename)
+    if error:
+        return error
+
+    try:
+        data = read_tile(radar, entry, z, x, y)
+    except FileNotFoundError:
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+    except Exception as e:
+        print(f'Erro ao ler tile: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+
+    mark_frame_served(radar, entry['name'], os.path.join(RADAR_DIRS[radar], entry['name']), entry['mtime_ns'])
+    if data is None:
+        response = Response(status=204)
+    else:
+        response = Response(data, mimetype='image/png')
+        response.set_etag(f"{entry['sha1']}-{z}-{x}-{y}")
+    response.headers['Cache-Control'] = frame_cache_control(entry)
+    return response.make_conditional(request)
+
+@app.route('/api/frames/<radar>/bundle')
+@rate_limit('default')
+def get_frame_bundle(radar):
+    """
+    Vários frames em uma única resposta multipart/mixed.
+    ?since=<frame> (só os mais novos, Mendanha), ?filter=rain (Mendanha),
+    ?format=png|webp e ?scale=1|0.5|0.25 (variantes menores para celular/mosaico).
+    """
+    if radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
+
+    since = request.args.get('since', '')
+    if since and not sanitize_filename(since):
+        return jsonify({'error': 'Nome de arquivo inválido'}), 400
+
+    fmt = request.args.get('format', 'png')
+    if fmt not in BUNDLE_FORMATS:
+        return jsonify({'error': 'Formato inválido'}), 400
+    if fmt == 'webp' and not features.check('webp'):
+        return jsonify({'error': 'Formato indisponível'}), 400
+
+    try:
+        scale = float(request.args.get('scale', '1'))
+    except ValueError:
+        scale = None
+    if scale not in BUNDLE_SCALES:
+        return jsonify({'error': 'Escala inválida'}), 400
+
+    filter_rain = radar == 'mendanha' and request.args.get('filter', '') == 'rain'
+
+    try:
+        entries = select_bundle_entries(radar, since)
+        body, etag, count = build_frame_bundle(radar, entries, filter_rain, scale, fmt)
+    except Exception as e:
+        print(f'Erro ao montar bundle: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+
+    for entry in entries:
+        mark_frame_served(radar, entry['name'], os.path.join(RADAR_DIRS[radar], entry['name']), entry['mtime_ns'])
+
+    response = Response(body, content_type=f'multipart/mixed; boundary={BUNDLE_BOUNDARY}')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Frame-Count'] = str(count)
+    return response.make_conditional(request)
+
+@app.route('/api/frames/<radar>/nowcast')
+@rate_limit('default')
+def get_nowcast_frames(radar):
+    """
+    Previsões de +10/+20/+30 min no mesmo formato da listagem de frames
+    (nomes servidos por /api/nowcast/<radar>/<nome>), com os horários de
+    validade e o movimento médio estimado.
+    """
+    if radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
+    try:
+        index = load_nowcast_index(radar)
+    except (OSError, ValueError) as e:
+        print(f'Erro ao ler nowcast: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+    if index is None:
+        return jsonify({'error': 'Previsão ainda não disponível'}), 404
+
+    response = jsonify({
+        'frames': index['frames'],
+        'versions': index.get('versions', {}),
+        'count': len(index['frames']),
+        'base_timestamp': datetime.fromtimestamp(index['base']).isoformat(timespec='seconds'),
+        'valid_timestamps': [datetime.fromtimestamp(t).isoformat(timespec='seconds') for t in index['valid']],
+        'lead_minutes': index['lead_minutes'],
+        'motion': index['motion']
+    })
+    response.set_etag(index['etag'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/nowcast/<radar>/<filename>')
+@rate_limit('default')
+def get_nowcast_frame(radar, filename):
+    """
+    Serve um frame de previsão. O nome tem o horário base, mas o conteúdo
+    pode ser refeito (histórico corrigido, algoritmo novo): só a URL com ?v=
+    igual à versão do índice é imutável; sem ela, cache curto.
+    """
+    if radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
     safe_filename = sanitize_filename(filename)
     if not safe_filename:
         return jsonify({'error': 'Nome de arquivo inválido'}), 400
-    
-    filepath = os.path.join(SUMARE_DIR, safe_filename)
-    
-    # Verificação adicional
-    real_path = os.path.realpath(filepath)
-    if not real_path.startswith(os.path.realpath(SUMARE_DIR)):
-        return jsonify({'error': 'Acesso negado'}), 403
-    
-    if os.path.exists(filepath):
-        response = send_file(filepath, mimetype='image/png')
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        return response
-    return jsonify({'error': 'Arquivo não encontrado'}), 404
 
-@app.route('/api/export/gif/<radar>')
-@rate_limit('gif')  # Rate limit específico para GIF (mais restrito)
-def export_gif(radar):
-    """Gera GIF animado do radar"""
+    filepath = os.path.join(NOWCAST_DIR, radar, safe_filename)
+    if not os.path.exists(filepath):
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+    response = send_file(filepath, mimetype='image/png', etag=True, conditional=True)
+    index = load_nowcast_index(radar)
+    version = (index or {}).get('versions', {}).get(safe_filename)
+    if version is not None and request.args.get('v') == version:
+        response.headers['Cache-Control'] = FRAME_IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = NOWCAST_CACHE_CONTROL
+    return response
+
+@app.route('/api/stream/frames')
+@rate_limit('default')
+def stream_frames():
+    """Eventos de atualização dos frames (SSE): substitui o polling da listagem"""
+    if stream_state['clients'] >= STREAM_CONFIG['max_clients']:
+        response = jsonify({'error': 'Muitas conexões abertas'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    start_stream_watcher()
+    response = Response(stream_frame_events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: não bufferizar o stream
+    return response
+
+def select_export_entries(radar, start, end, step):
+    """
+    Frames da animação, em ordem cronológica: com janela (from/to), os do
+    intervalo; sem janela, os GIF_MAX_FRAMES mais recentes. step pula frames
+    contando a partir do mais recente, que sempre entra.
+    """
+    entries = get_frame_index(radar)['frames']
+    if start or end:
+        entries = [entry for entry in entries if entry['timestamp'] is not None
+                   and (start is None or entry['timestamp'] >= start)
+                   and (end is None or entry['timestamp'] <= end)]
+    entries = entries[::-1][::step][::-1]
+    if not (start or end):
+        entries = entries[-GIF_MAX_FRAMES:]
+    return entries
+
+def export_response(radar, fmt):
+    if radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'Formato inválido'}), 400
+    if fmt == 'webp' and not features.check('webp'):
+        return jsonify({'error': 'Formato indisponível'}), 400
+
     try:
-        from PIL import Image
-        
-        # Validar radar
-        if radar not in ['mendanha', 'sumare']:
-            return jsonify({'error': 'Radar inválido'}), 400
-        
-        directory = MENDANHA_DIR if radar == 'mendanha' else SUMARE_DIR
-        
-        files = [f for f in os.listdir(directory) if f.endswith('.png') and sanitize_filename(f)]
-        files.sort()
-        
-        if len(files) == 0:
+        scale = float(request.args.get('scale', '1'))
+    except ValueError:
+        scale = None
+    if scale not in BUNDLE_SCALES:
+        return jsonify({'error': 'Escala inválida'}), 400
+
+    try:
+        step = int(request.args.get('step', '1'))
+    except ValueError:
+        step = 0
+    if not 1 <= step <= EXPORT_CONFIG['max_step']:
+        return jsonify({'error': f"step inválido (1 a {EXPORT_CONFIG['max_step']})"}), 400
+
+    start, end = request.args.get('from'), request.args.get('to')
+    if (start or end) and radar not in TIMESTAMPED_RADARS:
+        return jsonify({'error': 'Janela from/to indisponível para este radar'}), 400
+    try:
+        start = parse_history_time(start) if start else None
+        end = parse_history_time(end) if end else None
+    except ValueError:
+        return jsonify({'error': 'Data inválida (use ISO 8601, ex.: 2025-01-31T14:00)'}), 400
+
+    timestamps = request.args.get('timestamp', '') in ('1', 'true')
+
+    try:
+        entries = select_export_entries(radar, start, end, step)
+        if len(entries) == 0:
             return jsonify({'error': 'Nenhum frame disponível'}), 404
-        
-        # Limitar número de frames no GIF para evitar DoS
-        files = files[:20]
-        
-        images = []
-        for filename in files:
-            filepath = os.path.join(directory, filename)
-            try:
-                img = Image.open(filepath)
-                if img.mode == 'RGBA':
-                    background = Image.new('RGB', img.size, (0, 0, 0))
-                    background.paste(img, mask=img.split()[3])
-                    images.append(background)
-                else:
-                    images.append(img.convert('RGB'))
-            except Exception as e:
-                print(f'Error loading {filename}: {e}')
-        
-        if len(images) == 0:
+        # Limitar número de frames na animação para evitar DoS
+        if len(entries) > EXPORT_CONFIG['max_frames']:
+            return jsonify({'error': f"Janela com {len(entries)} frames (máximo {EXPORT_CONFIG['max_frames']}); "
+                                     f"aumente step ou reduza o intervalo"}), 400
+
+        with timed_metric('radar_export_gif_duration_seconds', radar=radar, format=fmt):
+            output_path, key = build_export(radar, entries, fmt, scale, timestamps)
+        if output_path is None:
             return jsonify({'error': 'Erro ao carregar imagens'}), 500
-        
-        output = BytesIO()
-        images[0].save(
-            output,
-            format='GIF',
-            save_all=True,
-            append_images=images[1:],
-            duration=500,
-            loop=0
-        )
-        output.seek(0)
-        
+
+        mimetype, extension = EXPORT_FORMATS[fmt]
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'radar_{radar}_{timestamp}.gif'
-        
+        filename = f'radar_{radar}_{timestamp}.{extension}'
+
         return send_file(
-            output,
-            mimetype='image/gif',
+            output_path,
+            mimetype=mimetype,
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            etag=key
         )
-        
-    except ImportError:
-        return jsonify({'error': 'Pillow não instalado'}), 500
+
+    except Exception as e:
+        print(f'Erro ao gerar animação: {e}')
+        return jsonify({'error': 'Erro ao gerar animação'}), 500
+
+@app.route('/api/export/<radar>')
+@rate_limit('gif')  # Rate limit específico para exportação (mais restrito)
+def export_animation(radar):
+    """
+    Animação do radar: ?format=gif|webp|apng, ?from=&to= (ISO 8601, radares
+    com horário no nome), ?step=N (1 a cada N frames), ?scale=1|0.5|0.25 e
+    ?timestamp=1 (horário sobreposto em cada frame)
+    """
+    return export_response(radar, request.args.get('format', 'gif'))
+
+@app.route('/api/export/gif/<radar>')
+@rate_limit('gif')
+def export_gif(radar):
+    """Gera GIF animado do radar (mesmos parâmetros de /api/export/<radar>)"""
+    return export_response(radar, 'gif')
+
+@app.route('/api/nuclei/<radar>')
+@rate_limit('default')
+def get_nuclei(radar):
+    """Núcleos de chuva e tendência de movimento por frame (calculados no sync)"""
+    if radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
+
+    try:
+        frames_data = update_nuclei(radar)
+        return jsonify({
+            'radar': radar,
+            'frames': frames_data,
+            'count': len(frames_data),
+            'trend_frames': TREND_FRAMES
+        })
+    except Exception as e:
+        print(f'Erro ao obter núcleos: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+
+@app.route('/api/history/<radar>')
+@rate_limit('default')
+def get_history(radar):
+    """
+    Histórico além das 24 h em disco, lido do arquivo compacto (sem decodificar PNG).
+    ?from=&to= em ISO 8601 (padrão: últimas 24 h). Por padrão, resumo por frame
+    (pixels por classe de intensidade); ?format=raw devolve os rasters de classes.
+    """
+    if radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
+
+    try:
+        end = parse_history_time(request.args['to']) if request.args.get('to') else datetime.now()
+        start = parse_history_time(request.args['from']) if request.args.get('from') else end - timedelta(hours=24)
+    except ValueError:
+        return jsonify({'error': 'Data inválida (use ISO 8601, ex.: 2025-01-31T14:00)'}), 400
+    if start > end or end - start > timedelta(days=HISTORY_CONFIG['max_range_days']):
+        return jsonify({'error': f"Intervalo inválido (máximo {HISTORY_CONFIG['max_range_days']} dias)"}), 400
+
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'raw'):
+        return jsonify({'error': 'Formato inválido'}), 400
+
+    try:
+        frames = read_history(radar, start.timestamp(), end.timestamp(), payloads=fmt == 'raw')
+    except Exception as e:
+        print(f'Erro ao ler histórico: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+
+    if fmt == 'json':
+        return jsonify({
+            'radar': radar,
+            'from': start.isoformat(timespec='seconds'),
+            'to': end.isoformat(timespec='seconds'),
+            'frames': [history_summary(record) for record, _ in frames],
+            'count': len(frames)
+        })
+
+    if len(frames) > HISTORY_CONFIG['max_raw_frames']:
+        return jsonify({'error': f"Muitos frames ({len(frames)}); máximo {HISTORY_CONFIG['max_raw_frames']} por requisição"}), 400
+    response = Response(build_history_raw(frames), content_type=f'multipart/mixed; boundary={HISTORY_BOUNDARY}')
+    response.headers['X-Frame-Count'] = str(len(frames))
+    return response
+
+@app.route('/api/accumulation/<radar>')
+@rate_limit('default')
+def get_rain_accumulation(radar):
+    """
+    Chuva acumulada por pixel nas janelas de 1h, 3h ou 24h (terminando no frame
+    mais recente), calculada incrementalmente no sync.
+    ?window=1h|3h|24h, ?format=json|png e, no PNG, ?threshold=<mm> para o
+    mapa de excedência.
+    """
+    if radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
+
+    window = request.args.get('window', '1h')
+    if window not in ACCUM_WINDOWS:
+        return jsonify({'error': 'Janela inválida (1h, 3h ou 24h)'}), 400
+
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'png'):
+        return jsonify({'error': 'Formato inválido'}), 400
+
+    threshold = None
+    if request.args.get('threshold'):
+        try:
+            threshold = float(request.args['threshold'])
+        except ValueError:
+            threshold = -1
+        if not 0 < threshold <= 1000:
+            return jsonify({'error': 'Limiar inválido (mm)'}), 400
+
+    try:
+        entry = get_accumulation(radar, window, threshold if fmt == 'png' else None, fmt)
+    except Exception as e:
+        print(f'Erro ao obter acumulado: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+    if entry is None:
+        return jsonify({'error': 'Acumulado ainda não disponível'}), 404
+
+    body, etag = entry
+    response = Response(body, mimetype='image/png' if fmt == 'png' else 'application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/regions/<radar>')
+@rate_limit('default')
+def get_region_stats(radar):
+    """
+    Chuva por região (bairro) sem baixar imagens: cobertura, classe máxima e
+    taxa média no frame mais recente, mais a série das últimas horas.
+    ?region=<id ou nome> filtra uma região; ?hours= (padrão 1, máximo 6).
+    """
+    if radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
+    if not REGIONS['regions']:
+        return jsonify({'error': 'Regiões não configuradas'}), 404
+
+    try:
+        hours = float(request.args.get('hours', REGIONS_DEFAULT_HOURS))
+    except ValueError:
+        hours = -1
+    if not 0 < hours <= REGIONS_SERIES_HOURS:
+        return jsonify({'error': f'Horas inválidas (máximo {REGIONS_SERIES_HOURS})'}), 400
+
+    regions = find_regions(request.args.get('region'))
+    if not regions:
+        return jsonify({'error': 'Região não encontrada'}), 404
+
+    try:
+        stats = region_stats(radar, hours, regions)
     except Exception as e:
-        return jsonify({'error': 'Erro ao gerar GIF'}), 500
+        print(f'Erro ao obter estatísticas por região: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+    if stats is None:
+        return jsonify({'error': 'Estatísticas por região ainda não disponíveis'}), 404
+
+    response = jsonify(stats)
+    response.set_etag(hashlib.sha1(repr((REGIONS['version'], stats['time'], hours,
+                                         [r['id'] for r in regions])).encode()).hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/alerts')
+@rate_limit('default')
+def get_alerts():
+    """
+    Alertas ativos e eventos recentes das regras avaliadas no sync
+    (?radar= filtra um radar).
+    """
+    radar = request.args.get('radar')
+    if radar is not None and radar not in RADAR_DIRS:
+        return jsonify({'error': 'Radar inválido'}), 400
+
+    try:
+        active = []
+        for name in ([radar] if radar else RADAR_DIRS):
+            statuses = get_state(f'alerts:{name}', {'rules': {}})['rules']
+            for rule in ALERT_RULES:
+                status = statuses.get(rule['id'])
+                if rule['radar'] == name and status and status.get('active'):
+                    active.append({
+                        'id': f"{rule['id']}:{name}:{int(status['since'])}",
+                        'rule': rule['id'],
+                        'name': rule['name'],
+                        'radar': name,
+                        'since': datetime.fromtimestamp(status['since']).isoformat(timespec='seconds'),
+                        'peak_area_pixels': status['peak_area'],
+                        'peak_class': status['peak_class']
+                    })
+        events = [e for e in get_state('alerts:events', []) if radar is None or e['radar'] == radar]
+    except Exception as e:
+        print(f'Erro ao obter alertas: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+
+    return jsonify({
+        'active': active,
+        'events': events[::-1],
+        'rules': len([r for r in ALERT_RULES if radar is None or r['radar'] == radar])
+    })
 
 @app.route('/api/status')
 @rate_limit('default')
 def get_status():
     """Status da sincronização (informações limitadas)"""
-    mendanha_count = len([f for f in os.listdir(MENDANHA_DIR) if f.endswith('.png')]) if os.path.exists(MENDANHA_DIR) else 0
-    sumare_count = len([f for f in os.listdir(SUMARE_DIR) if f.endswith('.png')]) if os.path.exists(SUMARE_DIR) else 0
+    mendanha_count = len(get_frame_index('mendanha')['frames'])
+    sumare_count = len(get_frame_index('sumare')['frames'])
+    composite_count = len(get_frame_index('composite')['frames'])
     
     return jsonify({
         'mendanha': {
             'files_count': mendanha_count,
-            'last_sync': last_sync['mendanha']
+            'last_sync': get_sync_state('mendanha')['last_sync']
         },
         'sumare': {
             'files_count': sumare_count,
-            'last_sync': last_sync['sumare']
+            'last_sync': get_sync_state('sumare')['last_sync']
+        },
+        'composite': {
+            'files_count': composite_count
         },
         'status': 'ok'
     })
 
+@app.route('/metrics')
+@rate_limit('default')
+def get_metrics():
+    """
+    Métricas de todos os workers no formato do Prometheus. Idade do último
+    frame, frames por radar e taxa de acerto dos caches são calculadas na
+    coleta a partir do índice e dos contadores somados.
+    """
+    try:
+        merged, workers = collect_metrics()
+    except sqlite3.Error as e:
+        print(f'Erro ao coletar métricas: {e}')
+        return jsonify({'error': 'Erro interno'}), 500
+
+    now = time.time()
+    ages, counts = [], []
+    for radar in RADAR_DIRS:
+        index = get_frame_index(radar)
+        counts.append(({'radar': radar}, len(index['frames'])))
+        if index['listed']:
+            latest = index['listed'][-1]
+            frame_time = latest['timestamp'].timestamp() if latest['timestamp'] else latest['mtime_ns'] / 1e9
+            ages.append(({'radar': radar}, round(now - frame_time, 1)))
+
+    requests_by_cache = {}
+    for key, value in merged.items():
+        if key.startswith('radar_cache_requests_total{'):
+            labels = dict(part.split('=', 1) for part in key[len('radar_cache_requests_total{'):-1].split(','))
+            totals = requests_by_cache.setdefault(labels['cache'].strip('"'), {'hit': 0, 'total': 0})
+            totals['total'] += value
+            if labels['result'] == '"hit"':
+                totals['hit'] += value
+    ratios = [({'cache': cache}, round(totals['hit'] / totals['total'], 4))
+              for cache, totals in sorted(requests_by_cache.items()) if totals['total']]
+
+    gauges = {
+        'radar_frame_age_seconds': ('Idade do frame mais recente listado', ages),
+        'radar_frames': ('Frames em disco por radar', counts),
+        'radar_cache_hit_ratio': ('Fração de consultas atendidas pelo cache', ratios),
+        'radar_metrics_workers': ('Workers com métricas no state.db', [({}, workers)])
+    }
+    return Response(metrics_exposition(merged, gauges), mimetype='text/plain; version=0.0.4')
+
 # ============================================
 # ENDPOINTS ADMINISTRATIVOS (protegidos)
 # ============================================
 
+def manual_sync(name):
+    """
+    Sync manual sem prender o worker: com o processo de sync (SYNC_ENABLED)
+    só antecipa o job e responde 202; sem ele, roda aqui. 409 enquanto o
+    job está em andamento em qualquer processo.
+    """
+    last_sync = get_sync_state(name)['last_sync']
+    if sync_in_progress(name):
+        return jsonify({'error': 'Sync já em andamento', 'last_sync': last_sync}), 409
+    if SYNC_ENABLED:
+        request_sync(name)
+        return jsonify({'message': 'Sync scheduled', 'last_sync': last_sync}), 202
+    run_sync_job(name)
+    return jsonify({'message': 'Sync completed', 'last_sync': get_sync_state(name)['last_sync']})
+
 @app.route('/api/sync/mendanha')
 @require_admin_token
 @rate_limit('sync')
 def manual_sync_mendanha():
     """Sincronização manual do Mendanha - REQUER TOKEN"""
-    sync_mendanha()
-    return jsonify({'message': 'Sync completed', 'last_sync': last_sync['mendanha']})
+    return manual_sync('mendanha')
 
 @app.route('/api/sync/sumare')
 @require_admin_token
 @rate_limit('sync')
 def manual_sync_sumare():
     """Sincronização manual do Sumaré - REQUER TOKEN"""
-    sync_sumare()
-    return jsonify({'message': 'Sync completed', 'last_sync': last_sync['sumare']})
+    return manual_sync('sumare')
+
+@app.route('/api/admin/profile')
+@require_admin_token
+def admin_profile():
+    """
+    Amostra o worker que atendeu por ?seconds= (padrão 10, máx. 60) a cada
+    ?interval= ms e devolve as pilhas no formato folded (flame graph) - REQUER TOKEN
+    """
+    try:
+        seconds = min(float(request.args.get('seconds', PROFILER_CONFIG['default_seconds'])), PROFILER_CONFIG['max_seconds'])
+        interval = max(float(request.args.get('interval', PROFILER_CONFIG['default_interval_ms'])), PROFILER_CONFIG['min_interval_ms'])
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    if seconds <= 0:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    if not profiler_lock.acquire(blocking=False):
+        return jsonify({'error': 'Profiler já em execução neste worker'}), 409
+    try:
+        samples = sample_stacks(seconds, interval / 1000)
+    finally:
+        profiler_lock.release()
+
+    body = ''.join(f'{stack} {count}\n' for stack, count in samples.most_common())
+    response = Response(body, mimetype='text/plain')
+    response.headers['X-Profiled-Worker'] = str(os.getpid())
+    response.headers['X-Profile-Samples'] = str(sum(samples.values()))
+    return response
 
 @app.route('/api/admin/status')
 @require_admin_token
 def admin_status():
     """Status detalhado para administradores"""
-    mendanha_count = len([f for f in os.listdir(MENDANHA_DIR) if f.endswith('.png')]) if os.path.exists(MENDANHA_DIR) else 0
-    sumare_count = len([f for f in os.listdir(SUMARE_DIR) if f.endswith('.png')]) if os.path.exists(SUMARE_DIR) else 0
+    mendanha_index = get_frame_index('mendanha')
+    sumare_index = get_frame_index('sumare')
+    
+    mendanha_count = len(mendanha_index['frames'])
+    sumare_count = len(sumare_index['frames'])
     
-    mendanha_size = sum(os.path.getsize(os.path.join(MENDANHA_DIR, f)) for f in os.listdir(MENDANHA_DIR) if f.endswith('.png')) if os.path.exists(MENDANHA_DIR) else 0
-    sumare_size = sum(os.path.getsize(os.path.join(SUMARE_DIR, f)) for f in os.listdir(SUMARE_DIR) if f.endswith('.png')) if os.path.exists(SUMARE_DIR) else 0
+    mendanha_size = mendanha_index['total_size']
+    sumare_size = sumare_index['total_size']
+    
+    mendanha_sync = get_sync_state('mendanha')
+    sumare_sync = get_sync_state('sumare')
     
     return jsonify({
         'mendanha': {
-            'last_sync': last_sync['mendanha'],
+            'last_sync': mendanha_sync['last_sync'],
             'files_count': mendanha_count,
             'size_mb': round(mendanha_size / 1024 / 1024, 2)
         },
         'sumare': {
-            'last_sync': last_sync['sumare'],
+            'last_sync': sumare_sync['last_sync'],
             'files_count': sumare_count,
             'size_mb': round(sumare_size / 1024 / 1024, 2)
         },
+        'sync_stats': {'mendanha': mendanha_sync['stats'], 'sumare': sumare_sync['stats']},
+        'freshness': {'mendanha': freshness_metrics('mendanha'), 'sumare': freshness_metrics('sumare')},
+        'sync_leader': is_sync_leader(),
+        'sync_process': scheduler_state['process'].pid if scheduler_state['process'] else None,
         'max_hours': MAX_HOURS,
         'ftp_configured': bool(FTP_CONFIG['password']),
         'status': 'ok'
@@ -538,23 +4836,107 @@ def admin_status():
 
 STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Só estes tipos são servidos (server.py, regras e dados ficam de fora)
+STATIC_TYPES = {
+    '.html': 'text/html',
+    '.css': 'text/css',
+    '.js': 'text/javascript',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.ico': 'image/x-icon'
+}
+STATIC_COMPRESSIBLE = ('.html', '.css', '.js', '.svg')
+# Páginas revalidam a cada carga (304 barato); logos e ícones ficam 1 dia
+STATIC_CACHE_CONTROL = {'.html': 'no-cache'}
+STATIC_DEFAULT_CACHE_CONTROL = 'public, max-age=86400'
+
+# nome -> {'mtime_ns', 'size', 'etag', 'mimetype', 'cache_control', 'bodies': {codificação: bytes}}
+static_assets = {}
+static_assets_lock = threading.Lock()
+
+def build_static_asset(name, stat):
+    """Lê o arquivo e pré-calcula ETag e as variantes gzip/brotli (só se ficarem menores)"""
+    ext = os.path.splitext(name)[1].lower()
+    with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+        data = f.read()
+    bodies = {'identity': data}
+    if ext in STATIC_COMPRESSIBLE:
+        candidates = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            candidates['br'] = brotli.compress(data, quality=11)
+        bodies.update((encoding, body) for encoding, body in candidates.items() if len(body) < len(data))
+    return {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'etag': hashlib.sha1(data).hexdigest()[:20],
+        'mimetype': STATIC_TYPES[ext],
+        'cache_control': STATIC_CACHE_CONTROL.get(ext, STATIC_DEFAULT_CACHE_CONTROL),
+        'bodies': bodies
+    }
+
+def get_static_asset(name):
+    """
+    Variantes pré-calculadas de um arquivo estático (None se não existe ou
+    não é servido). Um stat por requisição detecta arquivos editados ou
+    publicados por deploy, como no índice de frames.
+    """
+    if name != os.path.basename(name) or name.startswith('.') \
+            or os.path.splitext(name)[1].lower() not in STATIC_TYPES:
+        return None
+    try:
+        stat = os.stat(os.path.join(STATIC_DIR, name))
+    except OSError:
+        return None
+    asset = static_assets.get(name)
+    if asset is None or asset['mtime_ns'] != stat.st_mtime_ns or asset['size'] != stat.st_size:
+        with static_assets_lock:
+            asset = static_assets.get(name)
+            if asset is None or asset['mtime_ns'] != stat.st_mtime_ns or asset['size'] != stat.st_size:
+                asset = build_static_asset(name, stat)
+                static_assets[name] = asset
+    return asset
+
+def preload_static_assets():
+    """Comprime as páginas na inicialização (brotli 11 leva ~0,1 s por página)"""
+    for name in sorted(os.listdir(STATIC_DIR)):
+        if os.path.isfile(os.path.join(STATIC_DIR, name)):
+            get_static_asset(name)
+
+def static_response(name):
+    """Arquivo estático na melhor codificação aceita, com ETag por variante"""
+    asset = get_static_asset(name)
+    if asset is None:
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+    encoding = next((e for e in ('br', 'gzip') if e in asset['bodies'] and request.accept_encodings[e]),
+                    'identity')
+    response = Response(asset['bodies'][encoding], mimetype=asset['mimetype'])
+    if encoding == 'identity':
+        response.set_etag(asset['etag'])
+    else:
+        response.set_etag(f"{asset['etag']}-{encoding}")
+        response.headers['Content-Encoding'] = encoding
+    if len(asset['bodies']) > 1:
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = asset['cache_control']
+    return response.make_conditional(request)
+
+preload_static_assets()
+
 @app.route('/')
 def serve_index():
     """Serve index.html para desenvolvimento"""
-    return send_file(os.path.join(STATIC_DIR, 'index.html'))
+    return static_response('index.html')
 
 @app.route('/mosaic.html')
 def serve_mosaic():
     """Serve mosaic.html para desenvolvimento"""
-    return send_file(os.path.join(STATIC_DIR, 'mosaic.html'))
+    return static_response('mosaic.html')
 
 @app.route('/<path:filename>')
 def serve_static(filename):
     """Serve arquivos estáticos (logos, etc)"""
-    filepath = os.path.join(STATIC_DIR, filename)
-    if os.path.exists(filepath) and not '..' in filename:
-        return send_file(filepath)
-    return jsonify({'error': 'Arquivo não encontrado'}), 404
+    return static_response(filename)
 
 # ============================================
 # TRATAMENTO DE ERROS
@@ -573,5 +4955,8 @@ def internal_error(e):
 # ============================================
 
 if __name__ == '__main__':
-    # CORREÇÃO: Desabilitar debug em produção
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    if SYNC_PROCESS:
+        run_sync_process()
+    else:
+        # CORREÇÃO: Desabilitar debug em produção
+        app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,75 @@
+"""
+Fixtures compartilhadas pelos testes.
+
+server.py é importado uma vez, sobre um CACHE_DIR temporário e com o
+agendador de sync desligado; a fixture `server` esvazia o cache e o
+state.db antes de cada teste. Os servidores locais que imitam as fontes
+(AlertaRio, FTP do INEA, webhook) são os mesmos dos benchmarks.
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+os.environ['CACHE_DIR'] = tempfile.mkdtemp(prefix='radar-test-')
+os.environ['SYNC_ENABLED'] = '0'
+os.environ['FTP_PASSWORD'] = ''
+os.environ['ALERT_SINKS'] = 'log'
+
+import server as server_module  # noqa: E402
+
+# Tabelas do state.db com estado de sync, cadência, alertas e séries
+STATE_TABLES = ('state', 'freshness', 'region_stats')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def cache_dir():
+    yield server_module.CACHE_DIR
+    shutil.rmtree(server_module.CACHE_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def server():
+    """server.py com o cache vazio (frames, tiles, histórico, acumulado, nowcast e state.db)"""
+    for directory in [*server_module.RADAR_DIRS.values(), server_module.TILES_DIR, server_module.EXPORT_DIR]:
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if os.path.isfile(path):
+                os.remove(path)
+    for directory in (server_module.HISTORY_DIR, server_module.ACCUM_DIR, server_module.NOWCAST_DIR,
+                      os.path.dirname(server_module.ALERT_QUEUE_PATH)):
+        shutil.rmtree(directory, ignore_errors=True)
+    for table in STATE_TABLES:
+        server_module.state_query(f'DELETE FROM {table}')
+    for radar in server_module.RADAR_DIRS:
+        server_module.accum_states[radar] = None
+    server_module.accum_cache.clear()
+    return server_module
+
+
+def random_classes(seed, shape=(48, 64)):
+    """Raster de classes 0..6 pequeno e reproduzível"""
+    return np.random.default_rng(seed).integers(0, server_module.HISTORY_CLASSES, size=shape, dtype=np.uint8)
+
+
+def rain_png(seed, size=64):
+    """PNG RGBA pequeno com células de chuva nas cores da legenda (bytes)"""
+    data = np.zeros((size, size, 4), dtype=np.uint8)
+    rng = np.random.default_rng(seed)
+    for _ in range(6):
+        x, y = rng.integers(0, size - 8, size=2)
+        color = server_module.NOWCAST_COLORS[int(rng.integers(0, len(server_module.NOWCAST_COLORS)))]
+        data[y:y + 8, x:x + 8, :3] = color
+        data[y:y + 8, x:x + 8, 3] = 255
+    buffer = io.BytesIO()
+    Image.fromarray(data, 'RGBA').save(buffer, 'PNG')
+    return buffer.getvalue()
@@ -0,0 +1,105 @@
+"""Chuva acumulada: janelas deslizantes incrementais conferidas contra o recálculo completo"""
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from conftest import random_classes
+
+STEP = 300
+SHAPE = (48, 64)
+
+
+def frame_times(count, end=None):
+    """`count` horários a cada STEP segundos, terminando em `end` (padrão: agora)"""
+    end = end or datetime.now().replace(second=0, microsecond=0)
+    return [(end - timedelta(seconds=STEP * i)).timestamp() for i in range(count)][::-1]
+
+
+def brute_force(server, state):
+    """Recalcula cada janela do zero a partir do histórico"""
+    frames = server.read_history('mendanha', state['times'][0], state['times'][-1], payloads=True)
+    latest = float(frames[-1][0]['time'])
+    sums = {}
+    for window, seconds in server.ACCUM_WINDOWS.items():
+        total = np.zeros(SHAPE, dtype=np.int64)
+        for (record, payload), step in zip(frames, state['steps']):
+            if float(record['time']) > latest - seconds:
+                total += server.frame_rainfall(server.history_raster(record, payload), step)
+        sums[window] = total
+    return sums
+
+
+def test_incremental_windows_match_recomputation(server):
+    times = frame_times(24 * 12 + 24)
+    history, incoming = times[:-24], times[-24:]
+    for i, timestamp in enumerate(history):
+        server.append_history('mendanha', timestamp, random_classes(i, SHAPE))
+    assert server.update_accumulation('mendanha') > 0
+
+    for i, timestamp in enumerate(incoming):
+        server.append_history('mendanha', timestamp, random_classes(1000 + i, SHAPE))
+        assert server.update_accumulation('mendanha') == 1
+    assert server.update_accumulation('mendanha') == 0
+
+    state = server.load_accumulation('mendanha')
+    expected = brute_force(server, state)
+    for window in server.ACCUM_WINDOWS:
+        assert (state['sums'][window] == expected[window]).all(), window
+
+
+def test_constant_rain_fills_each_window(server):
+    level = 3
+    classes = np.full(SHAPE, level, dtype=np.uint8)
+    for timestamp in frame_times(4 * 12):
+        server.append_history('mendanha', timestamp, classes)
+    server.update_accumulation('mendanha')
+
+    state = server.load_accumulation('mendanha')
+    rate = int(server.RAIN_RATE_MM_H[level])
+    assert np.allclose(server.accumulation_mm(state, '1h'), rate)
+    assert np.allclose(server.accumulation_mm(state, '3h'), 3 * rate)
+    # Só há 4 h de frames: a janela de 24 h tem tudo (o primeiro frame vale ACCUM_DEFAULT_STEP)
+    assert np.allclose(server.accumulation_mm(state, '24h'), 4 * rate)
+
+
+def test_gap_in_the_source_is_not_rain(server):
+    classes = np.full(SHAPE, 1, dtype=np.uint8)
+    before = frame_times(3, datetime.now() - timedelta(hours=2))
+    for timestamp in before + [before[-1] + 2 * 3600]:
+        server.append_history('mendanha', timestamp, classes)
+    server.update_accumulation('mendanha')
+    assert server.load_accumulation('mendanha')['steps'][-1] == server.ACCUM_MAX_GAP
+
+
+def test_missing_state_is_rebuilt_from_history(server):
+    times = frame_times(30)
+    for i, timestamp in enumerate(times[:20]):
+        server.append_history('mendanha', timestamp, random_classes(i, SHAPE))
+    server.update_accumulation('mendanha')
+    for i, timestamp in enumerate(times[20:]):
+        server.append_history('mendanha', timestamp, random_classes(20 + i, SHAPE))
+        server.update_accumulation('mendanha')
+    incremental = {window: sums.copy() for window, sums in server.load_accumulation('mendanha')['sums'].items()}
+
+    os.remove(server.accumulation_path('mendanha'))
+    server.accum_states['mendanha'] = None
+    assert server.update_accumulation('mendanha') == len(times)
+    rebuilt = server.load_accumulation('mendanha')['sums']
+    for window in server.ACCUM_WINDOWS:
+        assert (rebuilt[window] == incremental[window]).all(), window
+
+
+def test_api_json_png_and_revalidation(server):
+    for i, timestamp in enumerate(frame_times(12)):
+        server.append_history('mendanha', timestamp, random_classes(i, SHAPE))
+    server.update_accumulation('mendanha')
+    client = server.app.test_client()
+
+    body = client.get('/api/accumulation/mendanha?window=1h').get_json()
+    assert body['frames'] == 12 and (body['width'], body['height']) == (SHAPE[1], SHAPE[0])
+
+    response = client.get('/api/accumulation/mendanha?window=3h&format=png&threshold=25')
+    assert response.status_code == 200 and response.content_type == 'image/png'
+    assert client.get('/api/accumulation/mendanha?window=3h&format=png&threshold=25',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,94 @@
+"""Regras de alerta: área pré-computada, histerese e entrega (webhook com nova tentativa, fila local)"""
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from conftest import random_classes
+from standins import WebhookStandIn
+
+SHAPE = (128, 128)
+CIRCLE = {'lat': -22.93, 'lng': -43.25, 'radius_km': 20}
+# Pixels de classe 4 na área da regra em cada frame (limiar 10)
+STORM = [0, 5, 12, 9, 11, 8, 12, 4, 3, 0, 0, 15, 2, 1]
+
+
+def load_rule(server, tmp_path, **overrides):
+    path = tmp_path / 'regras.json'
+    path.write_text(json.dumps([dict({'id': 'centro', 'circle': CIRCLE, 'min_class': 4, 'min_pixels': 10}, **overrides)]))
+    return server.load_alert_rules(str(path))
+
+
+@pytest.fixture
+def storm(server, monkeypatch):
+    """Grava a tempestade no histórico (um frame a cada 5 min) e devolve o horário inicial"""
+    monkeypatch.setitem(server.ALERT_CONFIG, 'max_catchup', 2 * 3600)
+    monkeypatch.setattr(server, 'ALERT_SINKS', [])
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=5 * len(STORM))
+    pixels = server.circle_pixels('mendanha', SHAPE, CIRCLE)
+    assert len(pixels) >= max(STORM)
+    for i, area in enumerate(STORM):
+        classes = np.zeros(SHAPE, dtype=np.uint8)
+        classes.flat[pixels[:area]] = 4
+        server.append_history('mendanha', (start + timedelta(minutes=5 * i)).timestamp(), classes)
+    return start
+
+
+def run_storm(server, monkeypatch, rules, start):
+    """Avalia a tempestade a partir do primeiro frame (como após uma parada curta do sync)"""
+    monkeypatch.setattr(server, 'ALERT_RULES', rules)
+    server.set_state('alerts:mendanha', {'last': start.timestamp() - 1, 'rules': {}})
+    return server.evaluate_alerts('mendanha')
+
+
+def test_rule_area_matches_a_full_mask(server, tmp_path):
+    rule = load_rule(server, tmp_path)[0]
+    classes = random_classes(1, SHAPE)
+    mask = np.zeros(SHAPE, dtype=bool)
+    mask.flat[server.circle_pixels('mendanha', SHAPE, CIRCLE)] = True
+    assert server.evaluate_alert_rule(rule, 'mendanha', classes) == (
+        int((mask & (classes >= 4)).sum()), int(classes[mask].max()))
+
+
+def test_without_hysteresis_every_crossing_alerts(server, monkeypatch, tmp_path, storm):
+    monkeypatch.setitem(server.ALERT_CONFIG, 'clear_frames', 1)
+    events = run_storm(server, monkeypatch, load_rule(server, tmp_path, clear_pixels=10), storm)
+    assert [e['type'] for e in events] == ['alert', 'clear'] * 4
+
+
+def test_hysteresis_holds_the_alert_while_oscillating(server, monkeypatch, tmp_path, storm):
+    events = run_storm(server, monkeypatch, load_rule(server, tmp_path), storm)
+    assert [e['type'] for e in events] == ['alert', 'clear', 'alert', 'clear']
+    assert events[0]['id'] == events[1]['id'] and events[1]['peak_area_pixels'] == 12
+    # Sem frames novos (ou após reiniciar), nada é reenviado
+    assert server.evaluate_alerts('mendanha') == []
+
+
+def test_webhook_retries_and_queue(server, monkeypatch, tmp_path, storm):
+    receiver = WebhookStandIn().start()
+    try:
+        monkeypatch.setattr(server, 'ALERT_SINKS', ['queue', 'webhook'])
+        monkeypatch.setattr(server, 'ALERT_WEBHOOK_URL', receiver.url)
+        receiver.fail_next = 1
+        events = run_storm(server, monkeypatch, load_rule(server, tmp_path), storm)
+
+        delivered = receiver.wait_for(len(events))
+        assert [(e['id'], e['type']) for e in delivered] == [(e['id'], e['type']) for e in events]
+        assert receiver.stats['failed'] == 1
+        with open(server.ALERT_QUEUE_PATH) as f:
+            assert [json.loads(line) for line in f] == events
+    finally:
+        receiver.stop()
+
+
+def test_webhook_gives_up_after_the_retries(server, monkeypatch):
+    receiver = WebhookStandIn().start()
+    try:
+        monkeypatch.setattr(server, 'ALERT_WEBHOOK_URL', receiver.url)
+        monkeypatch.setitem(server.ALERT_CONFIG, 'webhook_retries', 2)
+        receiver.fail_next = 5
+        assert not server.post_alert_webhook({'id': 'centro:mendanha:0', 'type': 'alert'})
+        assert receiver.stats['requests'] == 2 and receiver.events == []
+    finally:
+        receiver.stop()
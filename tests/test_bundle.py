@@ -0,0 +1,84 @@
+"""Bundle multipart dos frames: partes iguais às variantes em disco, WebP sem perdas, since e 304"""
+import os
+import re
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import rain_png
+
+COUNT = 20
+
+
+def parse_bundle(response):
+    """Separa as partes do multipart: [(nome, bytes)]"""
+    boundary = re.search(r'boundary=([^;]+)', response.headers['Content-Type']).group(1).encode()
+    body = response.get_data()
+    parts = []
+    pos = 0
+    while not body.startswith(b'--' + boundary + b'--', pos):
+        header_end = body.index(b'\r\n\r\n', pos)
+        header = body[pos:header_end].decode()
+        length = int(re.search(r'Content-Length: (\d+)', header).group(1))
+        name = re.search(r'filename="([^"]+)"', header).group(1)
+        start = header_end + 4
+        parts.append((name, body[start:start + length]))
+        pos = start + length + 2
+    return parts
+
+
+def write_frame(server, name, seed):
+    path = os.path.join(server.MENDANHA_DIR, name)
+    with open(path, 'wb') as f:
+        f.write(rain_png(seed, size=128))
+    server.build_rain_variant(path)
+
+
+@pytest.fixture
+def names(server):
+    """COUNT frames do Mendanha de 5 em 5 min, com a variante filter=rain"""
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=5 * COUNT)
+    names = [(start + timedelta(minutes=5 * i)).strftime('MDN-%Y%m%d-%H%M.png') for i in range(COUNT)]
+    for i, name in enumerate(names):
+        write_frame(server, name, i)
+    return names
+
+
+def variant(server, name):
+    with open(server.rain_variant_path(os.path.join(server.MENDANHA_DIR, name)), 'rb') as f:
+        return f.read()
+
+
+def test_png_bundle_is_the_rain_variants_in_order(server, names):
+    response = server.app.test_client().get('/api/frames/mendanha/bundle?filter=rain')
+    assert response.status_code == 200
+    assert parse_bundle(response) == [(name, variant(server, name)) for name in names]
+
+
+def test_lossless_webp_keeps_visible_pixels(server, names):
+    response = server.app.test_client().get('/api/frames/mendanha/bundle?filter=rain&format=webp')
+    for name, data in parse_bundle(response):
+        original = np.array(Image.open(BytesIO(variant(server, name))).convert('RGBA'))
+        decoded = np.array(Image.open(BytesIO(data)).convert('RGBA'))
+        visible = original[..., 3] > 0
+        # O RGB sob alpha 0 é descartado
+        assert (decoded[..., 3] == original[..., 3]).all() and (decoded[visible] == original[visible]).all()
+
+
+def test_revalidation_and_since(server, names):
+    client = server.app.test_client()
+    url = '/api/frames/mendanha/bundle?filter=rain&format=png&scale=0.5'
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    # Refresh após um frame novo: só ele vem
+    new_name = (datetime.strptime(names[-1], 'MDN-%Y%m%d-%H%M.png') + timedelta(minutes=5)).strftime('MDN-%Y%m%d-%H%M.png')
+    write_frame(server, new_name, 99)
+    response = client.get(f'/api/frames/mendanha/bundle?filter=rain&since={names[-1]}')
+    assert [name for name, _ in parse_bundle(response)] == [new_name]
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,105 @@
+"""Mosaico Mendanha + Sumaré: reprojeção conferida ponto a ponto e refação só dos intervalos afetados"""
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import random_classes
+
+COUNT = 6
+STEP = 5    # minutos entre frames de cada radar
+LATE = 2    # frames do Mendanha que chegam depois do Sumaré
+SHAPE = (1024, 1024)
+
+
+def source_pixel(server, radar, shape, lat, lng):
+    """
+    Pixel do frame de origem em (lat, lng), ou None fora da área ou na
+    legenda. Pontos a menos de 1e-6 pixel de uma borda são ambíguos (o
+    arredondamento decide o lado) e levantam ValueError.
+    """
+    (south, west), (north, east) = server.RADAR_BOUNDS[radar]
+    top, bottom = server.mercator_y(north), server.mercator_y(south)
+    x = (lng - west) / (east - west) * shape[1]
+    y = (top - server.mercator_y(lat)) / (top - bottom) * shape[0]
+    if min(abs(x - round(x)), abs(y - round(y))) < 1e-6:
+        raise ValueError('ponto na borda de um pixel')
+    col, row = int(np.floor(x)), int(np.floor(y))
+    legend_x, legend_y = server.LEGEND_AREA
+    if not (0 <= row < shape[0] and 0 <= col < shape[1]) or (col < legend_x and row < legend_y):
+        return None
+    return row, col
+
+
+@pytest.fixture
+def sources(server):
+    """COUNT frames por radar no histórico; o Sumaré publica 2 min depois e o Mendanha sem os LATE últimos"""
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=STEP * COUNT)
+    start -= timedelta(minutes=start.minute % STEP)
+    frames = []
+    for i in range(COUNT):
+        timestamp = (start + timedelta(minutes=STEP * i)).timestamp()
+        mendanha, sumare = random_classes(i, SHAPE), random_classes(100 + i, SHAPE)
+        server.append_history('sumare', timestamp + 120, sumare)
+        if i < COUNT - LATE:
+            server.append_history('mendanha', timestamp, mendanha)
+        frames.append((timestamp, mendanha, sumare))
+    return frames
+
+
+def add_late_frames(server, sources):
+    for timestamp, mendanha, _ in sources[COUNT - LATE:]:
+        server.append_history('mendanha', timestamp, mendanha)
+
+
+def test_late_mendanha_frames_only_redo_their_slots(server, sources):
+    assert server.update_composite() == COUNT
+    assert server.update_composite() == 0
+    add_late_frames(server, sources)
+    assert server.update_composite() == LATE
+    listed = server.get_frame_index('composite')['listed']
+    assert [entry['name'] for entry in listed] == [server.composite_frame_name(t) for t, _, _ in sources]
+
+
+def test_pixels_match_point_reprojection(server, sources):
+    add_late_frames(server, sources)
+    server.update_composite()
+    (south, west), (north, east) = server.RADAR_BOUNDS['composite']
+    top, bottom = server.mercator_y(north), server.mercator_y(south)
+    rng = np.random.default_rng(1)
+    checked = 0
+    for timestamp, mendanha, sumare in (sources[0], sources[-1]):
+        path = os.path.join(server.COMPOSITE_DIR, server.composite_frame_name(timestamp))
+        composite = np.array(Image.open(path))
+        height, width = composite.shape
+        for position in rng.integers(0, composite.size, 1500):
+            i, j = divmod(int(position), width)
+            lng = west + (j + 0.5) / width * (east - west)
+            lat = np.degrees(2 * np.arctan(np.exp(top - (i + 0.5) / height * (top - bottom))) - np.pi / 2)
+            expected = 0
+            try:
+                for radar, classes in (('mendanha', mendanha), ('sumare', sumare)):
+                    pixel = source_pixel(server, radar, classes.shape, lat, lng)
+                    if pixel is not None:
+                        expected = max(expected, int(classes[pixel]))
+            except ValueError:
+                continue
+            assert composite[i, j] == expected, (i, j)
+            checked += 1
+    assert checked > 1000
+
+
+def test_api_lists_and_serves_the_mosaic(server, sources):
+    add_late_frames(server, sources)
+    server.update_composite()
+    client = server.app.test_client()
+    response = client.get('/api/frames/composite')
+    listing = response.get_json()
+    assert response.status_code == 200 and listing['count'] == COUNT
+    assert client.get('/api/frames/composite', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    for name in listing['frames']:
+        assert client.get(f'/api/frame/composite/{name}').status_code == 200
+    assert client.get('/api/frames/composite/bundle').status_code == 200
+    assert client.get('/api/nuclei/composite').get_json()['count'] == COUNT
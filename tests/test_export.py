@@ -0,0 +1,82 @@
+"""Exportação de animações: janela padrão e from/to/step, frames e pixels de GIF/WebP/APNG"""
+import os
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from conftest import rain_png
+
+COUNT = 80
+SIZE = 128
+
+
+def decoded_frames(body):
+    return [np.asarray(frame.convert('RGB')) for frame in ImageSequence.Iterator(Image.open(BytesIO(body)))]
+
+
+def flattened(path):
+    """Frame de origem sobre fundo preto (o que a animação deve mostrar)"""
+    img = Image.open(path).convert('RGBA')
+    background = Image.new('RGB', img.size, (0, 0, 0))
+    background.paste(img, mask=img.split()[3])
+    return np.asarray(background)
+
+
+@pytest.fixture
+def names(server):
+    """COUNT frames do Mendanha de 5 em 5 min, o último no minuto atual"""
+    end = datetime.now().replace(second=0, microsecond=0)
+    names = []
+    for i in range(COUNT):
+        name = (end - timedelta(minutes=5 * (COUNT - 1 - i))).strftime('MDN-%Y%m%d-%H%M.png')
+        with open(os.path.join(server.MENDANHA_DIR, name), 'wb') as f:
+            f.write(rain_png(i, size=SIZE))
+        names.append(name)
+    return names
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    monkeypatch.setitem(server.RATE_LIMIT_MAX_REQUESTS, 'gif', 10 ** 9)
+    return server.app.test_client()
+
+
+def frame_time(name):
+    return datetime.strptime(name, 'MDN-%Y%m%d-%H%M.png').isoformat()
+
+
+@pytest.mark.parametrize('fmt', ['gif', 'webp', 'apng'])
+def test_default_window_is_the_most_recent_frames(server, client, names, fmt):
+    response = client.get(f'/api/export/mendanha?format={fmt}')
+    assert response.status_code == 200
+    frames = decoded_frames(response.get_data())
+    assert len(frames) == server.GIF_MAX_FRAMES
+    if fmt != 'gif':
+        # GIF passa pela paleta de 256 cores; os demais são sem perdas
+        assert (frames[0] == flattened(os.path.join(server.MENDANHA_DIR, names[-server.GIF_MAX_FRAMES]))).all()
+        assert (frames[-1] == flattened(os.path.join(server.MENDANHA_DIR, names[-1]))).all()
+
+
+def test_scale_and_step(server, client, names):
+    frames = decoded_frames(client.get('/api/export/mendanha?format=webp&scale=0.25&step=2').get_data())
+    assert len(frames) == server.GIF_MAX_FRAMES and frames[0].shape[:2] == (SIZE // 4, SIZE // 4)
+
+
+def test_from_to_window_and_step(server, client, names):
+    max_frames = server.EXPORT_CONFIG['max_frames']
+    url = f'/api/export/mendanha?format=webp&from={frame_time(names[-max_frames])}&to={frame_time(names[-1])}'
+    frames = decoded_frames(client.get(url).get_data())
+    assert len(frames) == max_frames
+    assert (frames[0] == flattened(os.path.join(server.MENDANHA_DIR, names[-max_frames]))).all()
+    assert len(decoded_frames(client.get(url + '&step=3').get_data())) == max_frames // 3
+
+
+def test_window_longer_than_the_limit_is_400(server, client, names):
+    max_frames = server.EXPORT_CONFIG['max_frames']
+    url = f'/api/export/mendanha?format=webp&from={frame_time(names[-max_frames - 1])}&to={frame_time(names[-1])}'
+    response = client.get(url)
+    assert response.status_code == 400 and 'step' in response.get_json()['error']
+    assert len(decoded_frames(client.get(url + '&step=2').get_data())) == (max_frames + 2) // 2
@@ -0,0 +1,80 @@
+"""Histórico compacto: gravação, compactação dos dias fechados e arquivamento antes da limpeza"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from conftest import rain_png, random_classes
+
+DAYS = 3
+HOURS = (1, 7, 13, 19)
+
+
+def write_days(server):
+    """Quatro frames por dia nos últimos DAYS dias; retorna [(horário, classes)]"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    frames = []
+    for day in range(DAYS):
+        for hour in HOURS:
+            timestamp = (today - timedelta(days=DAYS - 1 - day, hours=-hour)).timestamp()
+            classes = random_classes(len(frames))
+            assert server.append_history('mendanha', timestamp, classes)
+            frames.append((timestamp, classes))
+    return frames
+
+
+def read_rasters(server, frames):
+    stored = server.read_history('mendanha', frames[0][0], frames[-1][0], payloads=True)
+    return [(float(record['time']), server.history_raster(record, payload)) for record, payload in stored]
+
+
+def test_duplicate_timestamp_is_ignored(server):
+    frames = write_days(server)
+    assert not server.append_history('mendanha', frames[0][0], frames[1][1])
+    assert len(server.read_history('mendanha', frames[0][0], frames[-1][0])) == len(frames)
+
+
+def test_compaction_round_trip(server, monkeypatch):
+    frames = write_days(server)
+    before = read_rasters(server, frames)
+
+    monkeypatch.setitem(server.HISTORY_CONFIG, 'compact_after_hours', 0)
+    assert server.compact_history() == {'compacted': DAYS - 1, 'removed': 0}
+    directory = os.path.join(server.HISTORY_DIR, 'mendanha')
+    assert len([f for f in os.listdir(directory) if f.endswith('.hist')]) == DAYS - 1
+    assert len([f for f in os.listdir(directory) if f.endswith('.live')]) == 1  # o dia atual continua vivo
+
+    after = read_rasters(server, frames)
+    assert [t for t, _ in after] == [t for t, _ in frames]
+    for (_, expected), (_, raster), (_, raster_before) in zip(frames, after, before):
+        assert (raster == expected).all() and (raster_before == expected).all()
+    # Dias compactados não voltam a ser compactados
+    assert server.compact_history()['compacted'] == 0
+
+
+def test_summary_counts_come_from_the_index(server):
+    frames = write_days(server)
+    start = datetime.fromtimestamp(frames[0][0]).isoformat()
+    end = datetime.fromtimestamp(frames[-1][0]).isoformat()
+    body = server.app.test_client().get(f'/api/history/mendanha?from={start}&to={end}').get_json()
+    assert body['count'] == len(frames)
+    for summary, (_, classes) in zip(body['frames'], frames):
+        assert summary['class_counts'] == np.bincount(classes.ravel(), minlength=server.HISTORY_CLASSES).tolist()
+        assert summary['max_class'] == int(classes.max())
+
+
+def test_old_frames_are_archived_before_cleanup(server):
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(days=5)
+    names = [(start + timedelta(minutes=5 * i)).strftime('MDN-%Y%m%d-%H%M.png') for i in range(3)]
+    past = time.time() - 30 * 3600
+    for i, name in enumerate(names):
+        path = os.path.join(server.MENDANHA_DIR, name)
+        with open(path, 'wb') as f:
+            f.write(rain_png(i))
+        os.utime(path, (past, past))
+
+    server.archive_old_frames('mendanha', server.MAX_HOURS)
+    assert not any(os.path.exists(os.path.join(server.MENDANHA_DIR, name)) for name in names)
+    archived = server.read_history('mendanha', start.timestamp(), (start + timedelta(hours=1)).timestamp())
+    assert len(archived) == len(names)
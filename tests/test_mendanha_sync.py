@@ -0,0 +1,95 @@
+"""Sync do Mendanha contra um FTP local: sessão persistente, delta da listagem, retomada e backoff"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import rain_png
+from standins import FTPStandIn
+
+START = datetime.now().replace(second=0, microsecond=0) - timedelta(hours=3)
+NAMES = [(START + timedelta(minutes=5 * i)).strftime('MDN-%Y%m%d-%H%M.png') for i in range(30)]
+
+
+@pytest.fixture
+def inea(server, monkeypatch):
+    files = {name: rain_png(i) for i, name in enumerate(NAMES)}
+    # Diretório do INEA também tem arquivos que não são frames
+    files.update({f'log-{i:04d}.txt': b'x' for i in range(50)})
+    standin = FTPStandIn(files).start()
+    for key, value in (('host', '127.0.0.1'), ('port', standin.port), ('user', 'inea'), ('password', 'secret')):
+        monkeypatch.setitem(server.FTP_CONFIG, key, value)
+    server.close_ftp_connection()
+    server.ftp_state.update({'failures': 0, 'next_attempt': 0.0, 'mlsd': None,
+                             'known': set(), 'recent': [], 'sizes': {}})
+    yield standin
+    server.close_ftp_connection()
+    standin.stop()
+
+
+def local_frames(server):
+    return sorted(f for f in os.listdir(server.MENDANHA_DIR) if f.endswith('.png'))
+
+
+def test_first_sync_downloads_the_20_most_recent(server, inea):
+    server.sync_mendanha()
+    assert local_frames(server) == NAMES[-20:]
+    assert inea.stats['connections'] == 1
+
+
+def test_unchanged_sync_reuses_the_session(server, inea):
+    server.sync_mendanha()
+    inea.reset_stats()
+    server.sync_mendanha()
+    assert inea.stats['connections'] == 0 and inea.stats['retr'] == 0
+
+
+def test_dropped_session_reconnects(server, inea):
+    server.sync_mendanha()
+    new_name = (START + timedelta(minutes=5 * len(NAMES))).strftime('MDN-%Y%m%d-%H%M.png')
+    inea.files[new_name] = rain_png(100)
+    inea.drop_sessions()
+    time.sleep(0.1)
+    inea.reset_stats()
+
+    server.sync_mendanha()
+    assert inea.stats['connections'] == 1
+    assert new_name in local_frames(server)
+
+
+def test_interrupted_download_is_resumed(server, inea):
+    server.sync_mendanha()
+    partial_name = (START + timedelta(minutes=5 * len(NAMES))).strftime('MDN-%Y%m%d-%H%M.png')
+    content = rain_png(101)
+    inea.files[partial_name] = content
+    inea.truncate_next[partial_name] = len(content) // 3
+
+    server.sync_mendanha()
+    assert partial_name not in local_frames(server)
+    assert os.path.exists(os.path.join(server.MENDANHA_DIR, partial_name + '.part'))
+
+    inea.reset_stats()
+    server.sync_mendanha()
+    with open(os.path.join(server.MENDANHA_DIR, partial_name), 'rb') as f:
+        assert f.read() == content
+    assert inea.stats['rest'] == 1
+    assert inea.stats['bytes'] == len(content) - len(content) // 3
+
+
+def test_server_down_backs_off(server, inea):
+    server.sync_mendanha()
+    inea.down = True
+    inea.drop_sessions()
+    time.sleep(0.1)
+    server.sync_mendanha()
+    assert server.ftp_state['next_attempt'] > time.time()
+
+    inea.reset_stats()
+    server.sync_mendanha()  # dentro da janela de backoff: nem tenta conectar
+    assert inea.stats['connections'] == 0
+
+    inea.down = False
+    server.ftp_state['next_attempt'] = 0.0
+    server.sync_mendanha()
+    assert server.ftp_state['conn'] is not None and server.ftp_state['failures'] == 0
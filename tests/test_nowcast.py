@@ -0,0 +1,91 @@
+"""Nowcast +10/+20/+30 min: previsão melhor que a persistência e cache das URLs versionadas"""
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+STEP = 5        # minutos entre frames
+OBSERVED = 7    # frames no histórico quando a previsão é gerada
+SHAPE = (1024, 1024)
+
+
+def storm(step):
+    """
+    Raster de classes com células de chuva (anéis de intensidade crescente
+    para o centro) que andam 6 px para leste e 3 px para norte por frame
+    """
+    rng = np.random.default_rng(3)
+    ys, xs = np.mgrid[0:SHAPE[0], 0:SHAPE[1]]
+    classes = np.zeros(SHAPE, dtype=np.uint8)
+    for _ in range(14):
+        cy, cx = rng.uniform(300, 850, size=2)
+        radius, peak = rng.uniform(30, 90), rng.integers(3, 7)
+        distance = np.hypot(ys - (cy - 3 * step), xs - (cx + 6 * step)) / radius
+        np.maximum(classes, np.clip(np.ceil(peak * (1 - distance)), 0, 6).astype(np.uint8), out=classes)
+    return classes
+
+
+def csi(forecast, truth, threshold):
+    """Acertos / (acertos + falsos alarmes + perdas)"""
+    hit = np.count_nonzero((forecast >= threshold) & (truth >= threshold))
+    false_alarm = np.count_nonzero((forecast >= threshold) & (truth < threshold))
+    miss = np.count_nonzero((forecast < threshold) & (truth >= threshold))
+    return hit / max(hit + false_alarm + miss, 1)
+
+
+@pytest.fixture
+def nowcast(server):
+    """OBSERVED frames no histórico e a previsão gerada a partir deles"""
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=STEP * (OBSERVED - 1))
+    for i in range(OBSERVED):
+        server.append_history('mendanha', (start + timedelta(minutes=STEP * i)).timestamp(), storm(i))
+    return server.update_nowcast('mendanha')
+
+
+def test_forecast_beats_persistence(server, nowcast):
+    assert nowcast is not None and len(nowcast['frames']) == len(server.NOWCAST_LEADS)
+    assert server.update_nowcast('mendanha')['base'] == nowcast['base']
+    latest = storm(OBSERVED - 1)
+    for lead, name in zip(server.NOWCAST_LEADS, nowcast['frames']):
+        truth = storm(OBSERVED - 1 + lead // STEP)
+        response = server.app.test_client().get(f'/api/nowcast/mendanha/{name}')
+        forecast = server.classify_frame(Image.open(BytesIO(response.get_data())))[0]
+        for threshold in (1, 3):
+            assert csi(forecast, truth, threshold) > csi(latest, truth, threshold), (lead, threshold)
+
+
+def test_served_png_has_the_forecast_classes(server, nowcast):
+    latest = storm(OBSERVED - 1)
+    # Mesma cadeia do update_nowcast: os últimos pairs + 1 frames
+    rasters = [storm(i) for i in range(OBSERVED - server.NOWCAST_CONFIG['pairs'] - 1, OBSERVED)]
+    vy, vx, weight = server.estimate_motion([server.coarse_field(raster) for raster in rasters])
+    smooth_y, smooth_x = server.smooth_motion(vy, vx, weight)
+    factor = server.NOWCAST_CONFIG['scale'] / (STEP * 60)
+    expected = server.advect(latest, smooth_y * factor, smooth_x * factor, [lead * 60 for lead in server.NOWCAST_LEADS])
+    client = server.app.test_client()
+    for name, forecast in zip(nowcast['frames'], expected):
+        served = client.get(f'/api/nowcast/mendanha/{name}').get_data()
+        assert (server.classify_frame(Image.open(BytesIO(served)))[0] == forecast).mean() > 0.999
+
+
+def test_only_the_versioned_url_is_immutable(server, nowcast):
+    client = server.app.test_client()
+    response = client.get('/api/frames/mendanha/nowcast')
+    listing = response.get_json()
+    assert response.status_code == 200 and listing['frames'] == nowcast['frames']
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/api/frames/mendanha/nowcast',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    name = listing['frames'][0]
+    versioned = client.get(f"/api/nowcast/mendanha/{name}?v={listing['versions'][name]}")
+    assert versioned.status_code == 200
+    assert versioned.headers['Cache-Control'] == server.FRAME_IMMUTABLE_CACHE_CONTROL
+    for url in (f'/api/nowcast/mendanha/{name}', f'/api/nowcast/mendanha/{name}?v=0000000000'):
+        assert client.get(url).headers['Cache-Control'] == server.NOWCAST_CACHE_CONTROL
+
+
+def test_listing_before_the_first_forecast_is_404(server):
+    assert server.app.test_client().get('/api/frames/mendanha/nowcast').status_code == 404
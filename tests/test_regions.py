@@ -0,0 +1,79 @@
+"""Chuva por região: bincount único conferido contra uma máscara por região e série no state.db"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from conftest import random_classes
+
+STEP = 300
+FRAMES = 12
+SHAPE = (512, 512)
+
+
+def per_region_masks(labels, classes, count):
+    """Forma direta: uma máscara do tamanho do frame por região"""
+    counts = np.zeros((count, 7), dtype=np.uint32)
+    for region_id in range(1, count + 1):
+        counts[region_id - 1] = np.bincount(classes[labels == region_id], minlength=7)
+    return counts
+
+
+@pytest.fixture
+def grid(server, monkeypatch, tmp_path):
+    """Grade de 4 x 6 retângulos sobre o município do Rio no lugar das regiões incluídas"""
+    south, north, west, east = -23.08, -22.75, -43.80, -43.10
+    rows, cols = 4, 6
+    features = []
+    for i in range(rows):
+        for j in range(cols):
+            lat0, lat1 = south + (north - south) * i / rows, south + (north - south) * (i + 1) / rows
+            lng0, lng1 = west + (east - west) * j / cols, west + (east - west) * (j + 1) / cols
+            ring = [[lng0, lat0], [lng1, lat0], [lng1, lat1], [lng0, lat1], [lng0, lat0]]
+            features.append({'type': 'Feature', 'properties': {'nome': f'R{i}-{j}'},
+                             'geometry': {'type': 'Polygon', 'coordinates': [ring]}})
+    path = os.path.join(tmp_path, 'grade.geojson')
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+    monkeypatch.setattr(server, 'REGIONS', server.load_regions(path))
+    server.region_rasters.clear()
+    yield server.REGIONS
+    server.region_rasters.clear()
+
+
+@pytest.mark.parametrize('regions', ['included', 'grid'])
+def test_histogram_matches_one_mask_per_region(server, regions, request):
+    if regions == 'grid':
+        request.getfixturevalue('grid')
+    count = len(server.REGIONS['regions'])
+    labels = server.rasterize_regions('mendanha', *SHAPE)
+    for seed in range(3):
+        classes = random_classes(seed, SHAPE)
+        assert (server.region_histogram('mendanha', classes) == per_region_masks(labels, classes, count)).all()
+
+
+def test_sync_counts_only_new_frames_and_api_serves_them(server, grid):
+    now = datetime.now().replace(second=0, microsecond=0)
+    times = [(now - timedelta(seconds=STEP * i)).timestamp() for i in range(FRAMES)][::-1]
+    for i, timestamp in enumerate(times[:-1]):
+        server.append_history('mendanha', timestamp, random_classes(i, SHAPE))
+    assert server.update_region_stats('mendanha') == FRAMES - 1
+    latest = random_classes(100, SHAPE)
+    server.append_history('mendanha', times[-1], latest)
+    assert server.update_region_stats('mendanha') == 1
+    assert server.update_region_stats('mendanha') == 0
+
+    client = server.app.test_client()
+    response = client.get('/api/regions/mendanha?region=R2-3&hours=6')
+    assert response.status_code == 200
+    region = response.get_json()['regions'][0]
+    assert len(region['series']['coverage']) == FRAMES
+    expected = per_region_masks(server.rasterize_regions('mendanha', *SHAPE), latest,
+                                len(grid['regions']))[region['id'] - 1]
+    assert region['coverage'] == round(1 - expected[0] / expected.sum(), 3)
+    assert region['max_class'] == 6
+    assert client.get('/api/regions/mendanha?region=R2-3&hours=6',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/api/regions/mendanha?region=nenhuma').status_code == 404
@@ -0,0 +1,74 @@
+"""Sync do Sumaré contra um AlertaRio local: GET condicional, gravação atômica e arquivamento"""
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from conftest import rain_png
+from standins import AlertaRioStandIn
+
+NAMES = [f'radar{i:03d}.png' for i in range(1, 21)]
+
+
+@pytest.fixture
+def alertario(server, monkeypatch):
+    standin = AlertaRioStandIn({name: rain_png(i) for i, name in enumerate(NAMES)}).start()
+    monkeypatch.setitem(server.SUMARE_CONFIG, 'base_url', standin.base_url)
+    yield standin
+    standin.stop()
+
+
+def sync_stats(server):
+    server.sync_sumare()
+    return dict(server.get_sync_state('sumare')['stats'])
+
+
+def test_first_sync_downloads_every_slot(server, alertario):
+    stats = sync_stats(server)
+    assert stats['updated'] == 20 and stats['error'] == 0
+    assert sorted(f for f in os.listdir(server.SUMARE_DIR) if f.endswith('.png')) == NAMES
+
+
+def test_unchanged_sync_only_revalidates(server, alertario):
+    sync_stats(server)
+    mtimes = {name: os.stat(os.path.join(server.SUMARE_DIR, name)).st_mtime_ns for name in NAMES}
+    alertario.reset_stats()
+
+    stats = sync_stats(server)
+    assert stats['not_modified'] == 20 and stats['bytes'] == 0
+    assert alertario.stats['connections'] == 0, 'conexões deveriam ser reaproveitadas'
+    assert {name: os.stat(os.path.join(server.SUMARE_DIR, name)).st_mtime_ns for name in NAMES} == mtimes
+
+
+def test_changed_slot_is_the_only_download(server, alertario):
+    sync_stats(server)
+    alertario.set_frame('radar020.png', rain_png(100))
+
+    stats = sync_stats(server)
+    assert stats['updated'] == 1 and stats['not_modified'] == 19
+    with open(os.path.join(server.SUMARE_DIR, 'radar020.png'), 'rb') as f:
+        assert f.read() == rain_png(100)
+    assert not [f for f in os.listdir(server.SUMARE_DIR) if f.endswith('.tmp')]
+
+
+def test_every_new_slot_is_archived_in_time_order(server, alertario):
+    sync_stats(server)
+    archived = server.read_history('sumare', time.time() - 86400, time.time() + 3600)
+    assert len(archived) == len(NAMES)
+    last = float(archived[-1][0]['time'])
+
+    # Três publicações perdidas: a janela andou três slots de uma vez
+    time.sleep(1.1)  # Last-Modified tem resolução de segundos
+    contents = [rain_png(i) for i in range(3, len(NAMES))] + [rain_png(200 + i) for i in range(3)]
+    for name, content in zip(NAMES, contents):
+        alertario.set_frame(name, content)
+    sync_stats(server)
+
+    new = [record for record, _ in server.read_history('sumare', last + 0.001, time.time() + 3600, payloads=True)]
+    times = [float(record['time']) for record in new]
+    assert len(new) == 3 and times == sorted(times) and len(set(times)) == 3
+    with open(os.path.join(server.SUMARE_DIR, NAMES[-1]), 'rb') as f:
+        newest, _ = server.classify_frame(Image.open(f), filtered=False)
+    stored = server.read_history('sumare', times[-1], times[-1], payloads=True)[0]
+    assert (server.history_raster(*stored) == newest).all()
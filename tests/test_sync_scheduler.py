@@ -0,0 +1,58 @@
+"""Agendador de sync: locks de arquivo sem bloquear o worker e sync manual 202/409"""
+import fcntl
+import os
+import threading
+import time
+
+import pytest
+
+NAME = 'sumare'
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    monkeypatch.setitem(server.RATE_LIMIT_MAX_REQUESTS, 'sync', 10 ** 9)
+    client = server.app.test_client()
+    client.environ_base['HTTP_X_ADMIN_TOKEN'] = server.ADMIN_TOKEN
+    return client
+
+
+@pytest.fixture
+def job_lock(server):
+    """Lock do job segurado como se outro processo estivesse no meio do sync"""
+    with open(os.path.join(server.CACHE_DIR, f'sync-{NAME}.lock'), 'a+') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield lock_file
+
+
+def test_flock_exclusive_waits_without_blocking(server, job_lock):
+    threading.Timer(0.2, fcntl.flock, (job_lock, fcntl.LOCK_UN)).start()
+    t0 = time.monotonic()
+    with open(job_lock.name, 'a+') as lock_file:
+        server.flock_exclusive(lock_file)
+        assert time.monotonic() - t0 >= 0.2
+        assert server.sync_in_progress(NAME)
+
+
+def test_manual_sync_while_running_is_409(server, client, job_lock):
+    response = client.get(f'/api/sync/{NAME}')
+    assert response.status_code == 409
+    assert server.get_state(f'sync-request:{NAME}') is None
+
+
+def test_manual_sync_is_handed_to_the_sync_process(server, client, monkeypatch):
+    monkeypatch.setattr(server, 'SYNC_ENABLED', True)
+    monkeypatch.setattr(server, 'SYNC_REQUEST_POLL', 0.05)
+    started = time.time()
+    response = client.get(f'/api/sync/{NAME}')
+    assert response.status_code == 202
+    assert server.get_state(f'sync-request:{NAME}') >= started
+
+    # Pedido antigo não antecipa; um novo acorda o job dentro de SYNC_REQUEST_POLL
+    t0 = time.monotonic()
+    server.wait_next_sync(NAME, time.time(), 0.3)
+    assert time.monotonic() - t0 >= 0.3
+    threading.Timer(0.1, client.get, (f'/api/sync/{NAME}',)).start()
+    t0 = time.monotonic()
+    server.wait_next_sync(NAME, time.time(), 30)
+    assert time.monotonic() - t0 < 1
@@ -0,0 +1,79 @@
+"""Tiles XYZ: pirâmide cortada no sync (frames antigos na primeira requisição), pixels e vazios como 204"""
+import math
+import os
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import rain_png
+
+NAME = 'radar020.png'
+
+
+@pytest.fixture
+def frame(server):
+    with open(os.path.join(server.SUMARE_DIR, NAME), 'wb') as f:
+        f.write(rain_png(1, size=256))
+    return server.get_frame_index('sumare')['by_name'][NAME]
+
+
+def test_sync_cuts_listed_frames_once(server, frame):
+    path = server.tile_pack_path('sumare', frame['sha1'])
+    assert server.update_tiles('sumare') == 1 and os.path.exists(path)
+    assert server.update_tiles('sumare') == 0
+
+    with Image.open(os.path.join(server.SUMARE_DIR, NAME)) as img:
+        z, x, y, data = server.cut_tiles('sumare', img)[0]
+    mtime = os.stat(path).st_mtime_ns
+    response = server.app.test_client().get(f'/api/tiles/sumare/{NAME}/{z}/{x}/{y}.png')
+    assert response.status_code == 200 and response.get_data() == data
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_frame_not_cut_yet_is_cut_on_first_request(server, frame):
+    path = server.tile_pack_path('sumare', frame['sha1'])
+    assert not os.path.exists(path)
+    client = server.app.test_client()
+    assert client.get(f'/api/tiles/sumare/{NAME}/8/0/0.png').status_code == 204
+    assert os.path.exists(path)
+
+
+def test_tile_pixels_match_the_source(server, frame):
+    """Centro de cada pixel do tile -> longitude/latitude (projeção inversa) -> pixel da origem"""
+    server.update_tiles('sumare')
+    (south, west), (north, east) = server.RADAR_BOUNDS['sumare']
+    source = np.asarray(Image.open(os.path.join(server.SUMARE_DIR, NAME)).convert('RGBA'))
+    height, width = source.shape[:2]
+    top, bottom = server.mercator_y(north), server.mercator_y(south)
+    client = server.app.test_client()
+    rng = np.random.default_rng(1)
+    tiles = {}
+    checked = 0
+    for _ in range(1000):
+        zoom = int(rng.integers(server.TILE_CONFIG['min_zoom'], server.TILE_CONFIG['max_zoom'] + 1))
+        lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+        world = 256 * 2 ** zoom
+        gx = int((lng + 180) / 360 * world)
+        gy = int((1 - math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) / math.pi) / 2 * world)
+        key = (zoom, gx // 256, gy // 256)
+        if key not in tiles:
+            response = client.get(f'/api/tiles/sumare/{NAME}/{key[0]}/{key[1]}/{key[2]}.png')
+            tiles[key] = None if response.status_code == 204 else np.asarray(Image.open(BytesIO(response.get_data())))
+        col = math.floor(((gx + 0.5) / world * 360 - 180 - west) / (east - west) * width)
+        row = math.floor((top - math.pi * (1 - 2 * (gy + 0.5) / world)) / (top - bottom) * height)
+        if not (0 <= col < width and 0 <= row < height):
+            continue
+        expected = source[row, col]
+        actual = np.zeros(4, dtype=np.uint8) if tiles[key] is None else tiles[key][gy % 256, gx % 256]
+        # RGB sob alpha 0 não importa
+        assert np.array_equal(expected, actual) or not (expected[3] or actual[3]), (key, gx, gy)
+        checked += 1
+    assert checked > 500
+
+
+def test_zoom_outside_the_pyramid(server, frame):
+    client = server.app.test_client()
+    assert client.get(f"/api/tiles/sumare/{NAME}/{server.TILE_CONFIG['max_zoom'] + 1}/0/0.png").status_code == 404
+    assert not os.path.exists(server.tile_pack_path('sumare', frame['sha1']))